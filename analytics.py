@@ -0,0 +1,486 @@
+import argparse
+import json
+import os
+import sys
+from functions.database import Database
+from functions.levels import PLAYER_CURVE, LIFE_SKILL_CURVE, CHILD_SKILL_CURVE
+from functions.levels import CHILD_LEVEL_COINS, LIFE_LEVEL_COINS, PLAYER_LEVEL_COINS
+from functions.quest_catalog import QUEST_TYPES
+from functions.simulator import read_skills
+
+# Analytics over completion history, away from the live tables. Completions
+# are exported into a directory of append-only column files, one row per
+# completion, and reports are vectorized NumPy group-bys over the columns
+# memory-mapped:
+#   player.bin       uint32  index into players.jsonl (names)
+#   quest.bin        uint32  index into quests.jsonl ([quest_type, quest_id])
+#   timestamp.bin    int64   completion_date, microseconds since 1970
+#   child_skill.bin  int32   the quest's child skill at export (0 if unknown)
+#   exp.bin          int32   the quest's EXP reward at export
+#   coins.bin        int32   the quest's coin reward at export
+# meta.json holds the row and dictionary counts and the watermark; it is
+# replaced last, so a crash mid-export leaves data past its counts that the
+# next open cuts off.
+#
+# The first export copies every completed player_quests row, archived ones
+# included, and starts analytics_completion_log: a trigger appends every
+# later completion to it under an increasing seq. Later exports read the log
+# past the watermark (the last seq exported) and then delete what they
+# exported, so the log only holds completions not exported yet. player_quests
+# rowids cannot serve as the watermark: INSERT OR REPLACE and the daily
+# rollover let SQLite reuse them. One export directory per database.
+#
+# Reports cover quest completions: EXP from update_skill_exp alone is not
+# in the history. Level-up coins are derived from the EXP reached, as
+# Database._apply_skill_exp pays them.
+#
+# Run from the project root:
+#   python -m functions.analytics export --db liferpg.db --dir analytics
+#   python -m functions.analytics report --dir analytics --report levels --curve life_skill
+
+COLUMNS = {
+    'player': 'uint32',
+    'quest': 'uint32',
+    'timestamp': 'int64',
+    'child_skill': 'int32',
+    'exp': 'int32',
+    'coins': 'int32',
+}
+CURVES = {'player': PLAYER_CURVE, 'life_skill': LIFE_SKILL_CURVE, 'child_skill': CHILD_SKILL_CURVE}
+REPORTS = ('exp', 'quest_types', 'coins', 'levels')
+
+_MICROSECONDS_PER_DAY = 86400 * 1000000
+
+
+def start_completion_log(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_completion_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            player_name TEXT NOT NULL,
+            quest_type TEXT NOT NULL,
+            quest_id INTEGER NOT NULL,
+            completion_date TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS analytics_completion_log_insert AFTER INSERT ON player_quests
+        WHEN NEW.completed = 1 AND NEW.completion_date IS NOT NULL
+        BEGIN
+            INSERT INTO analytics_completion_log (player_name, quest_type, quest_id, completion_date)
+            VALUES (NEW.player_name, NEW.quest_type, NEW.quest_id, NEW.completion_date);
+        END
+    ''')
+
+
+def stop_completion_log(db):
+    # For a database no longer exported; the next export starts over
+    with db.pool.write() as conn:
+        conn.execute('DROP TRIGGER IF EXISTS analytics_completion_log_insert')
+        conn.execute('DROP TABLE IF EXISTS analytics_completion_log')
+
+
+class ColumnStore:
+    # An export directory. Only a writable store (the exporter) cuts off
+    # data past meta.json's counts; readers never look past them, so
+    # reports can run while an export appends.
+    def __init__(self, directory, writable=False):
+        self.directory = directory
+        self.writable = writable
+        meta_path = self._path('meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        elif writable:
+            os.makedirs(directory, exist_ok=True)
+            self.meta = {'rows': 0, 'watermark': None, 'players': 0, 'quests': 0, 'child_skills': {}}
+        else:
+            raise ValueError(f"No analytics export in {directory}")
+        self.players = self._read_dictionary('players.jsonl', self.meta['players'])
+        self.quests = [tuple(quest) for quest in self._read_dictionary('quests.jsonl', self.meta['quests'])]
+        self.player_codes = {name: code for code, name in enumerate(self.players)}
+        self.quest_codes = {quest: code for code, quest in enumerate(self.quests)}
+        if writable:
+            for name, dtype in COLUMNS.items():
+                self._truncate(f'{name}.bin', self.meta['rows'] * _itemsize(dtype))
+
+    @property
+    def rows(self):
+        return self.meta['rows']
+
+    @property
+    def watermark(self):
+        return self.meta['watermark']
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_dictionary(self, name, count):
+        # The first count entries, cutting off any written past them
+        path = self._path(name)
+        if not os.path.exists(path):
+            if count:
+                raise ValueError(f"Missing {path}")
+            return []
+        with open(path) as f:
+            lines = [f.readline() for _ in range(count)]
+            size = f.tell()
+        if self.writable:
+            self._truncate(name, size)
+        return [json.loads(line) for line in lines]
+
+    def _truncate(self, name, size):
+        path = self._path(name)
+        if not os.path.exists(path):
+            open(path, 'wb').close()
+        if os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+    def reset(self):
+        self.meta = {'rows': 0, 'watermark': None, 'players': 0, 'quests': 0, 'child_skills': {}}
+        self.players, self.quests, self.player_codes, self.quest_codes = [], [], {}, {}
+        self._write_meta()
+        for name in ('players.jsonl', 'quests.jsonl', *(f'{column}.bin' for column in COLUMNS)):
+            self._truncate(name, 0)
+
+    def append(self, rows, watermark, child_skills):
+        # rows: (player_name, quest_type, quest_id, completion_date,
+        # child_skill_id, exp, coins) tuples
+        import numpy as np
+
+        new_players, new_quests = [], []
+        player_codes, quest_codes = [], []
+        for row in rows:
+            code = self.player_codes.get(row[0])
+            if code is None:
+                code = self.player_codes[row[0]] = len(self.players)
+                self.players.append(row[0])
+                new_players.append(row[0])
+            player_codes.append(code)
+            quest = (row[1], row[2])
+            code = self.quest_codes.get(quest)
+            if code is None:
+                code = self.quest_codes[quest] = len(self.quests)
+                self.quests.append(quest)
+                new_quests.append(quest)
+            quest_codes.append(code)
+        columns = {
+            'player': np.array(player_codes, dtype=COLUMNS['player']),
+            'quest': np.array(quest_codes, dtype=COLUMNS['quest']),
+            'timestamp': np.array([row[3] for row in rows], dtype='datetime64[us]').astype(COLUMNS['timestamp']),
+            'child_skill': np.array([row[4] for row in rows], dtype=COLUMNS['child_skill']),
+            'exp': np.array([row[5] for row in rows], dtype=COLUMNS['exp']),
+            'coins': np.array([row[6] for row in rows], dtype=COLUMNS['coins']),
+        }
+        self._append_lines('players.jsonl', new_players)
+        self._append_lines('quests.jsonl', [list(quest) for quest in new_quests])
+        for name, values in columns.items():
+            with open(self._path(f'{name}.bin'), 'ab') as f:
+                f.write(values.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.meta = {'rows': self.rows + len(rows), 'watermark': watermark, 'players': len(self.players),
+                     'quests': len(self.quests), 'child_skills': child_skills}
+        self._write_meta()
+
+    def set_watermark(self, watermark):
+        self.meta['watermark'] = watermark
+        self._write_meta()
+
+    def _append_lines(self, name, values):
+        with open(self._path(name), 'a') as f:
+            f.writelines(json.dumps(value) + '\n' for value in values)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_meta(self):
+        path = self._path('meta.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def column(self, name):
+        # Read-only memory map of one column
+        import numpy as np
+
+        if self.rows == 0:
+            return np.empty(0, dtype=COLUMNS[name])
+        return np.memmap(self._path(f'{name}.bin'), dtype=COLUMNS[name], mode='r', shape=(self.rows,))
+
+    def life_skill_of(self):
+        # Array mapping child skill id to life skill id (0 where unknown)
+        import numpy as np
+
+        child_skills = {int(child): life for child, life in self.meta['child_skills'].items()}
+        lookup = np.zeros(max(child_skills, default=0) + 1, dtype=np.int64)
+        for child, life in child_skills.items():
+            lookup[child] = life
+        return lookup
+
+
+REWARDS_JOIN = '''
+    LEFT JOIN quest_rewards qr ON qr.quest_type = c.quest_type AND qr.quest_id = c.quest_id
+'''
+
+
+def export_completions(db, directory, chunk_size=100000):
+    # Appends the completions made since the last export; returns a summary
+    store = ColumnStore(directory, writable=True)
+    with db.pool.read() as conn:
+        child_skills = {child: life for child, life in read_skills(conn)[0]}
+        has_log = conn.execute('''
+            SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_completion_log'
+        ''').fetchone() is not None
+    summary = {'exported': 0, 'initial': store.watermark is None}
+    if store.watermark is None:
+        _export_snapshot(db, store, child_skills, chunk_size, summary)
+    elif not has_log:
+        raise ValueError(f"{directory} was exported from a database without a completion log")
+    while True:
+        with db.pool.read() as conn:
+            rows = conn.execute(f'''
+                SELECT c.seq, c.player_name, c.quest_type, c.quest_id, c.completion_date,
+                       COALESCE(qr.child_skill_id, 0), COALESCE(qr.exp_reward, 0), COALESCE(qr.coin_reward, 0)
+                FROM analytics_completion_log c {REWARDS_JOIN}
+                WHERE c.seq > ?
+                ORDER BY c.seq LIMIT ?
+            ''', (store.watermark, chunk_size)).fetchall()
+        if rows:
+            store.append([row[1:] for row in rows], rows[-1][0], child_skills)
+            summary['exported'] += len(rows)
+        # Drained only once the columns holding them are written
+        with db.pool.write() as conn:
+            conn.execute('DELETE FROM analytics_completion_log WHERE seq <= ?', (store.watermark,))
+        if len(rows) < chunk_size:
+            break
+    summary['rows'] = store.rows
+    summary['watermark'] = store.watermark
+    return summary
+
+
+def _export_snapshot(db, store, child_skills, chunk_size, summary):
+    # Every completion so far, and the log started for the ones after it.
+    # The log's last seq is read in the same snapshot, so a completion is
+    # either in the snapshot or past the watermark, never both.
+    store.reset()
+    with db.pool.write() as conn:
+        start_completion_log(conn)
+    with db.pool.snapshot() as conn:
+        watermark = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM analytics_completion_log').fetchone()[0]
+        tables = ['player_quests'] + [row[0] for row in conn.execute('SELECT table_name FROM player_quest_archives ORDER BY month')]
+        for table in tables:
+            cursor = conn.execute(f'''
+                SELECT c.player_name, c.quest_type, c.quest_id, c.completion_date,
+                       COALESCE(qr.child_skill_id, 0), COALESCE(qr.exp_reward, 0), COALESCE(qr.coin_reward, 0)
+                FROM {table} c {REWARDS_JOIN}
+                WHERE c.completed = 1 AND c.completion_date IS NOT NULL
+            ''')
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                # The watermark stays unset until the snapshot is complete:
+                # an interrupted first export starts over
+                store.append(rows, None, child_skills)
+                summary['exported'] += len(rows)
+    store.set_watermark(watermark)
+
+
+def _itemsize(dtype):
+    return {'uint32': 4, 'int32': 4, 'int64': 8}[dtype]
+
+
+# Reports. Each takes the ColumnStore and an optional player name; without
+# one it covers every player.
+
+def _select(store, player, names):
+    # The named columns, restricted to one player's rows if given
+    import numpy as np
+
+    columns = [store.column(name) for name in names]
+    if player is None:
+        return columns
+    code = store.player_codes.get(player)
+    if code is None:
+        return [np.empty(0, dtype=column.dtype) for column in columns]
+    rows = np.flatnonzero(store.column('player') == code)
+    return [column[rows] for column in columns]
+
+
+def _days(np, timestamps):
+    return timestamps // _MICROSECONDS_PER_DAY
+
+
+def _day_label(day):
+    import numpy as np
+
+    return str(np.datetime64(int(day), 'D'))
+
+
+def exp_per_skill_per_day(store, player=None):
+    # [(day, child_skill_id, completions, exp)] ordered by day and skill
+    import numpy as np
+
+    timestamps, child_skills, exp = _select(store, player, ('timestamp', 'child_skill', 'exp'))
+    if len(timestamps) == 0:
+        return []
+    days = _days(np, timestamps)
+    first_day = days.min()
+    skills = int(child_skills.max()) + 1
+    keys, inverse = np.unique((days - first_day) * skills + child_skills, return_inverse=True)
+    counts = np.bincount(inverse)
+    totals = np.bincount(inverse, weights=exp).astype(np.int64)
+    return [(_day_label(first_day + key // skills), int(key % skills), int(count), int(total))
+            for key, count, total in zip(keys, counts, totals)]
+
+
+def completions_by_quest_type(store, player=None):
+    # {quest_type: completions}
+    import numpy as np
+
+    (quests,) = _select(store, player, ('quest',))
+    type_codes = np.array([QUEST_TYPES.index(quest[0]) for quest in store.quests], dtype=np.int64)
+    counts = np.bincount(type_codes[quests], minlength=len(QUEST_TYPES)) if len(quests) else [0] * len(QUEST_TYPES)
+    return {quest_type: int(count) for quest_type, count in zip(QUEST_TYPES, counts)}
+
+
+def _by_player(np, columns):
+    # The columns reordered by player, then time; columns[0] is the player
+    # and columns[1] the timestamp. Also returns where each player starts.
+    # The player sort is stable on 16 bits at a time, least significant
+    # first, which NumPy runs as a radix sort.
+    order = np.argsort(columns[1], kind='stable')
+    players = columns[0]
+    for shift in range(0, max(int(players.max()).bit_length(), 1), 16):
+        order = order[np.argsort((players[order] >> shift).astype(np.uint16), kind='stable')]
+    columns = [column[order] for column in columns]
+    players = columns[0]
+    starts = np.flatnonzero(np.r_[True, players[1:] != players[:-1]])
+    return columns, starts
+
+
+def _running_levels(np, groups, exp, curve):
+    # For events ordered by group and time: the level of each group's
+    # running EXP total after each event, and the levels the event gained
+    exp = exp.astype(np.int64)
+    totals = np.cumsum(exp)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    totals -= np.repeat(totals[starts] - exp[starts], np.diff(np.r_[starts, len(groups)]))
+    levels = curve.levels(totals)
+    previous = np.r_[1, levels[:-1]]
+    previous[starts] = 1
+    return levels, levels - previous
+
+
+def _curve_levels(np, store, curve_name, players, child_skills, exp):
+    # _running_levels per player for the player curve, per player and skill
+    # for the others. Each skill's events, picked out of the player-ordered
+    # events, are still in player and time order, so no further sort.
+    curve = CURVES[curve_name]
+    if curve_name == 'player':
+        return _running_levels(np, players, exp, curve)
+    skills = store.life_skill_of()[child_skills] if curve_name == 'life_skill' else child_skills
+    levels = np.ones(len(exp), dtype=np.int64)
+    gained = np.zeros(len(exp), dtype=np.int64)
+    for skill in np.flatnonzero(np.bincount(skills)):
+        rows = np.flatnonzero(skills == skill)
+        levels[rows], gained[rows] = _running_levels(np, players[rows], exp[rows], curve)
+    return levels, gained
+
+
+def coin_income(store, player=None):
+    # [(day, quest_coins, level_up_coins)] ordered by day. Level-up coins
+    # are the bonuses for the levels each day's EXP reached.
+    import numpy as np
+
+    columns = _select(store, player, ('player', 'timestamp', 'child_skill', 'exp', 'coins'))
+    if len(columns[0]) == 0:
+        return []
+    (players, timestamps, child_skills, exp, coins), _ = _by_player(np, columns)
+    bonus = np.zeros(len(timestamps), dtype=np.int64)
+    for curve_name, per_level in (('player', PLAYER_LEVEL_COINS), ('life_skill', LIFE_LEVEL_COINS),
+                                  ('child_skill', CHILD_LEVEL_COINS)):
+        bonus += _curve_levels(np, store, curve_name, players, child_skills, exp)[1] * per_level
+    days = _days(np, timestamps)
+    first_day = days.min()
+    offsets = days - first_day
+    quest_coins = np.bincount(offsets, weights=coins).astype(np.int64)
+    level_coins = np.bincount(offsets, weights=bonus).astype(np.int64)
+    active = np.flatnonzero(np.bincount(offsets))
+    return [(_day_label(first_day + day), int(quest_coins[day]), int(level_coins[day])) for day in active]
+
+
+def time_to_level(store, curve_name='player', player=None, percentiles=(50, 90)):
+    # [(level, reached, days at each percentile)]: how many players (or
+    # player skills) reached each level of the curve, and how long after
+    # the player's first completion they got there
+    import numpy as np
+
+    columns = _select(store, player, ('player', 'timestamp', 'child_skill', 'exp'))
+    if len(columns[0]) == 0:
+        return []
+    (players, timestamps, child_skills, exp), starts = _by_player(np, columns)
+    levels, gained = _curve_levels(np, store, curve_name, players, child_skills, exp)
+    first_seen = np.repeat(timestamps[starts], np.diff(np.r_[starts, len(timestamps)]))
+    elapsed = (timestamps - first_seen) / _MICROSECONDS_PER_DAY
+
+    # One entry per level reached: an event that gained n levels reached
+    # each of the n levels up to its own
+    ups = np.flatnonzero(gained > 0)
+    if len(ups) == 0:
+        return []
+    counts = gained[ups]
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    reached = np.repeat(levels[ups] - counts + 1, counts) + steps
+    days = np.repeat(elapsed[ups], counts)
+    by_level = np.lexsort((days, reached))
+    reached, days = reached[by_level], days[by_level]
+    starts = np.flatnonzero(np.r_[True, reached[1:] != reached[:-1]])
+    sizes = np.diff(np.r_[starts, len(reached)])
+    return [(int(reached[start]), int(size), *(round(float(days[start + (size - 1) * q // 100]), 2) for q in percentiles))
+            for start, size in zip(starts, sizes)]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Export LifeRPG completions for analytics and report on them')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='append completions since the last export')
+    export.add_argument('--db', default='liferpg.db')
+    export.add_argument('--dir', default='analytics')
+    export.add_argument('--chunk-size', type=int, default=100000, help='rows per read and append')
+    report = commands.add_parser('report', help='compute a report from an export')
+    report.add_argument('--dir', default='analytics')
+    report.add_argument('--report', choices=REPORTS, required=True)
+    report.add_argument('--player', help='player name (default every player)')
+    report.add_argument('--curve', choices=tuple(CURVES), default='player', help='curve for the levels report')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'export':
+        with Database(args.db) as db:
+            summary = export_completions(db, args.dir, args.chunk_size)
+        print(f"{summary['exported']} completion(s) exported, {summary['rows']} in {args.dir}", file=sys.stderr)
+        return
+    store = ColumnStore(args.dir)
+    if args.report == 'exp':
+        print(f"{'day':<10} {'skill':>5} {'completions':>11} {'exp':>10}")
+        for day, child_skill_id, completions, exp in exp_per_skill_per_day(store, args.player):
+            print(f"{day:<10} {child_skill_id:>5} {completions:>11} {exp:>10}")
+    elif args.report == 'quest_types':
+        for quest_type, count in completions_by_quest_type(store, args.player).items():
+            print(f"{quest_type:<12} {count:>10}")
+    elif args.report == 'coins':
+        print(f"{'day':<10} {'quest coins':>11} {'level coins':>11}")
+        for day, quest_coins, level_coins in coin_income(store, args.player):
+            print(f"{day:<10} {quest_coins:>11} {level_coins:>11}")
+    else:
+        print(f"{'level':>5} {'reached':>9} {'p50 days':>9} {'p90 days':>9}")
+        for level, reached, p50, p90 in time_to_level(store, args.curve, args.player):
+            print(f"{level:>5} {reached:>9} {p50:>9} {p90:>9}")
+
+
+if __name__ == '__main__':
+    main()
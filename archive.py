@@ -0,0 +1,148 @@
+import datetime
+import re
+import time
+from collections import namedtuple
+from functions.database import period_starts
+
+# Moves closed history out of player_quests. Completed daily, routine and
+# progression rows older than the retention window go to one
+# player_quests_YYYY_MM table per month (same columns, keyed like
+# player_quests) and are rolled up into player_quest_daily_summary. Special
+# and challenge completions decide availability forever and are never
+# archived; rng completions are kept live as well.
+#
+# Work is split into windows of player_quests rowids, one short write
+# transaction each, so live completions interleave with a long archive run.
+# Re-running is safe: rows are moved, not copied.
+
+# keep_months: whole calendar months kept live before the current one
+RetentionPolicy = namedtuple('RetentionPolicy', ['keep_months', 'quest_types'])
+DEFAULT_RETENTION = RetentionPolicy(3, ('daily', 'routine', 'progression'))
+ARCHIVABLE_TYPES = ('daily', 'routine', 'progression')
+
+_MONTH = re.compile(r'^\d{4}-\d{2}$')
+
+
+def archive_table_name(month):
+    # '2026-05' -> 'player_quests_2026_05'
+    if not _MONTH.match(month):
+        raise ValueError(f"Invalid archive month: {month}")
+    return f"player_quests_{month.replace('-', '_')}"
+
+
+def retention_cutoff(policy, now):
+    # Rows completed before this ISO timestamp are archived. Never later than
+    # the start of the current week or month, which routine availability
+    # still reads.
+    _, week_start, month_start = period_starts(now)
+    month = datetime.datetime.fromisoformat(month_start)
+    months = month.year * 12 + month.month - 1 - policy.keep_months
+    cutoff = month.replace(year=months // 12, month=months % 12 + 1).isoformat()
+    return min(cutoff, week_start, month_start)
+
+
+class QuestArchiver:
+    def __init__(self, db, policy=DEFAULT_RETENTION, chunk_size=2000, pause=0.0):
+        for quest_type in policy.quest_types:
+            if quest_type not in ARCHIVABLE_TYPES:
+                raise ValueError(f"Quest type cannot be archived: {quest_type}")
+        if policy.keep_months < 0:
+            raise ValueError(f"keep_months must not be negative: {policy.keep_months}")
+        self.db = db
+        self.policy = policy
+        self.chunk_size = chunk_size
+        # Seconds to sleep between chunks, leaving the writer to live traffic
+        self.pause = pause
+        self._type_list = ', '.join('?' * len(policy.quest_types))
+
+    def run(self, now=None):
+        # Archives everything past the retention window; returns a summary
+        cutoff = retention_cutoff(self.policy, now or datetime.datetime.now())
+        summary = {'cutoff': cutoff, 'archived': 0, 'months': {}}
+        for first_rowid, last_rowid in self._rowid_chunks():
+            months = self.archive_chunk(cutoff, first_rowid, last_rowid)
+            for month, count in months.items():
+                summary['months'][month] = summary['months'].get(month, 0) + count
+                summary['archived'] += count
+            if self.pause:
+                time.sleep(self.pause)
+        return summary
+
+    def _rowid_chunks(self):
+        with self.db.pool.read() as conn:
+            first_rowid, last_rowid = conn.execute('SELECT MIN(rowid), MAX(rowid) FROM player_quests').fetchone()
+        if first_rowid is None:
+            return
+        for chunk_start in range(first_rowid, last_rowid + 1, self.chunk_size):
+            yield chunk_start, min(chunk_start + self.chunk_size - 1, last_rowid)
+
+    def archive_chunk(self, cutoff, first_rowid, last_rowid):
+        # Moves the archivable rows with rowids in [first_rowid, last_rowid]
+        # in one transaction; returns {month: rows archived}
+        catalog = self.db.get_catalog()
+        where = f'''
+            rowid BETWEEN ? AND ? AND completed = 1 AND completion_date < ?
+            AND completion_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+            AND quest_type IN ({self._type_list})
+        '''
+        params = (first_rowid, last_rowid, cutoff, *self.policy.quest_types)
+        with self.db.pool.write() as conn:
+            rows = conn.execute(f'''
+                SELECT player_name, quest_id, quest_type, completed, completion_date, streak_count
+                FROM player_quests WHERE {where}
+            ''', params).fetchall()
+            if not rows:
+                return {}
+
+            by_month = {}
+            for row in rows:
+                by_month.setdefault(row[4][:7], []).append(row)
+            for month, month_rows in by_month.items():
+                table_name = archive_table_name(month)
+                conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table_name} (
+                        player_name TEXT,
+                        quest_id INTEGER,
+                        quest_type TEXT,
+                        completed BOOLEAN DEFAULT 0,
+                        completion_date TEXT,
+                        streak_count INTEGER DEFAULT 0,
+                        PRIMARY KEY (player_name, quest_type, quest_id, completion_date)
+                    ) WITHOUT ROWID
+                ''')
+                conn.executemany(f'INSERT OR REPLACE INTO {table_name} VALUES (?, ?, ?, ?, ?, ?)', month_rows)
+                conn.execute('''
+                    INSERT INTO player_quest_archives (month, table_name, row_count) VALUES (?, ?, ?)
+                    ON CONFLICT (month) DO UPDATE SET row_count = row_count + excluded.row_count
+                ''', (month, table_name, len(month_rows)))
+
+            conn.executemany('''
+                INSERT INTO player_quest_daily_summary (player_id, child_skill_id, day, completions, exp)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (player_id, day, child_skill_id) DO UPDATE
+                SET completions = completions + excluded.completions, exp = exp + excluded.exp
+            ''', self._summary_rows(conn, catalog, rows))
+            conn.execute(f'DELETE FROM player_quests WHERE {where}', params)
+        return {month: len(month_rows) for month, month_rows in by_month.items()}
+
+    def _summary_rows(self, conn, catalog, rows):
+        # (player_id, child_skill_id, day, completions, exp). EXP comes from
+        # the catalog; quests no longer in it count under child skill 0.
+        # Rows of players that no longer exist are archived unsummarized.
+        names = sorted({row[0] for row in rows})
+        player_ids = {}
+        for first in range(0, len(names), 500):
+            batch = names[first:first + 500]
+            player_ids.update(conn.execute(f'''
+                SELECT name, MIN(id) FROM players WHERE name IN ({', '.join('?' * len(batch))}) GROUP BY name
+            ''', batch).fetchall())
+        totals = {}
+        for player_name, quest_id, quest_type, _, completion_date, _ in rows:
+            player_id = player_ids.get(player_name)
+            if player_id is None:
+                continue
+            quest = catalog.get(quest_type, quest_id)
+            key = (player_id, quest.child_skill_id if quest else 0, completion_date[:10])
+            completions, exp = totals.get(key, (0, 0))
+            totals[key] = (completions + 1, exp + (quest.exp_reward if quest else 0))
+        return [key + value for key, value in totals.items()]
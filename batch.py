@@ -0,0 +1,102 @@
+import json
+import sys
+import time
+from functions.server import list_quests, complete_quest, get_stats
+
+# Non-interactive driver for the game: reads commands as line-delimited JSON
+# in the quest server's request format, for example
+#   {"id": 1, "op": "complete_quest", "player": "alice", "quest_type": "daily", "quest_id": 1}
+#   {"id": 2, "op": "complete_quest", "player": "alice", "quest_type": "progression", "quest_id": 2,
+#    "completion_date": "2026-05-01T07:30:00"}
+#   {"id": 3, "op": "list_quests", "player": "alice"}
+#   {"id": 4, "op": "get_stats", "player": "alice"}
+# and writes one {"id": ..., "ok": true, "result": ...} or
+# {"id": ..., "ok": false, "error": "..."} line per command.
+#
+# A completion without completion_date must be available to the player now,
+# as in the server. One with completion_date replays tracker history: the
+# quest is only looked up in the catalog and recorded at that time.
+#
+# Commands run batch_size at a time in one write transaction, each in its
+# own savepoint, so a failing command is rolled back alone and the rest of
+# the batch commits. A batch's results are written once it has committed.
+# Reads inside a batch see the batch's own earlier commands.
+#
+# Run from the project root:
+#   python -m functions.main --batch commands.jsonl > results.jsonl
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def replay_completion(db, request):
+    quest_type, quest_id = request['quest_type'], request['quest_id']
+    quest = db.get_catalog().get(quest_type, quest_id)
+    if quest is None:
+        raise ValueError(f"Unknown quest: {quest_type} {quest_id}")
+    gain = db.complete_quests(request['player'], [(quest_id, quest_type, quest.child_skill_id, quest.exp_reward,
+                                                   quest.coin_reward, request['completion_date'])])[0]
+    return gain._asdict()
+
+
+def complete(db, request):
+    if request.get('completion_date') is not None:
+        return replay_completion(db, request)
+    return complete_quest(db, request)
+
+
+HANDLERS = {
+    'list_quests': list_quests,
+    'complete_quest': complete,
+    'get_stats': get_stats,
+}
+
+
+def run_command(db, line, default_player=None):
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get('id')
+        if request.get('op') not in HANDLERS:
+            raise ValueError(f"Unknown op: {request.get('op')}")
+        if 'player' not in request:
+            if default_player is None:
+                raise ValueError("No player given")
+            request['player'] = default_player
+        with db.pool.savepoint():
+            result = HANDLERS[request['op']](db, request)
+        return {'id': request_id, 'ok': True, 'result': result}
+    except Exception as e:
+        return {'id': request_id, 'ok': False, 'error': f"{type(e).__name__}: {e}"}
+
+
+def run_batches(db, lines, out, batch_size=DEFAULT_BATCH_SIZE, default_player=None):
+    # Runs every command read from lines and writes the results to out;
+    # returns a summary
+    summary = {'commands': 0, 'failed': 0, 'batches': 0}
+    started = time.perf_counter()
+    batch = []
+    for line in lines:
+        if line.strip():
+            batch.append(line)
+        if len(batch) >= batch_size:
+            _run_batch(db, batch, out, default_player, summary)
+            batch = []
+    if batch:
+        _run_batch(db, batch, out, default_player, summary)
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def _run_batch(db, batch, out, default_player, summary):
+    with db.pool.write():
+        results = [run_command(db, line, default_player) for line in batch]
+    out.write(''.join(json.dumps(result) + '\n' for result in results))
+    out.flush()
+    summary['commands'] += len(results)
+    summary['failed'] += sum(not result['ok'] for result in results)
+    summary['batches'] += 1
+
+
+def open_commands(path):
+    # '-' reads standard input
+    return sys.stdin if path == '-' else open(path)
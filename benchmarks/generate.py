@@ -0,0 +1,161 @@
+import argparse
+import datetime
+import os
+import random
+
+from functions.database import Database, period_starts
+from functions.levels import PLAYER_CURVE, LIFE_SKILL_CURVE, CHILD_SKILL_CURVE
+from functions.migrations import CHILD_SKILLS, LIFE_SKILLS
+
+# Builds a synthetic liferpg database: --players players with consistent skill
+# totals, --catalog quests per quest type and --months of player_quests
+# history, all written with bulk inserts. The same arguments and --seed give
+# the same database.
+#
+# Run from the project root:
+#   python -m benchmarks.generate --db bench.db --players 1000 --catalog 200 --months 6
+
+QUEST_TABLES = {
+    'daily': 'daily_quests',
+    'routine': 'routine_quests',
+    'special': 'special_quests',
+    'progression': 'progression_quests',
+    'challenge': 'challenge_quests',
+    'rng': 'rng_quests',
+}
+DEFAULT_SCALE = {'players': 1000, 'catalog': 200, 'months': 6, 'quests_per_day': 3, 'seed': 1}
+
+
+def remove_db(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def catalog_rows(quest_type, first_id, count, rng, now):
+    child_skill_ids = [skill[0] for skill in CHILD_SKILLS]
+    for quest_id in range(first_id, first_id + count):
+        row = (quest_id, f'{quest_type.title()} Quest {quest_id}', f'Synthetic {quest_type} quest.',
+               rng.choice(child_skill_ids), rng.randrange(20, 200, 5), rng.randrange(0, 50, 5))
+        if quest_type == 'routine':
+            row += (rng.choice(('weekly', 'monthly')),)
+        elif quest_type == 'challenge':
+            # Most challenges still open, some expired
+            time_limit = now + datetime.timedelta(days=rng.randint(-30, 365))
+            row += (time_limit.replace(microsecond=0).isoformat(), rng.choice((0, 0, 3, 7)))
+        yield row
+
+
+def insert_catalog(conn, size, rng, now):
+    for quest_type, table in QUEST_TABLES.items():
+        columns = 'id, name, description, child_skill_id, exp_reward, coin_reward'
+        if quest_type == 'routine':
+            columns += ', reset_period'
+        elif quest_type == 'challenge':
+            columns += ', time_limit, streak_required'
+        first_id = conn.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+        placeholders = ', '.join('?' * len(columns.split(',')))
+        conn.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})',
+                         catalog_rows(quest_type, first_id, max(0, size - first_id + 1), rng, now))
+
+
+def history_rows(player_name, quest_ids, days, quests_per_day, rng, now):
+    # Completed progression quests every day, a routine completion most
+    # weeks, a handful of one-off quests and today's daily assignments
+    start = now - datetime.timedelta(days=days)
+    for day in range(days):
+        date = start + datetime.timedelta(days=day, hours=rng.randint(6, 22), minutes=rng.randint(0, 59))
+        for i in range(rng.randint(0, quests_per_day)):
+            yield player_name, rng.choice(quest_ids['progression']), 'progression', 1, \
+                (date + datetime.timedelta(seconds=i)).isoformat(), 1
+        if day % 7 == 0 and rng.random() < 0.7:
+            yield player_name, rng.choice(quest_ids['routine']), 'routine', 1, date.isoformat(), 1
+    for quest_type in ('special', 'challenge', 'rng'):
+        for quest_id in rng.sample(quest_ids[quest_type], min(len(quest_ids[quest_type]), 5)):
+            yield player_name, quest_id, quest_type, 1, (start + datetime.timedelta(days=rng.randrange(max(days, 1)))).isoformat(), 1
+    today = period_starts(now)[0]
+    for quest_id in quest_ids['daily']:
+        yield player_name, quest_id, 'daily', int(rng.random() < 0.3), today, 0
+
+
+def skill_rows(player_id, rng):
+    # Random child skill EXP with life skill and player totals that satisfy
+    # Database.verify_aggregates
+    child_rows = []
+    life_exp = {skill[0]: 0 for skill in LIFE_SKILLS}
+    for child_skill_id, _, life_skill_id in CHILD_SKILLS:
+        exp = rng.randint(0, 5000)
+        life_exp[life_skill_id] += exp
+        child_rows.append((player_id, child_skill_id, CHILD_SKILL_CURVE.level(exp), exp))
+    life_rows = [(player_id, life_skill_id, LIFE_SKILL_CURVE.level(exp), exp) for life_skill_id, exp in life_exp.items()]
+    total_exp = sum(life_exp.values())
+    return child_rows, life_rows, (PLAYER_CURVE.level(total_exp), total_exp)
+
+
+def generate(path, players=1000, catalog=200, months=6, quests_per_day=3, seed=1, now=None, chunk_size=1000):
+    # Replaces any database at path
+    rng = random.Random(seed)
+    now = now or datetime.datetime.now()
+    days = int(months * 30)
+    remove_db(path)
+    with Database(path, readers=0) as db:
+        with db.pool.write() as conn:
+            insert_catalog(conn, catalog, rng, now)
+        quest_ids = {quest_type: [row[0] for row in db.conn.execute(f'SELECT id FROM {table} ORDER BY id')]
+                     for quest_type, table in QUEST_TABLES.items()}
+        for first in range(0, players, chunk_size):
+            with db.pool.write() as conn:
+                for index in range(first, min(first + chunk_size, players)):
+                    player_name = f'player-{index}'
+                    child_rows, life_rows, (level, exp) = skill_rows(index + 1, rng)
+                    conn.execute('''
+                        INSERT INTO players (id, name, status, level, exp, coins, quests_completed)
+                        VALUES (?, ?, 'live', ?, ?, ?, ?)
+                    ''', (index + 1, player_name, level, exp, rng.randint(0, 10000), rng.randint(0, days * quests_per_day)))
+                    conn.execute('''
+                        INSERT INTO player_stats (player_name, life_skill_id, child_skill_id)
+                        SELECT ?, life_skill_id, id FROM child_skills
+                    ''', (player_name,))
+                    conn.executemany('INSERT INTO player_child_skills (player_id, child_skill_id, level, exp) VALUES (?, ?, ?, ?)', child_rows)
+                    conn.executemany('INSERT INTO player_life_skills (player_id, life_skill_id, level, exp) VALUES (?, ?, ?, ?)', life_rows)
+                    conn.executemany('''
+                        INSERT OR IGNORE INTO player_quests (player_name, quest_id, quest_type, completed, completion_date, streak_count)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', history_rows(player_name, quest_ids, days, quests_per_day, rng, now))
+        db.backfill_streaks(now)
+        db.backfill_completion_counts()
+        db.conn.execute('ANALYZE')
+    return path
+
+
+def add_scale_arguments(parser):
+    parser.add_argument('--players', type=int, default=DEFAULT_SCALE['players'])
+    parser.add_argument('--catalog', type=int, default=DEFAULT_SCALE['catalog'], help='quests per quest type')
+    parser.add_argument('--months', type=float, default=DEFAULT_SCALE['months'], help='months of player_quests history')
+    parser.add_argument('--quests-per-day', type=int, default=DEFAULT_SCALE['quests_per_day'],
+                        help='most progression completions per player and day')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SCALE['seed'])
+
+
+def scale_from_args(args):
+    return {key: getattr(args, key) for key in DEFAULT_SCALE}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Build a synthetic LifeRPG database')
+    parser.add_argument('--db', default='bench.db')
+    add_scale_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    generate(args.db, **scale_from_args(args))
+    with Database(args.db, readers=0) as db:
+        players, history = db.conn.execute(
+            'SELECT (SELECT COUNT(*) FROM players), (SELECT COUNT(*) FROM player_quests)').fetchone()
+    print(f"{args.db}: {players} players, {history} player_quests rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from functions.database import Database
+from functions.leaderboard import Leaderboard, PLAYER_BOARD, life_skill_board
+
+# Leaderboard queries at scale against the ORDER BY / COUNT(*) SQL they
+# replace. Builds a database of --players players (players and
+# player_life_skills rows only) unless --db already exists.
+#
+# Run from the project root: python -m benchmarks.leaderboard_bench --players 1000000
+
+REPEAT = 1000
+
+
+def build(path, players, seed=1, chunk_size=100000):
+    rng = random.Random(seed)
+    with Database(path, readers=0) as db:
+        for first in range(1, players + 1, chunk_size):
+            ids = range(first, min(first + chunk_size, players + 1))
+            life = [(player_id, life_skill_id, 1, rng.randint(0, 20000)) for player_id in ids for life_skill_id in range(1, 5)]
+            with db.pool.write() as conn:
+                conn.executemany('''
+                    INSERT INTO players (id, name, status, level, exp, coins, quests_completed)
+                    VALUES (?, ?, 'live', 1, ?, 0, ?)
+                ''', ((player_id, f'player-{player_id}', sum(row[3] for row in life[i * 4:i * 4 + 4]), rng.randint(0, 5000))
+                      for i, player_id in enumerate(ids)))
+                conn.executemany('INSERT INTO player_life_skills (player_id, life_skill_id, level, exp) VALUES (?, ?, ?, ?)', life)
+
+
+def per_call_us(func, repeat=REPEAT):
+    started = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Leaderboard benchmark')
+    parser.add_argument('--players', type=int, default=1_000_000)
+    parser.add_argument('--db', help='database to reuse (built if missing)')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, 'leaderboard.db')
+        if not os.path.exists(path):
+            started = time.perf_counter()
+            build(path, args.players)
+            print(f"built {args.players} players in {time.perf_counter() - started:.1f}s")
+
+        with Database(path) as db:
+            started = time.perf_counter()
+            leaderboard = Leaderboard(db)
+            print(f"loaded {len(leaderboard.boards)} boards of {len(leaderboard.boards[PLAYER_BOARD])} players "
+                  f"in {time.perf_counter() - started:.2f}s")
+
+            rng = random.Random(2)
+            player_count = len(leaderboard.boards[PLAYER_BOARD])
+            players = [rng.randint(1, player_count) for _ in range(REPEAT)]
+            sql_players = players[:20]
+            board = life_skill_board(1)
+
+            def sql_rank(i):
+                with db.pool.read() as conn:
+                    conn.execute('''
+                        SELECT COUNT(*) + 1 FROM players WHERE exp > (SELECT exp FROM players WHERE id = ?)
+                    ''', (sql_players[i],)).fetchone()
+
+            def sql_top(i):
+                with db.pool.read() as conn:
+                    conn.execute('SELECT id, name, exp FROM players ORDER BY exp DESC, id LIMIT 10').fetchall()
+
+            print(f"{'query':<28} {'leaderboard us':>15} {'sql us':>12}")
+            rows = [
+                ('rank (player)', per_call_us(lambda i: leaderboard.rank(PLAYER_BOARD, players[i])), per_call_us(sql_rank, 20)),
+                ('top 10 (player)', per_call_us(lambda i: leaderboard.top(PLAYER_BOARD, 10)), per_call_us(sql_top, 20)),
+                ('around +-5 (player)', per_call_us(lambda i: leaderboard.around(PLAYER_BOARD, players[i], 5)), None),
+                ('rank (life skill 1)', per_call_us(lambda i: leaderboard.rank(board, players[i])), None),
+                ('score update', per_call_us(lambda i: leaderboard.set_score(PLAYER_BOARD, players[i], rng.randint(0, 80000))), None),
+            ]
+            for name, board_us, sql_us in rows:
+                print(f"{name:<28} {board_us:>15.1f} {sql_us if sql_us is None else round(sql_us, 1)!s:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import random
+import timeit
+
+from functions.levels import PLAYER_CURVE, LIFE_SKILL_CURVE, CHILD_SKILL_CURVE
+
+# Run from the project root: python -m benchmarks.levels_bench
+
+CURVES = [
+    ('player', PLAYER_CURVE),
+    ('life skill', LIFE_SKILL_CURVE),
+    ('child skill', CHILD_SKILL_CURVE),
+]
+EXP_VALUES = [1_000, 10_000, 100_000, 1_000_000]
+REPEAT = 2000
+
+
+def original_level(curve):
+    # The per-level loop calculate_*_level used before the threshold tables
+    def level(total_exp):
+        if total_exp < curve.base:
+            return 1
+        level = 1
+        exp_needed = curve.base
+        current_exp = total_exp
+        while current_exp >= exp_needed:
+            level += 1
+            current_exp -= exp_needed
+            exp_needed = curve.base + (exp_needed * curve.factor)
+        return level
+    return level
+
+
+def per_call_us(func, value, number):
+    return min(timeit.repeat(lambda: func(value), number=number, repeat=3)) / number * 1e6
+
+
+def completion_us(player_level, life_level, child_level, exp):
+    # update_skill_exp resolves one child level, three life-skill levels and
+    # one player level per quest completion
+    def complete():
+        child_level(exp)
+        life_level(exp)
+        life_level(exp)
+        life_level(exp - 50)
+        player_level(exp)
+    return min(timeit.repeat(complete, number=REPEAT // 10, repeat=3)) / (REPEAT // 10) * 1e6
+
+
+def main():
+    for name, curve in CURVES:
+        loop_level = original_level(curve)
+        for exp in range(0, 50_000):
+            assert curve.level(exp) == loop_level(exp), (name, exp)
+
+    print(f"{'curve':<12} {'exp':>10} {'loop us':>10} {'table us':>10} {'speedup':>8}")
+    for name, curve in CURVES:
+        loop_level = original_level(curve)
+        for exp in EXP_VALUES:
+            assert curve.level(exp) == loop_level(exp)
+            number = REPEAT if exp <= 100_000 else REPEAT // 10
+            loop_us = per_call_us(loop_level, exp, number)
+            table_us = per_call_us(curve.level, exp, REPEAT)
+            print(f"{name:<12} {exp:>10} {loop_us:>10.2f} {table_us:>10.2f} {loop_us / table_us:>7.1f}x")
+
+    print(f"\n{'per completion':<12} {'exp':>10} {'loop us':>10} {'table us':>10} {'speedup':>8}")
+    for exp in EXP_VALUES:
+        loop_us = completion_us(original_level(PLAYER_CURVE), original_level(LIFE_SKILL_CURVE), original_level(CHILD_SKILL_CURVE), exp)
+        table_us = completion_us(PLAYER_CURVE.level, LIFE_SKILL_CURVE.level, CHILD_SKILL_CURVE.level, exp)
+        print(f"{'':<12} {exp:>10} {loop_us:>10.2f} {table_us:>10.2f} {loop_us / table_us:>7.1f}x")
+
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    exps = np.array([random.randrange(0, 1_000_000) for _ in range(100_000)], dtype=np.int64)
+    for name, curve in CURVES:
+        batch_s = min(timeit.repeat(lambda: curve.levels(exps), number=1, repeat=3))
+        assert all(curve.levels(exps[:1000]) == [curve.level(int(x)) for x in exps[:1000]])
+        print(f"{name:<12} batch of {len(exps)}: {batch_s * 1e3:.2f} ms ({batch_s / len(exps) * 1e9:.0f} ns/value)")
+
+
+if __name__ == '__main__':
+    main()
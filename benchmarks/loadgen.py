@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from functions.database import Database
+
+# Load generator for the quest server (functions/server.py). Opens --clients
+# connections, sends a mix of list_quests / complete_quest / get_stats
+# requests for --duration seconds and reports requests/sec and p50/p99
+# latency.
+#
+# Run from the project root:
+#   python -m benchmarks.loadgen --db liferpg.db --setup-players 100
+#   python -m benchmarks.loadgen --port 8765 --clients 50 --duration 10
+
+
+def setup_players(db_name, count):
+    with Database(db_name) as db:
+        for i in range(count):
+            player_name = f'load-{i}'
+            if db.get_player(player_name) is None:
+                db.initialize_player_stats(db.create_player(player_name))
+                db.assign_daily_quests(player_name)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def run_client(args, players, deadline, latencies, errors):
+    if args.unix:
+        reader, writer = await asyncio.open_unix_connection(args.unix)
+    else:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    request_id = 0
+    try:
+        while time.perf_counter() < deadline:
+            request_id += 1
+            player = random.choice(players)
+            roll = random.random()
+            if roll < args.complete_ratio:
+                request = {'op': 'complete_quest', 'player': player, 'quest_type': 'progression',
+                           'quest_id': random.randint(1, 2)}
+            elif roll < args.complete_ratio + (1 - args.complete_ratio) / 2:
+                request = {'op': 'list_quests', 'player': player}
+            else:
+                request = {'op': 'get_stats', 'player': player}
+            request['id'] = request_id
+
+            started = time.perf_counter()
+            writer.write(json.dumps(request).encode() + b'\n')
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.setdefault(request['op'], []).append(time.perf_counter() - started)
+            if not response['ok']:
+                errors.append(response['error'])
+    finally:
+        writer.close()
+
+
+async def run(args):
+    players = [f'load-{i}' for i in range(args.players)]
+    latencies = {}
+    errors = []
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(run_client(args, players, deadline, latencies, errors) for _ in range(args.clients)))
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{total} requests in {elapsed:.2f}s from {args.clients} clients: {total / elapsed:.0f} req/s, {len(errors)} errors")
+    for op, values in sorted(latencies.items()) + [('all', [v for values in latencies.values() for v in values])]:
+        values = sorted(values)
+        print(f"  {op:<15} n={len(values):<8} p50={percentile(values, 0.50) * 1e3:.2f} ms  p99={percentile(values, 0.99) * 1e3:.2f} ms")
+    if errors:
+        print(f"  first error: {errors[0]}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load generator for the LifeRPG quest server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='connect to this Unix socket path instead of TCP')
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--players', type=int, default=100, help='spread requests over load-0 .. load-N')
+    parser.add_argument('--complete-ratio', type=float, default=0.3, help='share of complete_quest requests')
+    parser.add_argument('--db', default='liferpg.db', help='database used by --setup-players')
+    parser.add_argument('--setup-players', type=int, default=0, help='create load-N players in --db and exit')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.setup_players:
+        setup_players(args.db, args.setup_players)
+        return
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
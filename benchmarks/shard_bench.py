@@ -0,0 +1,63 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from functions.sharding import ShardedDatabase
+
+# Completions per second through ShardedDatabase as the shard count grows:
+# --threads callers, each completing progression quests for its own
+# players, with one commit per completion. Shards only write in parallel
+# with a core each, so expect the rate to level off at the core count.
+#
+# Run from the project root: python -m benchmarks.shard_bench --shards 1 2 4 8
+
+ITEM = (1, 'progression', 1, 40, 0)
+
+
+def run(directory, shards, threads, calls, players_per_thread):
+    with ShardedDatabase(directory, shards) as db:
+        names = [[f'bench-{thread}-{index}' for index in range(players_per_thread)] for thread in range(threads)]
+        for thread_names in names:
+            for name in thread_names:
+                db.initialize_player_stats(db.create_player(name))
+        barrier = threading.Barrier(threads + 1)
+
+        def caller(thread):
+            barrier.wait()
+            for call in range(calls):
+                db.complete_quests(names[thread][call % players_per_thread], [ITEM])
+
+        workers = [threading.Thread(target=caller, args=(thread,)) for thread in range(threads)]
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        rate = threads * calls / (time.perf_counter() - started)
+        drift = db.verify_aggregates()
+    return rate, len(drift)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sharded completion throughput benchmark')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--calls', type=int, default=200, help='completions per thread')
+    parser.add_argument('--players', type=int, default=4, help='players per thread')
+    args = parser.parse_args(argv)
+
+    print(f"{os.cpu_count()} core(s), {args.threads} threads x {args.calls} completions")
+    print(f"{'shards':>6} {'completions/s':>14} {'speedup':>8} {'drift':>6}")
+    baseline = None
+    for shards in args.shards:
+        with tempfile.TemporaryDirectory() as tmp:
+            rate, drift = run(tmp, shards, args.threads, args.calls, args.players)
+        baseline = baseline or rate
+        print(f"{shards:>6} {rate:>14.0f} {rate / baseline:>7.2f}x {drift:>6}")
+
+
+if __name__ == '__main__':
+    main()
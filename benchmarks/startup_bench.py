@@ -0,0 +1,62 @@
+import os
+import tempfile
+import time
+
+from functions.database import Database
+from functions.migrations import migrate, SCHEMA_VERSION
+from functions.pool import ConnectionPool
+
+# Time to construct a Database on a new file (cold: every migration runs) and
+# on an existing one (warm: one PRAGMA user_version read), plus the
+# statements the schema check issues on each path.
+#
+# Run from the project root: python -m benchmarks.startup_bench
+
+REPEAT = 50
+
+
+def open_ms(path, readers):
+    started = time.perf_counter()
+    Database(path, readers=readers).close()
+    return (time.perf_counter() - started) * 1e3
+
+
+def remove_db(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def schema_statements(path):
+    pool = ConnectionPool(path, readers=0)
+    statements = []
+    pool.writer_connection.set_trace_callback(statements.append)
+    try:
+        migrate(pool)
+    finally:
+        pool.close()
+    return statements
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'startup.db')
+        print(f"schema version {SCHEMA_VERSION}, best and median of {REPEAT} opens")
+        print(f"{'readers':>7} {'cold ms':>16} {'warm ms':>16}")
+        for readers in (0, 4):
+            cold = []
+            for _ in range(REPEAT):
+                remove_db(path)
+                cold.append(open_ms(path, readers))
+            warm = sorted(open_ms(path, readers) for _ in range(REPEAT))
+            cold.sort()
+            print(f"{readers:>7} {cold[0]:>7.2f} / {cold[REPEAT // 2]:>6.2f} {warm[0]:>7.2f} / {warm[REPEAT // 2]:>6.2f}")
+
+        remove_db(path)
+        print(f"\nschema statements, cold: {len(schema_statements(path))}")
+        warm = schema_statements(path)
+        print(f"schema statements, warm: {len(warm)} ({'; '.join(warm)})")
+
+
+if __name__ == '__main__':
+    main()
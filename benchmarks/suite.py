@@ -0,0 +1,201 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from functions.database import Database
+from functions.stats import Stats
+from benchmarks.generate import generate, add_scale_arguments, scale_from_args
+
+# Timed scenarios against the real Database API on a synthetic database from
+# benchmarks.generate. Results are written as JSON; --compare checks them
+# against an earlier results file and exits with status 1 when a scenario's
+# median got slower by more than --threshold.
+#
+# Run from the project root:
+#   python -m benchmarks.suite --out baseline.json
+#   python -m benchmarks.suite --out current.json --compare baseline.json
+
+BATCH_SIZE = 10
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'runs': len(samples),
+        'min_us': samples[0] * 1e6,
+        'median_us': samples[len(samples) // 2] * 1e6,
+        'p99_us': samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6,
+        'mean_us': sum(samples) / len(samples) * 1e6,
+    }
+
+
+def timed(func, runs):
+    samples = []
+    for i in range(runs):
+        started = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def progression_quests(db):
+    return db.conn.execute('SELECT id, child_skill_id, exp_reward, coin_reward FROM progression_quests ORDER BY id').fetchall()
+
+
+def measure_scale(path):
+    # The scale of the database actually benchmarked, which for a reused
+    # --db need not match the scale options
+    with Database(path, readers=0) as db:
+        players, catalog, history = db.conn.execute('''
+            SELECT (SELECT COUNT(*) FROM players), (SELECT COUNT(*) FROM progression_quests),
+                   (SELECT COUNT(*) FROM player_quests)
+        ''').fetchone()
+    return {'players': players, 'catalog': catalog, 'player_quests': history}
+
+
+def run_scenarios(path, runs, rng):
+    # Each scenario gets a fresh copy of the generated file, so the results
+    # do not depend on the order they run in
+    with Database(path, readers=0) as db:
+        names = [row[0] for row in db.conn.execute('SELECT name FROM players ORDER BY id')]
+    if not names:
+        raise ValueError(f"No players in {path}")
+    player_names = [rng.choice(names) for _ in range(runs)]
+    results = {}
+
+    def on_copy(name, scenario, scenario_runs=runs, **kwargs):
+        with tempfile.TemporaryDirectory() as tmp:
+            copy = os.path.join(tmp, 'scenario.db')
+            shutil.copyfile(path, copy)
+            results[name] = summarize(scenario(copy, scenario_runs, **kwargs))
+
+    def cold_open(copy, scenario_runs):
+        return timed(lambda i: Database(copy).close(), scenario_runs)
+
+    def available_quests(copy, scenario_runs):
+        with Database(copy) as db:
+            db.get_available_quests(player_names[0])
+            return timed(lambda i: db.get_available_quests(player_names[i]), scenario_runs)
+
+    def complete_quest(copy, scenario_runs):
+        with Database(copy) as db:
+            quests = progression_quests(db)
+            def complete(i):
+                quest_id, child_skill_id, exp_reward, coin_reward = quests[i % len(quests)]
+                db.complete_quest(player_names[i], quest_id, 'progression', child_skill_id, exp_reward, coin_reward)
+            return timed(complete, scenario_runs)
+
+    def complete_quests_batch(copy, scenario_runs):
+        with Database(copy) as db:
+            quests = progression_quests(db)
+            def complete(i):
+                items = [(quest_id, 'progression', child_skill_id, exp_reward, coin_reward)
+                         for quest_id, child_skill_id, exp_reward, coin_reward in rng.sample(quests, min(BATCH_SIZE, len(quests)))]
+                db.complete_quests(player_names[i], items)
+            return timed(complete, scenario_runs)
+
+    def display_stats(copy, scenario_runs):
+        with Database(copy) as db:
+            stats = [Stats(player_name, db) for player_name in player_names]
+            with contextlib.redirect_stdout(io.StringIO()):
+                return timed(lambda i: stats[i].display_stats(), scenario_runs)
+
+    def reset_daily_quests(copy, scenario_runs):
+        with Database(copy) as db:
+            return timed(lambda i: db.reset_daily_quests(player_names[i]), scenario_runs)
+
+    def daily_rollover(copy, scenario_runs):
+        # A new day for every player on each run
+        with Database(copy) as db:
+            start = datetime.datetime.now() + datetime.timedelta(days=1)
+            return timed(lambda i: db.rollover_daily_quests(start + datetime.timedelta(days=i)), scenario_runs)
+
+    on_copy('cold_open', cold_open, max(5, runs // 20))
+    on_copy('get_available_quests', available_quests)
+    on_copy('complete_quest', complete_quest)
+    on_copy(f'complete_quests_batch_{BATCH_SIZE}', complete_quests_batch)
+    on_copy('display_stats', display_stats)
+    on_copy('reset_daily_quests', reset_daily_quests)
+    on_copy('daily_rollover', daily_rollover, max(2, runs // 100))
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Returns the names of scenarios whose median regressed past threshold
+    regressions = []
+    print(f"{'scenario':<28} {'baseline us':>12} {'current us':>12} {'change':>8}")
+    for name, current in results['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"{name:<28} {'-':>12} {current['median_us']:>12.1f} {'new':>8}")
+            continue
+        change = current['median_us'] / before['median_us'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<28} {before['median_us']:>12.1f} {current['median_us']:>12.1f} {change:>+7.1%}{flag}")
+    if baseline.get('scale') != results['scale']:
+        print(f"warning: baseline scale {baseline.get('scale')} differs from {results['scale']}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='LifeRPG benchmark suite')
+    parser.add_argument('--db', help='generated database to reuse (built with the scale options if missing)')
+    add_scale_arguments(parser)
+    parser.add_argument('--runs', type=int, default=200, help='timed runs per scenario')
+    parser.add_argument('--out', help='write results JSON here')
+    parser.add_argument('--compare', metavar='BASELINE', help='results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='median slowdown that counts as a regression (default 0.10 = 10%%)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scale = scale_from_args(args)
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, 'bench.db')
+        if not os.path.exists(path):
+            started = time.perf_counter()
+            generate(path, **scale)
+            print(f"generated {path} in {time.perf_counter() - started:.1f}s")
+        results = {
+            'scale': measure_scale(path),
+            'runs': args.runs,
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'results': run_scenarios(path, args.runs, rng),
+        }
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+    elif not args.out:
+        print(text)
+    else:
+        for name, result in results['results'].items():
+            print(f"{name:<28} median {result['median_us']:>10.1f} us  p99 {result['p99_us']:>10.1f} us")
+
+
+if __name__ == '__main__':
+    main()
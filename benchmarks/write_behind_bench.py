@@ -0,0 +1,84 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from functions.database import Database
+from functions.write_behind import WriteBehindQueue, DEFAULT_MAX_BATCH, DEFAULT_MAX_DELAY
+
+# Completions per second from --threads concurrent callers, each completing
+# progression quests for its own player: one commit per call (durable with
+# synchronous FULL, and the NORMAL default) against WriteBehindQueue waiting
+# for each commit and fire-and-forget.
+#
+# Run from the project root: python -m benchmarks.write_behind_bench --threads 32
+
+ITEM = (1, 'progression', 1, 40, 0)
+
+
+def setup(path, players):
+    with Database(path, readers=0) as db:
+        for index in range(players):
+            db.initialize_player_stats(db.create_player(f'bench-{index}'))
+
+
+def run_callers(threads, calls, complete):
+    # complete(player_name) per call; returns completions per second
+    barrier = threading.Barrier(threads + 1)
+
+    def caller(index):
+        barrier.wait()
+        for _ in range(calls):
+            complete(f'bench-{index}')
+
+    workers = [threading.Thread(target=caller, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return threads * calls / (time.perf_counter() - started), started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write-behind group commit benchmark')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--calls', type=int, default=200, help='completions per thread')
+    parser.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument('--max-delay', type=float, default=DEFAULT_MAX_DELAY)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'write_behind.db')
+        setup(path, args.threads)
+        rows = []
+        for synchronous in ('FULL', 'NORMAL'):
+            with Database(path, synchronous=synchronous) as db:
+                rate, _ = run_callers(args.threads, args.calls, lambda player: db.complete_quests(player, [ITEM]))
+                rows.append((f'commit per call ({synchronous})', rate))
+
+        with Database(path) as db:
+            with WriteBehindQueue(db, args.max_batch, args.max_delay) as writer:
+                rate, _ = run_callers(args.threads, args.calls, lambda player: writer.complete_quests(player, [ITEM]))
+                rows.append(('write-behind, wait (FULL)', rate))
+
+                rate, started = run_callers(args.threads, args.calls,
+                                            lambda player: writer.complete_quests(player, [ITEM], wait=False))
+                writer.flush()
+                rows.append(('write-behind, no wait (FULL)', rate))
+                rows.append(('  until flushed', args.threads * args.calls / (time.perf_counter() - started)))
+                stats = writer.stats
+            drift = db.verify_aggregates()
+
+        print(f"{args.threads} threads x {args.calls} completions")
+        print(f"{'mode':<32} {'completions/s':>14}")
+        for name, rate in rows:
+            print(f"{name:<32} {rate:>14.0f}")
+        print(f"{stats['flushes']} flushes, {stats['committed']} committed, {stats['failed']} failed, "
+              f"{len(drift)} drifted aggregate(s)")
+
+
+if __name__ == '__main__':
+    main()
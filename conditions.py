@@ -0,0 +1,111 @@
+from collections import namedtuple
+
+# Declarative conditions for special quests. A special quest with a row in
+# special_quest_conditions (migration 8) is not taken from the menu: it is
+# completed, and its reward granted, by the completion or EXP gain that meets
+# its condition. Kinds:
+#   child_skill_level        a child skill reaches level threshold
+#   life_skill_level         a life skill reaches level threshold
+#   player_level             the player reaches level threshold
+#   child_skill_completions  threshold quests completed for a child skill
+# skill_id names the child or life skill; NULL means any. Conditions are only
+# checked against what changed: a level condition when that level goes up, a
+# completion count when that child skill's count does.
+
+Condition = namedtuple('Condition', ['quest_id', 'kind', 'skill_id', 'threshold'])
+CONDITION_KINDS = ('child_skill_level', 'life_skill_level', 'player_level', 'child_skill_completions')
+
+CONDITIONS_QUERY = 'SELECT quest_id, kind, skill_id, threshold FROM special_quest_conditions ORDER BY quest_id'
+
+# Completions per player and child skill, rebuilt from the archive summary and
+# live history; kept current by Database.complete_quests afterwards
+BACKFILL_COMPLETIONS_QUERY = '''
+    INSERT INTO player_skill_completions (player_id, child_skill_id, completions)
+    SELECT player_id, child_skill_id, SUM(completions) FROM (
+        SELECT player_id, child_skill_id, completions FROM player_quest_daily_summary
+        WHERE child_skill_id != 0
+        UNION ALL
+        SELECT p.id, qr.child_skill_id, 1
+        FROM player_quests pq
+        JOIN (SELECT name, MIN(id) AS id FROM players GROUP BY name) p ON p.name = pq.player_name
+        JOIN quest_rewards qr ON qr.quest_type = pq.quest_type AND qr.quest_id = pq.quest_id
+        WHERE pq.completed = 1
+    )
+    GROUP BY player_id, child_skill_id
+'''
+
+
+class ConditionIndex:
+    # Conditions grouped by what can meet them. Level and completion
+    # conditions are keyed by skill id, with key None holding the "any skill"
+    # ones, so a gain only looks at the conditions on the skills it touched.
+    __slots__ = ('quest_ids', 'child_level', 'life_level', 'player_level', 'completions')
+
+    def __init__(self, conditions=()):
+        self.quest_ids = frozenset(condition.quest_id for condition in conditions)
+        self.child_level = {}
+        self.life_level = {}
+        self.completions = {}
+        player_level = []
+        for condition in conditions:
+            if condition.kind == 'child_skill_level':
+                self.child_level.setdefault(condition.skill_id, []).append(condition)
+            elif condition.kind == 'life_skill_level':
+                self.life_level.setdefault(condition.skill_id, []).append(condition)
+            elif condition.kind == 'player_level':
+                player_level.append(condition)
+            elif condition.kind == 'child_skill_completions':
+                self.completions.setdefault(condition.skill_id, []).append(condition)
+            else:
+                raise ValueError(f"Unknown condition kind: {condition.kind}")
+        self.player_level = tuple(player_level)
+
+    def __len__(self):
+        return len(self.quest_ids)
+
+    def met(self, gains, completion_counts):
+        # Quest ids whose condition is met by gains (SkillExpGain) or by the
+        # new {child_skill_id: completions} counts
+        met = set()
+        for gain in gains:
+            if gain.child_level_diff > 0:
+                for key in (gain.child_skill_id, None):
+                    met.update(condition.quest_id for condition in self.child_level.get(key, ())
+                               if gain.child_skill_level >= condition.threshold)
+            if gain.life_skill_level_diff > 0:
+                for key in (gain.life_skill_id, None):
+                    met.update(condition.quest_id for condition in self.life_level.get(key, ())
+                               if gain.life_skill_level >= condition.threshold)
+            if gain.player_level_diff > 0:
+                met.update(condition.quest_id for condition in self.player_level
+                           if gain.player_level >= condition.threshold)
+        for child_skill_id, completions in completion_counts.items():
+            for key in (child_skill_id, None):
+                met.update(condition.quest_id for condition in self.completions.get(key, ())
+                           if completions >= condition.threshold)
+        return met
+
+
+def load_conditions(conn):
+    return ConditionIndex([Condition(*row) for row in conn.execute(CONDITIONS_QUERY)])
+
+
+def count_completions(cursor, player_id, child_skill_ids):
+    # Adds one completion per entry of child_skill_ids; returns the new
+    # {child_skill_id: completions}
+    added = {}
+    for child_skill_id in child_skill_ids:
+        added[child_skill_id] = added.get(child_skill_id, 0) + 1
+    counts = {}
+    for child_skill_id, count in sorted(added.items()):
+        counts[child_skill_id] = cursor.execute('''
+            INSERT INTO player_skill_completions (player_id, child_skill_id, completions) VALUES (?, ?, ?)
+            ON CONFLICT (player_id, child_skill_id) DO UPDATE SET completions = completions + excluded.completions
+            RETURNING completions
+        ''', (player_id, child_skill_id, count)).fetchone()[0]
+    return counts
+
+
+def backfill_completions(cursor):
+    cursor.execute('DELETE FROM player_skill_completions')
+    return cursor.execute(BACKFILL_COMPLETIONS_QUERY).rowcount
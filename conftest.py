@@ -0,0 +1,3 @@
+# Tests import the project as the functions package, a symlink to this
+# directory; collecting through it would recurse forever
+collect_ignore = ['functions']
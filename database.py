@@ -1,497 +1,757 @@
-import sqlite3
 import datetime
+import heapq
+import itertools
+from collections import namedtuple
+from functions.levels import PLAYER_CURVE, LIFE_SKILL_CURVE, CHILD_SKILL_CURVE
+from functions.levels import CHILD_LEVEL_COINS, LIFE_LEVEL_COINS, PLAYER_LEVEL_COINS
+from functions.pool import ConnectionPool
+from functions.migrations import migrate, seed_quests
+from functions.quest_catalog import QUEST_TYPES, Quest, QuestPage, catalog_version, load_catalog, read_quest_progress
+from functions.quest_catalog import quest_key, quest_page_query
+from functions.streaks import record_check_ins, read_streaks, expire_streaks, backfill_streaks
+from functions.conditions import count_completions, backfill_completions
+from functions.quest_draws import DRAW_SEED, DrawTables, assign_draws, day_key, draw_key, read_weakest_child_skills
+
+# Result of one EXP gain: the first four fields are the level-up deltas and
+# coin balance, the rest are the levels reached after the gain.
+SkillExpGain = namedtuple('SkillExpGain', [
+    'child_level_diff', 'life_skill_level_diff', 'player_level_diff', 'total_coins',
+    'child_skill_id', 'child_skill_level', 'life_skill_id', 'life_skill_level', 'player_level'
+])
+
+# Aggregate drift: stored EXP/level against the values recomputed from the
+# child skills. skill_id is None for rows of the players table.
+AggregateDrift = namedtuple('AggregateDrift', [
+    'table', 'player_id', 'skill_id', 'stored_exp', 'expected_exp', 'stored_level', 'expected_level'
+])
+
+# Each query takes a (first_id, last_id) player id range
+AGGREGATE_DRIFT_QUERIES = [
+    '''
+    SELECT 'player_child_skills', player_id, child_skill_id, exp, exp, level, child_skill_level(exp)
+    FROM player_child_skills
+    WHERE player_id BETWEEN ? AND ? AND level != child_skill_level(exp)
+    ''',
+    '''
+    SELECT 'player_life_skills', player_id, life_skill_id, exp, expected_exp, level, life_skill_level(expected_exp)
+    FROM (
+        SELECT pls.player_id, pls.life_skill_id, pls.exp, pls.level, (
+            SELECT COALESCE(SUM(pcs.exp), 0)
+            FROM player_child_skills pcs
+            JOIN child_skills cs ON pcs.child_skill_id = cs.id
+            WHERE pcs.player_id = pls.player_id AND cs.life_skill_id = pls.life_skill_id
+        ) AS expected_exp
+        FROM player_life_skills pls
+        WHERE pls.player_id BETWEEN ? AND ?
+    )
+    WHERE exp != expected_exp OR level != life_skill_level(expected_exp)
+    ''',
+    '''
+    SELECT 'players', id, NULL, exp, expected_exp, level, player_level(expected_exp)
+    FROM (
+        SELECT p.id, p.exp, p.level, (
+            SELECT COALESCE(SUM(pcs.exp), 0) FROM player_child_skills pcs WHERE pcs.player_id = p.id
+        ) AS expected_exp
+        FROM players p
+        WHERE p.id BETWEEN ? AND ?
+    )
+    WHERE exp != expected_exp OR level != player_level(expected_exp)
+    ''',
+]
+
+AGGREGATE_REBUILD_QUERIES = [
+    '''
+    UPDATE player_child_skills SET level = child_skill_level(exp)
+    WHERE player_id BETWEEN ? AND ?
+    ''',
+    '''
+    UPDATE player_life_skills
+    SET exp = (
+        SELECT COALESCE(SUM(pcs.exp), 0)
+        FROM player_child_skills pcs
+        JOIN child_skills cs ON pcs.child_skill_id = cs.id
+        WHERE pcs.player_id = player_life_skills.player_id AND cs.life_skill_id = player_life_skills.life_skill_id
+    )
+    WHERE player_id BETWEEN ? AND ?
+    ''',
+    '''
+    UPDATE player_life_skills SET level = life_skill_level(exp)
+    WHERE player_id BETWEEN ? AND ?
+    ''',
+    '''
+    UPDATE players
+    SET exp = (SELECT COALESCE(SUM(pcs.exp), 0) FROM player_child_skills pcs WHERE pcs.player_id = players.id)
+    WHERE id BETWEEN ? AND ?
+    ''',
+    '''
+    UPDATE players SET level = player_level(exp)
+    WHERE id BETWEEN ? AND ?
+    ''',
+]
+
+
+def period_starts(now):
+    # Start of the current day, week (Monday) and month as ISO timestamps
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week_start = today - datetime.timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    return today.isoformat(), week_start.isoformat(), month_start.isoformat()
+
+def register_functions(conn):
+    conn.create_function('player_level', 1, PLAYER_CURVE.level, deterministic=True)
+    conn.create_function('life_skill_level', 1, LIFE_SKILL_CURVE.level, deterministic=True)
+    conn.create_function('child_skill_level', 1, CHILD_SKILL_CURVE.level, deterministic=True)
 
 class Database:
-    def __init__(self, db_name):
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
+    # Safe to share between threads: every method takes a connection from the
+    # pool, reads run on reader connections and writes are serialized on the
+    # single writer connection.
+    def __init__(self, db_name, readers=4, synchronous='NORMAL', cache_size=-16000,
+                 mmap_size=256 * 1024 * 1024, busy_timeout=5000):
+        self.pool = ConnectionPool(db_name, readers=readers, synchronous=synchronous, cache_size=cache_size,
+                                   mmap_size=mmap_size, busy_timeout=busy_timeout, setup=register_functions)
+        # The writer connection, for callers that need the raw connection
+        self.conn = self.pool.writer_connection
+        self._players = {}
+        self._catalog = None
+        self._draw_tables = None
+        # Seed of the daily rng quest draws; changing it changes every draw
+        self.draw_seed = DRAW_SEED
+        # Called as listener(player_id, child_skills, life_skills, player_row,
+        # quests_completed) after every committed completion or EXP gain,
+        # with the values _apply_skill_exp wrote
+        self.progress_listeners = []
+        # Called as listener(player_id, awarded) after a commit that completed
+        # special quests by their conditions; awarded holds complete_quests
+        # items
+        self.achievement_listeners = []
+        # Called with no arguments once rebuild_aggregates has committed, for
+        # caches of the aggregates to reload
+        self.rebuild_listeners = []
         self.create_tables()
     
+    def close(self):
+        self.pool.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
     def create_tables(self):
-        # Players table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS players (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                status TEXT DEFAULT 'live',
-                level INTEGER DEFAULT 1,
-                exp INTEGER DEFAULT 0,
-                coins INTEGER DEFAULT 0,
-                quests_completed INTEGER DEFAULT 0
-            )
-        ''')
-        
-        # Check if columns exist in players table
-        self.cursor.execute("PRAGMA table_info(players)")
-        columns = [col[1] for col in self.cursor.fetchall()]
-        if 'level' not in columns:
-            self.cursor.execute('ALTER TABLE players ADD COLUMN level INTEGER DEFAULT 1')
-        if 'exp' not in columns:
-            self.cursor.execute('ALTER TABLE players ADD COLUMN exp INTEGER DEFAULT 0')
-        if 'coins' not in columns:
-            self.cursor.execute('ALTER TABLE players ADD COLUMN coins INTEGER DEFAULT 0')
-        if 'quests_completed' not in columns:
-            self.cursor.execute('ALTER TABLE players ADD COLUMN quests_completed INTEGER DEFAULT 0')
-        
-        # Life Skills table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS life_skills (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                level INTEGER DEFAULT 1,
-                exp INTEGER DEFAULT 0
-            )
-        ''')
-        
-        # Child Skills table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS child_skills (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                life_skill_id INTEGER,
-                level INTEGER DEFAULT 1,
-                exp INTEGER DEFAULT 0,
-                FOREIGN KEY (life_skill_id) REFERENCES life_skills(id)
-            )
-        ''')
-        
-        # Player Stats table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS player_stats (
-                player_name TEXT,
-                life_skill_id INTEGER,
-                child_skill_id INTEGER,
-                FOREIGN KEY (life_skill_id) REFERENCES life_skills(id),
-                FOREIGN KEY (child_skill_id) REFERENCES child_skills(id),
-                FOREIGN KEY (player_name) REFERENCES players(name),
-                UNIQUE(player_name, child_skill_id)
-            )
-        ''')
-        
-        # Daily Quests table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS daily_quests (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                description TEXT,
-                child_skill_id INTEGER,
-                exp_reward INTEGER,
-                coin_reward INTEGER,
-                FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
-            )
-        ''')
-        
-        # Routine Quests table (Weekly/Monthly)
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS routine_quests (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                description TEXT,
-                child_skill_id INTEGER,
-                exp_reward INTEGER,
-                coin_reward INTEGER,
-                reset_period TEXT CHECK (reset_period IN ('weekly', 'monthly')),
-                FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
-            )
-        ''')
-        
-        # Special Quests table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS special_quests (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                description TEXT,
-                child_skill_id INTEGER,
-                exp_reward INTEGER,
-                coin_reward INTEGER,
-                FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
-            )
-        ''')
-        
-        # Progression Quests table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS progression_quests (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                description TEXT,
-                child_skill_id INTEGER,
-                exp_reward INTEGER,
-                coin_reward INTEGER,
-                FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
-            )
-        ''')
-        
-        # Challenge Quests table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS challenge_quests (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                description TEXT,
-                child_skill_id INTEGER,
-                exp_reward INTEGER,
-                coin_reward INTEGER,
-                time_limit TEXT,
-                streak_required INTEGER DEFAULT 0,
-                FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
-            )
-        ''')
-        
-        # RNG Quests table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS rng_quests (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                description TEXT,
-                child_skill_id INTEGER,
-                exp_reward INTEGER,
-                coin_reward INTEGER,
-                FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
-            )
-        ''')
-        
-        # Player Quests table to track completion
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS player_quests (
-                player_name TEXT,
-                quest_id INTEGER,
-                quest_type TEXT CHECK (quest_type IN ('daily', 'routine', 'special', 'progression', 'challenge', 'rng')),
-                completed BOOLEAN DEFAULT 0,
-                completion_date TEXT,
-                streak_count INTEGER DEFAULT 0,
-                FOREIGN KEY (player_name) REFERENCES players(name)
-            )
-        ''')
-        self.conn.commit()
+        # Runs any pending schema migrations; a current database costs one
+        # PRAGMA user_version read
+        self.schema_version = migrate(self.pool)
     
     def initialize_quests(self):
-        # Sample Daily Quests
-        daily_quests = [
-            (1, 'Train Stamina', 'Complete a 20-minute run.', 1, 50, 0),
-            (2, 'Read a Chapter', 'Read one chapter of a book.', 4, 75, 0),
-            (3, 'Practice Discipline', 'Meditate for 10 minutes.', 8, 100, 0)
-        ]
-        
-        # Sample Routine Quests (Weekly/Monthly)
-        routine_quests = [
-            (1, 'Weekly Workout', 'Complete 3 workouts this week.', 11, 150, 10, 'weekly'),
-            (2, 'Monthly Study', 'Finish a course module.', 4, 200, 20, 'monthly')
-        ]
-        
-        # Sample Special Quests
-        special_quests = [
-            (1, 'First Milestone', 'Reach Level 2 in any child skill.', 1, 100, 50),
-            (2, 'Master Focus', 'Complete 5 Focus-related tasks.', 5, 200, 100)
-        ]
-        
-        # Sample Progression Quests
-        progression_quests = [
-            (1, 'Grind Stamina', 'Run for 15 minutes.', 1, 40, 0),
-            (2, 'Study Session', 'Study for 30 minutes.', 4, 60, 0)
-        ]
-        
-        # Sample Challenge Quests
-        challenge_quests = [
-            (1, 'Stamina Streak', 'Run daily for 3 days.', 1, 100, 30, '2025-12-31T23:59:59', 3),
-            (2, 'Focus Challenge', 'Study without distractions for 1 hour.', 5, 120, 40, '2025-12-31T23:59:59', 0)
-        ]
-        
-        # Sample RNG Quests
-        rng_quests = [
-            (1, 'Random Skill Boost', 'Practice a random skill.', 8, 80, 20),
-            (2, 'Mystery Task', 'Complete a surprise task.', 10, 90, 25)
-        ]
-        
-        self.cursor.executemany('INSERT OR IGNORE INTO daily_quests (id, name, description, child_skill_id, exp_reward, coin_reward) VALUES (?, ?, ?, ?, ?, ?)', daily_quests)
-        self.cursor.executemany('INSERT OR IGNORE INTO routine_quests (id, name, description, child_skill_id, exp_reward, coin_reward, reset_period) VALUES (?, ?, ?, ?, ?, ?, ?)', routine_quests)
-        self.cursor.executemany('INSERT OR IGNORE INTO special_quests (id, name, description, child_skill_id, exp_reward, coin_reward) VALUES (?, ?, ?, ?, ?, ?)', special_quests)
-        self.cursor.executemany('INSERT OR IGNORE INTO progression_quests (id, name, description, child_skill_id, exp_reward, coin_reward) VALUES (?, ?, ?, ?, ?, ?)', progression_quests)
-        self.cursor.executemany('INSERT OR IGNORE INTO challenge_quests (id, name, description, child_skill_id, exp_reward, coin_reward, time_limit, streak_required) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', challenge_quests)
-        self.cursor.executemany('INSERT OR IGNORE INTO rng_quests (id, name, description, child_skill_id, exp_reward, coin_reward) VALUES (?, ?, ?, ?, ?, ?)', rng_quests)
-        self.conn.commit()
+        with self.pool.write() as conn:
+            seed_quests(conn.cursor())
     
     def create_player(self, name):
-        self.cursor.execute('INSERT INTO players (name, status, level, exp, coins, quests_completed) VALUES (?, ?, ?, ?, ?, ?)', 
-                          (name, 'live', 1, 0, 0, 0))
-        self.conn.commit()
-    
-    def get_player(self):
-        self.cursor.execute('SELECT * FROM players LIMIT 1')
-        return self.cursor.fetchone()
-    
-    def initialize_player_stats(self, player_name):
-        # Define Life Skills and Child Skills
-        life_skills = [
-            (1, 'Agility'),
-            (2, 'Intellect'),
-            (3, 'Soul'),
-            (4, 'Strength')
-        ]
-        
-        child_skills = [
-            (1, 'Stamina', 1),
-            (2, 'Mobility', 1),
-            (3, 'Balance', 1),
-            (4, 'Reading', 2),
-            (5, 'Focus', 2),
-            (6, 'Language Learning', 2),
-            (7, 'Critical Thinking', 2),
-            (8, 'Discipline', 3),
-            (9, 'Practice', 3),
-            (10, 'Reflection', 3),
-            (11, 'Weight Training', 4),
-            (12, 'Core', 4),
-            (13, 'Endurance', 4)
-        ]
-        
-        # Insert Life Skills
-        self.cursor.executemany('INSERT OR IGNORE INTO life_skills (id, name, level, exp) VALUES (?, ?, 1, 0)', life_skills)
-        
-        # Insert Child Skills
-        self.cursor.executemany('INSERT OR IGNORE INTO child_skills (id, name, life_skill_id, level, exp) VALUES (?, ?, ?, 1, 0)', child_skills)
-        
-        # Clear existing player_stats entries to avoid duplicates
-        self.cursor.execute('DELETE FROM player_stats WHERE player_name = ?', (player_name,))
-        
-        # Initialize Player Stats
-        for cs in child_skills:
-            self.cursor.execute('''
+        # Names are unique (migration 11): quest rows are keyed by name
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1 FROM players WHERE name = ?', (name,))
+            if cursor.fetchone() is not None:
+                raise ValueError(f"Player already exists: {name}")
+            cursor.execute('INSERT INTO players (name, status, level, exp, coins, quests_completed) VALUES (?, ?, ?, ?, ?, ?)', 
+                              (name, 'live', 1, 0, 0, 0))
+            return cursor.lastrowid
+    
+    # Methods taking `player` accept either a player id or a player name.
+    
+    def get_player(self, player=None):
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            if player is None:
+                cursor.execute('SELECT * FROM players ORDER BY id LIMIT 1')
+            elif isinstance(player, str):
+                cursor.execute('SELECT * FROM players WHERE name = ? ORDER BY id LIMIT 1', (player,))
+            else:
+                cursor.execute('SELECT * FROM players WHERE id = ?', (player,))
+            return cursor.fetchone()
+    
+    def get_player_id(self, player):
+        return self.resolve_player(player)[0]
+    
+    def resolve_player(self, player):
+        # (player_id, player_name), cached since players are never renamed
+        if player not in self._players:
+            player_row = self.get_player(player)
+            if player_row is None:
+                raise ValueError(f"Unknown player: {player}")
+            self._players[player_row[0]] = self._players[player_row[1]] = (player_row[0], player_row[1])
+        return self._players[player]
+    
+    def _player_name(self, player):
+        return player if isinstance(player, str) else self.resolve_player(player)[1]
+    
+    def initialize_player_stats(self, player):
+        # The skill and quest catalog is seeded by the schema migrations
+        player_id, player_name = self.resolve_player(player)
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            # Initialize Player Stats
+            cursor.execute('''
                 INSERT OR IGNORE INTO player_stats (player_name, life_skill_id, child_skill_id)
-                VALUES (?, ?, ?)
-            ''', (player_name, cs[2], cs[0]))
-        
-        # Initialize quests
-        self.initialize_quests()
-        self.conn.commit()
-    
-    def assign_daily_quests(self, player_name):
-        current_date = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-        self.cursor.execute('''
-            SELECT COUNT(*) FROM player_quests
-            WHERE player_name = ? AND quest_type = 'daily'
-            AND completion_date >= ?
-        ''', (player_name, current_date))
-        daily_quest_count = self.cursor.fetchone()[0]
-        
-        if daily_quest_count == 0:
-            self.cursor.execute('SELECT id, child_skill_id, exp_reward, coin_reward FROM daily_quests')
-            daily_quests = self.cursor.fetchall()
-            for quest in daily_quests:
-                quest_id, child_skill_id, exp_reward, coin_reward = quest
-                self.cursor.execute('''
-                    INSERT OR REPLACE INTO player_quests (player_name, quest_id, quest_type, completed, completion_date, streak_count)
-                    VALUES (?, ?, 'daily', 0, ?, 0)
-                ''', (player_name, quest_id, current_date))
-            self.conn.commit()
-    
-    def reset_daily_quests(self, player_name):
-        current_date = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-        yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-        
-        # Mark uncompleted daily quests from yesterday as failed
-        self.cursor.execute('''
-            UPDATE player_quests
-            SET completed = 0
-            WHERE player_name = ? AND quest_type = 'daily'
-            AND completion_date < ? AND completed = 0
-        ''', (player_name, current_date))
-        
-        # Remove old daily quest assignments
-        self.cursor.execute('''
-            DELETE FROM player_quests
-            WHERE player_name = ? AND quest_type = 'daily'
-            AND completion_date < ?
-        ''', (player_name, current_date))
-        
-        # Assign new daily quests
-        self.assign_daily_quests(player_name)
-        self.conn.commit()
-    
-    def get_player_stats(self, player_name):
-        self.cursor.execute('''
-            SELECT ls.name, ls.level, ls.exp, cs.name, cs.level, cs.exp
-            FROM player_stats ps
-            JOIN life_skills ls ON ps.life_skill_id = ls.id
-            JOIN child_skills cs ON ps.child_skill_id = cs.id
-            WHERE ps.player_name = ?
-            ORDER BY ls.id, cs.id
-        ''', (player_name,))
-        return self.cursor.fetchall()
-    
-    def get_player_level(self, player_name):
-        self.cursor.execute('SELECT level, exp, coins, quests_completed FROM players WHERE name = ?', (player_name,))
-        return self.cursor.fetchone()
-    
-    def get_available_quests(self, player_name):
-        current_time = datetime.datetime.now().isoformat()
-        quests = []
-        
-        # Daily Quests (assigned automatically, shown if not completed today)
-        self.cursor.execute('''
-            SELECT dq.id, dq.name, dq.description, dq.child_skill_id, dq.exp_reward, dq.coin_reward
-            FROM daily_quests dq
-            JOIN player_quests pq ON dq.id = pq.quest_id
-            WHERE pq.player_name = ? AND pq.quest_type = 'daily'
-            AND pq.completed = 0 AND pq.completion_date >= ?
-        ''', (player_name, datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).isoformat()))
-        quests.extend([(row[0], row[1], row[2], row[3], row[4], row[5], 'daily') for row in self.cursor.fetchall()])
-        
-        # Routine Quests (reset weekly/monthly)
-        self.cursor.execute('''
-            SELECT id, name, description, child_skill_id, exp_reward, coin_reward, reset_period
-            FROM routine_quests
-            WHERE id NOT IN (
-                SELECT quest_id FROM player_quests
-                WHERE player_name = ? AND quest_type = 'routine'
-                AND (
-                    (reset_period = 'weekly' AND completion_date >= ?)
-                    OR (reset_period = 'monthly' AND completion_date >= ?)
-                )
-            )
-        ''', (player_name, 
-              (datetime.datetime.now() - datetime.timedelta(days=datetime.datetime.now().weekday())).replace(hour=0, minute=0, second=0, microsecond=0).isoformat(),
-              datetime.datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0).isoformat()))
-        quests.extend([(row[0], row[1], row[2], row[3], row[4], row[5], 'routine', row[6]) for row in self.cursor.fetchall()])
-        
-        # Special Quests (one-time, check if not completed)
-        self.cursor.execute('''
-            SELECT id, name, description, child_skill_id, exp_reward, coin_reward
-            FROM special_quests
-            WHERE id NOT IN (
-                SELECT quest_id FROM player_quests
-                WHERE player_name = ? AND quest_type = 'special' AND completed = 1
-            )
-        ''', (player_name,))
-        quests.extend([(row[0], row[1], row[2], row[3], row[4], row[5], 'special') for row in self.cursor.fetchall()])
-        
-        # Progression Quests (always available)
-        self.cursor.execute('SELECT id, name, description, child_skill_id, exp_reward, coin_reward FROM progression_quests')
-        quests.extend([(row[0], row[1], row[2], row[3], row[4], row[5], 'progression') for row in self.cursor.fetchall()])
-        
-        # Challenge Quests (check time limit and streak)
-        self.cursor.execute('''
-            SELECT id, name, description, child_skill_id, exp_reward, coin_reward, time_limit, streak_required
-            FROM challenge_quests
-            WHERE time_limit > ? AND id NOT IN (
+                SELECT ?, life_skill_id, id FROM child_skills
+            ''', (player_name,))
+            
+            # Start the player's own progression, keeping any existing progress
+            cursor.execute('''
+                INSERT OR IGNORE INTO player_child_skills (player_id, child_skill_id, level, exp)
+                SELECT ?, id, 1, 0 FROM child_skills
+            ''', (player_id,))
+            cursor.execute('''
+                INSERT OR IGNORE INTO player_life_skills (player_id, life_skill_id, level, exp)
+                SELECT ?, id, 1, 0 FROM life_skills
+            ''', (player_id,))
+    
+    def assign_daily_quests(self, player):
+        player_id, player_name = self.resolve_player(player)
+        current_date = period_starts(datetime.datetime.now())[0]
+        with self.pool.write() as conn:
+            # Today's row per daily quest and rng draw; already assigned or
+            # completed quests keep their row
+            conn.execute('''
+                INSERT OR IGNORE INTO player_quests (player_name, quest_id, quest_type, completed, completion_date, streak_count)
+                SELECT ?, id, 'daily', 0, ?, 0 FROM daily_quests
+            ''', (player_name, current_date))
+            assign_draws(conn.cursor(), self._current_draw_tables(conn), self.draw_seed, current_date, player_id, player_id)
+    
+    def reset_daily_quests(self, player):
+        player_id, player_name = self.resolve_player(player)
+        current_date = period_starts(datetime.datetime.now())[0]
+        
+        with self.pool.write() as conn:
+            # Break challenge streaks missed yesterday, as the rollover does
+            expire_streaks(conn.cursor(), current_date, player_id, player_id)
+            
+            # Remove old unfinished daily assignments and rng draws;
+            # completed ones stay as history
+            conn.execute('''
+                DELETE FROM player_quests
+                WHERE player_name = ? AND quest_type = 'daily' AND completed = 0
+                AND completion_date < ?
+            ''', (player_name, current_date))
+            conn.execute('''
+                DELETE FROM player_quests
+                WHERE player_name = ? AND quest_type = 'rng' AND completed = 0
+                AND completion_date < ?
+            ''', (player_name, current_date))
+            
+            # Assign new daily quests
+            self.assign_daily_quests(player_name)
+    
+    def rollover_daily_quests(self, now=None, chunk_size=10000):
+        # Daily reset and assignment for every player, a chunk of player ids
+        # per transaction so the write lock is released between chunks; the
+        # day's rng draws are made and stored in the same pass.
+        # Safe to re-run: a second run on the same day changes nothing.
+        now = now or datetime.datetime.now()
+        today, week_start, month_start = period_starts(now)
+        summary = {
+            'date': today,
+            'removed': 0,
+            'assigned': 0,
+            # Routine availability is derived from these period starts, so a
+            # new week or month needs no rows rewritten
+            'weekly_reset': today == week_start,
+            'monthly_reset': today == month_start,
+            'streaks_expired': 0,
+            'rng_assigned': 0,
+        }
+        for first_id, last_id in self._player_id_chunks(chunk_size):
+            with self.pool.write() as conn:
+                # Unfinished dailies and draws of earlier days lapse;
+                # completed ones stay as history
+                summary['removed'] += conn.execute('''
+                    DELETE FROM player_quests
+                    WHERE quest_type = 'rng' AND completed = 0 AND completion_date < ?
+                    AND player_name IN (SELECT name FROM players WHERE id BETWEEN ? AND ?)
+                ''', (today, first_id, last_id)).rowcount
+                summary['removed'] += conn.execute('''
+                    DELETE FROM player_quests
+                    WHERE quest_type = 'daily' AND completed = 0 AND completion_date < ?
+                    AND player_name IN (SELECT name FROM players WHERE id BETWEEN ? AND ?)
+                ''', (today, first_id, last_id)).rowcount
+                summary['assigned'] += conn.execute('''
+                    INSERT OR IGNORE INTO player_quests (player_name, quest_id, quest_type, completed, completion_date, streak_count)
+                    SELECT p.name, dq.id, 'daily', 0, ?, 0
+                    FROM players p CROSS JOIN daily_quests dq
+                    WHERE p.id BETWEEN ? AND ?
+                ''', (today, first_id, last_id)).rowcount
+                summary['streaks_expired'] += expire_streaks(conn.cursor(), today, first_id, last_id)
+                summary['rng_assigned'] += assign_draws(conn.cursor(), self._current_draw_tables(conn), self.draw_seed,
+                                                        today, first_id, last_id)
+        return summary
+    
+    def get_player_stats(self, player):
+        player_id = self.get_player_id(player)
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT ls.name, pls.level, pls.exp, cs.name, pcs.level, pcs.exp
+                FROM player_child_skills pcs
+                JOIN child_skills cs ON pcs.child_skill_id = cs.id
+                JOIN life_skills ls ON cs.life_skill_id = ls.id
+                JOIN player_life_skills pls ON pls.player_id = pcs.player_id AND pls.life_skill_id = ls.id
+                WHERE pcs.player_id = ?
+                ORDER BY ls.id, cs.id
+            ''', (player_id,))
+            return cursor.fetchall()
+    
+    def get_life_skill_states(self, player):
+        player_id = self.get_player_id(player)
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT pls.life_skill_id, ls.name, pls.level, pls.exp
+                FROM player_life_skills pls
+                JOIN life_skills ls ON pls.life_skill_id = ls.id
+                WHERE pls.player_id = ?
+                ORDER BY ls.id
+            ''', (player_id,))
+            return cursor.fetchall()
+    
+    def get_child_skill_states(self, player):
+        player_id = self.get_player_id(player)
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT pcs.child_skill_id, cs.name, cs.life_skill_id, pcs.level, pcs.exp
+                FROM player_child_skills pcs
+                JOIN child_skills cs ON pcs.child_skill_id = cs.id
+                WHERE pcs.player_id = ?
+                ORDER BY cs.life_skill_id, cs.id
+            ''', (player_id,))
+            return cursor.fetchall()
+    
+    def get_data_version(self):
+        # Changes when another connection commits. Writes made through this
+        # Database share the writer connection and leave it unchanged.
+        with self.pool.write(transaction=False) as conn:
+            return conn.execute('PRAGMA data_version').fetchone()[0]
+    
+    def get_player_level(self, player):
+        player_id = self.get_player_id(player)
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT level, exp, coins, quests_completed FROM players WHERE id = ?', (player_id,))
+            return cursor.fetchone()
+    
+    def get_catalog(self):
+        with self.pool.read() as conn:
+            return self._current_catalog(conn)
+    
+    def _current_catalog(self, conn):
+        # The cached QuestCatalog, reloaded only when catalog_version moved
+        catalog = self._catalog
+        if catalog is None or catalog.version != catalog_version(conn):
+            catalog = self._catalog = load_catalog(conn)
+        return catalog
+    
+    def _current_draw_tables(self, conn):
+        # The rng alias tables, rebuilt only when the rng quests themselves
+        # changed, not on every catalog reload
+        rng_quests = self._current_catalog(conn).by_type['rng']
+        tables = self._draw_tables
+        if tables is None or tables.quests is not rng_quests:
+            if tables is None or tables.quests != rng_quests:
+                tables = self._draw_tables = DrawTables(rng_quests)
+            else:
+                tables.quests = rng_quests
+        return tables
+    
+    def draw_rng_quests(self, player, day=None):
+        # The player's rng draw for day (YYYY-MM-DD, default today): the one
+        # stored when the day was assigned, otherwise drawn from the current
+        # skills and catalog without storing it
+        player_id, player_name = self.resolve_player(player)
+        day = day or period_starts(datetime.datetime.now())[0]
+        with self.pool.read() as conn:
+            tables = self._current_draw_tables(conn)
+            stored = conn.execute('''
                 SELECT quest_id FROM player_quests
-                WHERE player_name = ? AND quest_type = 'challenge' AND completed = 1
-            )
-        ''', (current_time, player_name))
-        quests.extend([(row[0], row[1], row[2], row[3], row[4], row[5], 'challenge', row[6], row[7]) for row in self.cursor.fetchall()])
-        
-        # RNG Quests (simplified as one-time for now)
-        self.cursor.execute('''
-            SELECT id, name, description, child_skill_id, exp_reward, coin_reward
-            FROM rng_quests
-            WHERE id NOT IN (
+                WHERE player_name = ? AND quest_type = 'rng' AND completion_date = ?
+                ORDER BY rowid
+            ''', (player_name, day[:10] + 'T00:00:00')).fetchall()
+            if stored:
+                quests = {quest.id: quest for quest in tables.quests}
+                return [quests[quest_id] for quest_id, in stored if quest_id in quests]
+            weakest = read_weakest_child_skills(conn, tables, player_id, player_id)[0][2]
+        return tables.draw(draw_key(day_key(self.draw_seed, day), player_id), weakest)
+    
+    def get_available_quests(self, player):
+        # Only the player's quest rows for the current periods are read from
+        # SQLite; they are joined against the cached catalog in memory. An
+        # unknown player is an error, not the unclaimed catalog.
+        player_name = self.resolve_player(player)[1]
+        now = datetime.datetime.now()
+        today, week_start, month_start = period_starts(now)
+        with self.pool.read() as conn:
+            catalog = self._current_catalog(conn)
+            progress = read_quest_progress(conn, player_name, today, week_start, month_start)
+        return catalog.available_quests(progress, now.isoformat(), week_start, month_start)
+    
+    def iter_quests(self, quest_types=QUEST_TYPES, child_skill_id=None, exp_range=None, coin_range=None,
+                    order='type', descending=False, after=None, batch_size=100):
+        # Catalog quests matching the filters in order, optionally starting
+        # past the quest_key after. Each type is read batch_size rows at a
+        # time, a reader connection held only for the page query, and the
+        # types are merged lazily, so memory stays at one batch per type.
+        for quest_type in quest_types:
+            if quest_type not in QUEST_TYPES:
+                raise ValueError(f"Unknown quest type: {quest_type}")
+        after = tuple(after) if after is not None else None
+        types = [self._iter_quest_type(quest_type, order, descending, after, child_skill_id, exp_range, coin_range,
+                                       batch_size) for quest_type in QUEST_TYPES if quest_type in quest_types]
+        return heapq.merge(*types, key=lambda quest: quest_key(quest, order), reverse=descending)
+    
+    def _iter_quest_type(self, quest_type, order, descending, after, child_skill_id, exp_range, coin_range, batch_size):
+        while True:
+            query = quest_page_query(quest_type, order, descending, after, child_skill_id, exp_range, coin_range)
+            if query is None:
+                return
+            sql, params = query
+            with self.pool.read() as conn:
+                quests = [Quest._make(row) for row in conn.execute(sql, (*params, batch_size))]
+            yield from quests
+            if len(quests) < batch_size:
+                return
+            after = quest_key(quests[-1], order)
+    
+    def list_quests(self, page_size=50, after=None, **filters):
+        # One page of iter_quests and the key to pass as after for the next,
+        # None on the last page
+        quests = list(itertools.islice(self.iter_quests(after=after, batch_size=page_size + 1, **filters), page_size + 1))
+        if len(quests) <= page_size:
+            return QuestPage(quests, None)
+        return QuestPage(quests[:page_size], quest_key(quests[page_size - 1], filters.get('order', 'type')))
+    
+    def complete_quest(self, player, quest_id, quest_type, child_skill_id, exp_reward, coin_reward, state=None):
+        return self.complete_quests(player, [(quest_id, quest_type, child_skill_id, exp_reward, coin_reward)], state)[0]
+    
+    def complete_quests(self, player, items, state=None):
+        # items: (quest_id, quest_type, child_skill_id, exp_reward, coin_reward[, completion_date])
+        # EXP, levels, coins, the player_quests rows and quests_completed are
+        # all written in one transaction; returns one SkillExpGain per item.
+        # A PlayerState passed as state is read instead of SQLite and updated
+        # once the transaction has committed.
+        items = list(items)
+        if not items:
+            return []
+        player_id, player_name = self.resolve_player(player)
+        now = datetime.datetime.now()
+        rows = []
+        for index, item in enumerate(items):
+            if len(item) > 5:
+                completion_date = datetime.datetime.fromisoformat(item[5])
+            else:
+                # Keep completions in one batch on distinct keys
+                completion_date = now + datetime.timedelta(microseconds=index)
+            if item[1] in ('daily', 'rng'):
+                # Daily and rng rows are keyed by day, replacing that day's
+                # assignment
+                completion_date = completion_date.replace(hour=0, minute=0, second=0, microsecond=0)
+            rows.append([player_name, item[0], item[1], 1, completion_date.isoformat(), 1])
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            catalog = self._current_catalog(conn)
+            for item in items:
+                if item[1] == 'special' and item[0] in catalog.conditions.quest_ids:
+                    raise ValueError(f"Special quest {item[0]} is completed by its condition")
+            # Challenge completions are streak check-ins; only the one that
+            # completes the challenge counts and earns its reward
+            exp_gains = [(item[2], item[3], item[4]) for item in items]
+            # Daily and rng quests complete once per day: a repeat within the
+            # batch or of a day already completed changes nothing, like a
+            # repeated check-in
+            for index in self._repeated_day_completions(cursor, player_name, rows):
+                rows[index] = None
+                exp_gains[index] = (items[index][2], 0, 0)
+            check_ins = [index for index, item in enumerate(items) if item[1] == 'challenge']
+            if check_ins:
+                results = record_check_ins(cursor, player_id, catalog,
+                                           [(items[index][0], rows[index][4]) for index in check_ins])
+                for index, result in zip(check_ins, results):
+                    if result is None:
+                        rows[index] = None
+                    else:
+                        rows[index][3] = int(result[1])
+                        rows[index][5] = result[0]
+                    if result is None or not result[1]:
+                        exp_gains[index] = (items[index][2], 0, 0)
+            completed_items = [item for item, row in zip(items, rows) if row is not None and row[3]]
+            rows = [row for row in rows if row is not None]
+            gains, updated = self._apply_skill_exp(cursor, player_id, exp_gains, len(completed_items), state)
+            cursor.executemany('''
+                INSERT OR REPLACE INTO player_quests (player_name, quest_id, quest_type, completed, completion_date, streak_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            awarded, updated = self._award_special_quests(cursor, catalog, player_id, player_name, now, gains,
+                                                          [item[2] for item in completed_items], updated)
+        self._notify(player_id, updated, completed_items + awarded, awarded, state)
+        return gains
+    
+    def _repeated_day_completions(self, cursor, player_name, rows):
+        # Indexes of the daily and rng rows whose (type, id, day) is already
+        # completed, in player_quests or earlier in rows
+        day_rows = [index for index, row in enumerate(rows) if row[2] in ('daily', 'rng')]
+        if not day_rows:
+            return []
+        days = sorted({rows[index][4] for index in day_rows})
+        cursor.execute(f'''
+            SELECT quest_type, quest_id, completion_date FROM player_quests
+            WHERE player_name = ? AND quest_type IN ('daily', 'rng') AND completed = 1
+            AND completion_date IN ({', '.join('?' * len(days))})
+        ''', (player_name, *days))
+        done = set(cursor.fetchall())
+        repeated = []
+        for index in day_rows:
+            key = (rows[index][2], rows[index][1], rows[index][4])
+            if key in done:
+                repeated.append(index)
+            done.add(key)
+        return repeated
+    
+    def _notify(self, player_id, updated, completed_items, awarded, state):
+        # The PlayerState, then the listeners, once the outermost write has
+        # committed: inside a write-behind flush or a batch that is later,
+        # and a rollback never reaches them
+        def notify():
+            if state is not None:
+                state.apply(*updated, completed_items)
+            for listener in self.progress_listeners:
+                listener(player_id, *updated, len(completed_items))
+            if awarded:
+                for listener in self.achievement_listeners:
+                    listener(player_id, awarded)
+        self.pool.after_commit(notify)
+    
+    def _award_special_quests(self, cursor, catalog, player_id, player_name, now, gains, completed_child_skill_ids, updated):
+        # Completes the special quests whose conditions this transaction met,
+        # checking only the conditions indexed under the skills that gained a
+        # level or a completion. Rewards can meet further conditions, so this
+        # repeats until nothing new is met. Returns the awarded items and the
+        # (child_skills, life_skills, player_row) state after their rewards.
+        conditions = catalog.conditions
+        awarded = []
+        counts = count_completions(cursor, player_id, completed_child_skill_ids)
+        while conditions:
+            quest_ids = sorted(conditions.met(gains, counts) - {item[0] for item in awarded})
+            if not quest_ids:
+                break
+            cursor.execute(f'''
                 SELECT quest_id FROM player_quests
-                WHERE player_name = ? AND quest_type = 'rng' AND completed = 1
-            )
-        ''', (player_name,))
-        quests.extend([(row[0], row[1], row[2], row[3], row[4], row[5], 'rng') for row in self.cursor.fetchall()])
-        
-        return quests
-    
-    def complete_quest(self, player_name, quest_id, quest_type, child_skill_id, exp_reward, coin_reward):
-        self.update_skill_exp(player_name, child_skill_id, exp_reward, coin_reward)
-        self.cursor.execute('''
-            INSERT OR REPLACE INTO player_quests (player_name, quest_id, quest_type, completed, completion_date, streak_count)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (player_name, quest_id, quest_type, 1, datetime.datetime.now().isoformat(), 1))
-        self.cursor.execute('''
+                WHERE player_name = ? AND quest_type = 'special' AND completed = 1 AND quest_id IN ({', '.join('?' * len(quest_ids))})
+            ''', (player_name, *quest_ids))
+            done = {row[0] for row in cursor.fetchall()}
+            new_items = []
+            for quest_id in quest_ids:
+                quest = catalog.get('special', quest_id)
+                if quest is not None and quest_id not in done:
+                    new_items.append((quest_id, 'special', quest.child_skill_id, quest.exp_reward, quest.coin_reward))
+            if not new_items:
+                break
+            cursor.executemany('''
+                INSERT OR REPLACE INTO player_quests (player_name, quest_id, quest_type, completed, completion_date, streak_count)
+                VALUES (?, ?, 'special', 1, ?, 1)
+            ''', [(player_name, item[0], now.isoformat()) for item in new_items])
+            # Read back through the cursor, which sees this transaction's
+            # writes, and merged into the state already updated
+            gains, reward_state = self._apply_skill_exp(cursor, player_id, [item[2:] for item in new_items], len(new_items))
+            updated = ({**updated[0], **reward_state[0]}, {**updated[1], **reward_state[1]}, reward_state[2])
+            counts = count_completions(cursor, player_id, [item[2] for item in new_items])
+            awarded.extend(new_items)
+        return awarded, updated
+    
+    def get_streaks(self, player):
+        # {quest_id: StreakState} of the player's challenge streaks
+        player_id = self.get_player_id(player)
+        with self.pool.read() as conn:
+            return read_streaks(conn, player_id)
+    
+    def backfill_streaks(self, now=None):
+        # Rebuilds every challenge streak from player_quests history in one
+        # windowed query; returns the number of streaks written. Migration 7
+        # runs this once; it is only needed again after history was edited.
+        today = period_starts(now or datetime.datetime.now())[0]
+        with self.pool.write() as conn:
+            return backfill_streaks(conn.cursor(), today)
+    
+    def backfill_completion_counts(self):
+        # Rebuilds player_skill_completions from archived and live history;
+        # migration 8 runs this once
+        with self.pool.write() as conn:
+            return backfill_completions(conn.cursor())
+    
+    def update_skill_exp(self, player, child_skill_id, exp_gained, quest_coins, state=None):
+        player_id, player_name = self.resolve_player(player)
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            gains, updated = self._apply_skill_exp(cursor, player_id, [(child_skill_id, exp_gained, quest_coins)], 0, state)
+            awarded, updated = self._award_special_quests(cursor, self._current_catalog(conn), player_id, player_name,
+                                                          datetime.datetime.now(), gains, [], updated)
+        self._notify(player_id, updated, awarded, awarded, state)
+        return gains[0]
+    
+    def _apply_skill_exp(self, cursor, player_id, exp_gains, quests_completed=0, state=None):
+        # Applies (child_skill_id, exp_gained, quest_coins) gains in order
+        # without committing. Life skill and player EXP are kept as running
+        # totals and moved by each gain, so only the touched child skills,
+        # their life skills and the player row are read and written.
+        # Returns the gains and the updated (child_skills, life_skills,
+        # player_row) state.
+        child_skill_ids = sorted({gain[0] for gain in exp_gains})
+        # Inside a longer write the PlayerState has not caught up with the
+        # earlier calls yet, as it is only updated on commit
+        if state is not None and self.pool.write_depth() == 1:
+            child_skills, life_skills, player_row = state.skill_exp_rows(child_skill_ids)
+        else:
+            child_skills, life_skills, player_row = self._read_skill_exp_rows(cursor, player_id, child_skill_ids)
+        total_exp, player_level, coins = player_row
+        
+        gains = []
+        for child_skill_id, exp_gained, quest_coins in exp_gains:
+            child_skill = child_skills[child_skill_id]
+            life_skill_id, current_exp, current_level = child_skill
+            
+            # Update child skill EXP and level
+            new_exp = current_exp + exp_gained
+            new_level = self.calculate_child_skill_level(new_exp)
+            child_level_diff = new_level - current_level
+            child_skill[1] = new_exp
+            child_skill[2] = new_level
+            
+            # Update life skill EXP and level
+            life_skill = life_skills[life_skill_id]
+            life_skill_exp = life_skill[0] + exp_gained
+            life_skill_level = self.calculate_life_skill_level(life_skill_exp)
+            life_skill_level_diff = life_skill_level - self.calculate_life_skill_level(life_skill_exp - exp_gained)
+            life_skill[0] = life_skill_exp
+            life_skill[1] = life_skill_level
+            
+            # Update player EXP, level, and coins
+            total_exp += exp_gained
+            new_player_level = self.calculate_player_level(total_exp)
+            player_level_diff = new_player_level - player_level
+            player_level = new_player_level
+            coins += (child_level_diff * CHILD_LEVEL_COINS + life_skill_level_diff * LIFE_LEVEL_COINS
+                      + player_level_diff * PLAYER_LEVEL_COINS + quest_coins)
+            
+            gains.append(SkillExpGain(child_level_diff, life_skill_level_diff, player_level_diff, coins,
+                                      child_skill_id, new_level, life_skill_id, life_skill_level, player_level))
+        
+        cursor.executemany('UPDATE player_child_skills SET exp = ?, level = ? WHERE player_id = ? AND child_skill_id = ?',
+                                [(exp, level, player_id, i) for i, (_, exp, level) in child_skills.items()])
+        cursor.executemany('UPDATE player_life_skills SET exp = ?, level = ? WHERE player_id = ? AND life_skill_id = ?',
+                                [(exp, level, player_id, i) for i, (exp, level) in life_skills.items()])
+        cursor.execute('''
             UPDATE players
-            SET quests_completed = quests_completed + 1
-            WHERE name = ?
-        ''', (player_name,))
-        self.conn.commit()
-    
-    def update_skill_exp(self, player_name, child_skill_id, exp_gained, quest_coins):
-        # Update child skill EXP and level
-        self.cursor.execute('SELECT exp, level FROM child_skills WHERE id = ?', (child_skill_id,))
-        current_exp, current_level = self.cursor.fetchone()
-        new_exp = current_exp + exp_gained
-        new_level = self.calculate_child_skill_level(new_exp)
-        child_level_diff = new_level - current_level
-        
-        self.cursor.execute('''
-            UPDATE child_skills
-            SET exp = ?, level = ?
+            SET exp = ?, level = ?, coins = ?, quests_completed = quests_completed + ?
             WHERE id = ?
-        ''', (new_exp, new_level, child_skill_id))
-        
-        # Update life skill EXP and level
-        self.cursor.execute('''
-            SELECT SUM(exp), SUM(level)
-            FROM child_skills
-            WHERE life_skill_id = (SELECT life_skill_id FROM child_skills WHERE id = ?)
-        ''', (child_skill_id,))
-        life_skill_exp, life_skill_level = self.cursor.fetchone()
-        
-        self.cursor.execute('''
-            UPDATE life_skills
-            SET exp = ?, level = ?
-            WHERE id = (SELECT life_skill_id FROM child_skills WHERE id = ?)
-        ''', (life_skill_exp, self.calculate_life_skill_level(life_skill_exp), child_skill_id))
-        
-        # Update player EXP, level, and coins
-        self.cursor.execute('SELECT SUM(exp) FROM life_skills')
-        total_exp = self.cursor.fetchone()[0]
-        player_level = self.calculate_player_level(total_exp)
-        
-        self.cursor.execute('SELECT level, coins FROM players WHERE name = ?', (player_name,))
-        current_player_level, current_coins = self.cursor.fetchone()
-        player_level_diff = player_level - current_player_level
-        
-        # Calculate life skill level difference
-        prev_life_skill_exp = life_skill_exp - exp_gained
-        life_skill_level_diff = self.calculate_life_skill_level(life_skill_exp) - self.calculate_life_skill_level(prev_life_skill_exp)
-        
-        # Calculate total coins from level-ups and quest
-        total_coins = current_coins + (child_level_diff * 20) + (life_skill_level_diff * 50) + (player_level_diff * 100) + quest_coins
-        
-        self.cursor.execute('''
-            UPDATE players
-            SET exp = ?, level = ?, coins = ?
-            WHERE name = ?
-        ''', (total_exp, player_level, total_coins, player_name))
-        
-        self.conn.commit()
-        return child_level_diff, life_skill_level_diff, player_level_diff, total_coins
+        ''', (total_exp, player_level, coins, quests_completed, player_id))
+        return gains, (child_skills, life_skills, (total_exp, player_level, coins))
+    
+    def _read_skill_exp_rows(self, cursor, player_id, child_skill_ids):
+        cursor.execute(f'''
+            SELECT pcs.child_skill_id, cs.life_skill_id, pcs.exp, pcs.level
+            FROM player_child_skills pcs
+            JOIN child_skills cs ON pcs.child_skill_id = cs.id
+            WHERE pcs.player_id = ? AND pcs.child_skill_id IN ({', '.join('?' * len(child_skill_ids))})
+        ''', (player_id, *child_skill_ids))
+        child_skills = {row[0]: [row[1], row[2], row[3]] for row in cursor.fetchall()}
+        for child_skill_id in child_skill_ids:
+            if child_skill_id not in child_skills:
+                raise ValueError(f"Unknown child skill id: {child_skill_id}")
+        life_skill_ids = sorted({child_skill[0] for child_skill in child_skills.values()})
+        cursor.execute(f'''
+            SELECT life_skill_id, exp, level FROM player_life_skills
+            WHERE player_id = ? AND life_skill_id IN ({', '.join('?' * len(life_skill_ids))})
+        ''', (player_id, *life_skill_ids))
+        life_skills = {row[0]: [row[1], row[2]] for row in cursor.fetchall()}
+        cursor.execute('SELECT exp, level, coins FROM players WHERE id = ?', (player_id,))
+        return child_skills, life_skills, cursor.fetchone()
+    
+    def get_quest_history(self, player, start=None, end=None):
+        # (quest_id, quest_type, completed, completion_date, streak_count) for
+        # completions in [start, end), ISO timestamps, from player_quests and
+        # the monthly archive tables written by archive.QuestArchiver
+        player_name = self._player_name(player)
+        start = start or ''
+        end = end or '9999'
+        with self.pool.read() as conn:
+            tables = ['player_quests'] + [row[0] for row in conn.execute('''
+                SELECT table_name FROM player_quest_archives WHERE month >= substr(?, 1, 7) AND month <= substr(?, 1, 7)
+                ORDER BY month
+            ''', (start, end))]
+            history = []
+            for table in tables:
+                history.extend(conn.execute(f'''
+                    SELECT quest_id, quest_type, completed, completion_date, streak_count FROM {table}
+                    WHERE player_name = ? AND completion_date >= ? AND completion_date < ?
+                ''', (player_name, start, end)))
+        history.sort(key=lambda row: row[3])
+        return history
+    
+    def get_completion_summary(self, player, first_day, last_day):
+        # (day, child_skill_id, completions, exp) per day from first_day to
+        # last_day inclusive (YYYY-MM-DD), over archived and live history
+        player_id, player_name = self.resolve_player(player)
+        with self.pool.read() as conn:
+            return conn.execute('''
+                SELECT day, child_skill_id, SUM(completions), SUM(exp) FROM (
+                    SELECT day, child_skill_id, completions, exp FROM player_quest_daily_summary
+                    WHERE player_id = :player_id AND day BETWEEN :first_day AND :last_day
+                    UNION ALL
+                    SELECT substr(pq.completion_date, 1, 10), COALESCE(qr.child_skill_id, 0), 1, COALESCE(qr.exp_reward, 0)
+                    FROM player_quests pq
+                    LEFT JOIN quest_rewards qr ON qr.quest_type = pq.quest_type AND qr.quest_id = pq.quest_id
+                    WHERE pq.player_name = :player_name AND pq.completed = 1
+                    AND pq.completion_date >= :first_day AND pq.completion_date < date(:last_day, '+1 day')
+                )
+                GROUP BY day, child_skill_id
+                ORDER BY day, child_skill_id
+            ''', {'player_id': player_id, 'player_name': player_name, 'first_day': first_day, 'last_day': last_day}).fetchall()
+    
+    def verify_aggregates(self, chunk_size=10000):
+        # Recompute every level and every life skill/player EXP total from the
+        # child skills and report where the stored values have drifted
+        drift = []
+        for first_id, last_id in self._player_id_chunks(chunk_size):
+            with self.pool.read() as conn:
+                for query in AGGREGATE_DRIFT_QUERIES:
+                    drift.extend(AggregateDrift(*row) for row in conn.execute(query, (first_id, last_id)))
+        return drift
+    
+    def rebuild_aggregates(self, chunk_size=10000):
+        # Rewrite the aggregates from scratch, one chunk of players per
+        # transaction so live writers are not locked out for long. Returns the
+        # drift that was found and repaired.
+        drift = self.verify_aggregates(chunk_size)
+        for first_id, last_id in self._player_id_chunks(chunk_size):
+            with self.pool.write() as conn:
+                for query in AGGREGATE_REBUILD_QUERIES:
+                    conn.execute(query, (first_id, last_id))
+        for listener in self.rebuild_listeners:
+            self.pool.after_commit(listener)
+        return drift
+    
+    def _player_id_chunks(self, chunk_size):
+        with self.pool.read() as conn:
+            first_id, last_id = conn.execute('SELECT MIN(id), MAX(id) FROM players').fetchone()
+        if first_id is None:
+            return
+        for chunk_start in range(first_id, last_id + 1, chunk_size):
+            yield chunk_start, min(chunk_start + chunk_size - 1, last_id)
     
     def calculate_player_level(self, total_exp):
-        if total_exp < 500:
-            return 1
-        level = 1
-        exp_needed = 500
-        current_exp = total_exp
-        while current_exp >= exp_needed:
-            level += 1
-            current_exp -= exp_needed
-            exp_needed = 500 + (exp_needed * 0.5)
-        return level
+        return PLAYER_CURVE.level(total_exp)
     
     def calculate_life_skill_level(self, total_exp):
-        if total_exp < 350:
-            return 1
-        level = 1
-        exp_needed = 350
-        current_exp = total_exp
-        while current_exp >= exp_needed:
-            level += 1
-            current_exp -= exp_needed
-            exp_needed = 350 + (exp_needed * 0.25)
-        return level
+        return LIFE_SKILL_CURVE.level(total_exp)
     
     def calculate_child_skill_level(self, total_exp):
-        if total_exp < 100:
-            return 1
-        level = 1
-        exp_needed = 100
-        current_exp = total_exp
-        while current_exp >= exp_needed:
-            level += 1
-            current_exp -= exp_needed
-            exp_needed = 100 + (exp_needed * 0.5)
-        return level
-    
-    def __del__(self):
-        self.conn.close()
\ No newline at end of file
+        return CHILD_SKILL_CURVE.level(total_exp)
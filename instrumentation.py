@@ -0,0 +1,295 @@
+import bisect
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+# Opt-in profiling for Database and Stats. Nothing here runs unless
+# Instrumentation.instrument() is called: it wraps the listed methods on that
+# one instance and installs sqlite3 trace and progress callbacks on the
+# pool's connections, so an uninstrumented Database pays nothing.
+#
+#   instrumentation = Instrumentation()
+#   instrumentation.instrument(db)
+#   ...
+#   print(instrumentation.summary())
+#
+# SQLite does not report rows read per statement, so work is measured in
+# virtual machine instructions counted by the progress handler (every
+# PROGRESS_STEPS instructions), which tracks rows scanned closely.
+
+DATABASE_METHODS = (
+    'get_player', 'create_player', 'initialize_player_stats', 'assign_daily_quests', 'reset_daily_quests',
+    'rollover_daily_quests', 'get_player_stats', 'get_life_skill_states', 'get_child_skill_states',
+    'get_data_version', 'get_player_level', 'get_catalog', 'list_quests', 'get_available_quests', 'draw_rng_quests',
+    'complete_quest', 'complete_quests', 'update_skill_exp', 'get_streaks', 'verify_aggregates',
+    'rebuild_aggregates',
+)
+STATS_METHODS = ('gain_exp', 'complete_quest', 'complete_quests', 'display_stats')
+
+# Upper bounds in seconds of the latency histogram buckets; the last bucket
+# is unbounded
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROGRESS_STEPS = 100
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    # Statements are grouped with their literal values replaced by ?
+    sql = _LITERALS.sub('?', sql)
+    sql = _IN_LISTS.sub('(?, ...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of samples
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'max': self.max,
+            'buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], self.counts)),
+        }
+
+
+class Metric:
+    # Calls, statements run and VM instructions, plus a latency histogram,
+    # for one method or one normalized SQL statement. A method's queries and
+    # VM instructions include those of the instrumented methods it calls.
+    __slots__ = ('calls', 'queries', 'vm_steps', 'latency')
+
+    def __init__(self):
+        self.calls = 0
+        self.queries = 0
+        self.vm_steps = 0
+        self.latency = Histogram()
+
+    def to_dict(self):
+        return {'calls': self.calls, 'queries': self.queries, 'vm_steps': self.vm_steps, 'latency': self.latency.to_dict()}
+
+
+class Instrumentation:
+    def __init__(self):
+        self.methods = {}
+        self.statements = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._installed = []
+
+    def instrument(self, target):
+        # target is a Database or a Stats; returns it for chaining
+        if hasattr(target, 'pool'):
+            prefix, names = 'Database', DATABASE_METHODS
+            # Reader connections opened later are traced too
+            target.pool.add_hook(self._trace)
+        else:
+            prefix, names = type(target).__name__, STATS_METHODS
+        for name in names:
+            method = getattr(target, name, None)
+            if method is not None:
+                setattr(target, name, self._timed(f'{prefix}.{name}', method))
+        self._installed.append((target, names))
+        return target
+
+    def uninstrument(self):
+        for target, names in self._installed:
+            for name in names:
+                target.__dict__.pop(name, None)
+            if hasattr(target, 'pool'):
+                target.pool.remove_hook(self._trace)
+                for conn in target.pool.connections():
+                    conn.set_trace_callback(None)
+                    conn.set_progress_handler(None, PROGRESS_STEPS)
+        self._installed = []
+
+    def _trace(self, conn):
+        conn.set_trace_callback(self._on_statement)
+        conn.set_progress_handler(self._on_progress, PROGRESS_STEPS)
+
+    def _metric(self, table, key):
+        metric = table.get(key)
+        if metric is None:
+            with self._lock:
+                metric = table.setdefault(key, Metric())
+        return metric
+
+    def _timed(self, key, method):
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            stack = self._stack()
+            metric = self._metric(self.methods, key)
+            stack.append(metric)
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._finish_statement()
+                elapsed = time.perf_counter() - started
+                stack.pop()
+                with self._lock:
+                    metric.calls += 1
+                    metric.latency.record(elapsed)
+        return timed
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+            self._local.statement = None
+        return stack
+
+    def _on_statement(self, sql):
+        # A statement starts; the previous one on this thread has finished.
+        # Its latency runs from this call to the next statement or the end
+        # of the enclosing method, so it includes fetching the rows.
+        stack = self._stack()
+        self._finish_statement()
+        metric = self._metric(self.statements, normalize_sql(sql))
+        with self._lock:
+            metric.calls += 1
+            metric.queries += 1
+            for method_metric in stack:
+                method_metric.queries += 1
+        self._local.statement = (metric, time.perf_counter())
+
+    def _on_progress(self):
+        statement = getattr(self._local, 'statement', None)
+        stack = getattr(self._local, 'stack', None)
+        with self._lock:
+            if statement is not None:
+                statement[0].vm_steps += PROGRESS_STEPS
+            for method_metric in stack or ():
+                method_metric.vm_steps += PROGRESS_STEPS
+        return 0
+
+    def _finish_statement(self):
+        statement = getattr(self._local, 'statement', None)
+        if statement is not None:
+            self._local.statement = None
+            elapsed = time.perf_counter() - statement[1]
+            with self._lock:
+                statement[0].latency.record(elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'started': self.started,
+                'time': time.time(),
+                'methods': {key: metric.to_dict() for key, metric in self.methods.items()},
+                'statements': {key: metric.to_dict() for key, metric in self.statements.items()},
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        # Prometheus text exposition format
+        lines = []
+        snapshot = self.snapshot()
+        for kind, label in (('methods', 'method'), ('statements', 'sql')):
+            name = f'liferpg_{kind[:-1]}'
+            lines.append(f'# TYPE {name}_calls_total counter')
+            lines.append(f'# TYPE {name}_queries_total counter')
+            lines.append(f'# TYPE {name}_vm_steps_total counter')
+            lines.append(f'# TYPE {name}_seconds histogram')
+            for key, metric in sorted(snapshot[kind].items()):
+                escaped = key.replace('\\', '\\\\').replace('"', '\\"')
+                tag = f'{label}="{escaped}"'
+                lines.append(f'{name}_calls_total{{{tag}}} {metric["calls"]}')
+                lines.append(f'{name}_queries_total{{{tag}}} {metric["queries"]}')
+                lines.append(f'{name}_vm_steps_total{{{tag}}} {metric["vm_steps"]}')
+                cumulative = 0
+                for bound, count in metric['latency']['buckets'].items():
+                    cumulative += count
+                    lines.append(f'{name}_seconds_bucket{{{tag},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_seconds_sum{{{tag}}} {metric["latency"]["sum"]}')
+                lines.append(f'{name}_seconds_count{{{tag}}} {metric["latency"]["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        # .prom files get the Prometheus format, anything else JSON. Written
+        # through a temporary file so readers never see a partial snapshot.
+        text = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def summary(self, limit=10):
+        with self._lock:
+            methods = sorted(self.methods.items(), key=lambda item: -item[1].latency.total)
+            statements = sorted(self.statements.items(), key=lambda item: -item[1].latency.total)
+        header = f"{'calls':>7} {'queries':>8} {'vm steps':>10} {'total ms':>10} {'avg ms':>8} {'p99 ms':>8}"
+        lines = [f"{'method':<40} {header}"]
+        for key, metric in methods:
+            lines.append(self._summary_line(key, metric))
+        lines.append('')
+        lines.append(f"{'statement':<40} {header}")
+        for key, metric in statements[:limit]:
+            lines.append(self._summary_line(key if len(key) <= 40 else key[:37] + '...', metric))
+        if len(statements) > limit:
+            lines.append(f"... {len(statements) - limit} more statements")
+        return '\n'.join(lines)
+
+    def _summary_line(self, key, metric):
+        latency = metric.latency
+        average = latency.total / latency.count if latency.count else 0.0
+        return (f"{key:<40} {metric.calls:>7} {metric.queries:>8} {metric.vm_steps:>10} "
+                f"{latency.total * 1e3:>10.2f} {average * 1e3:>8.3f} {latency.percentile(0.99) * 1e3:>8.3f}")
+
+
+class SnapshotExporter:
+    # Background thread writing Instrumentation.write(path) every interval
+    # seconds and once more on stop()
+    def __init__(self, instrumentation, path, interval=60.0):
+        self.instrumentation = instrumentation
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-export', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._thread.join(timeout)
+        self.instrumentation.write(self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.instrumentation.write(self.path)
@@ -0,0 +1,289 @@
+import bisect
+import threading
+from array import array
+
+# In-memory leaderboards by player EXP, by each life skill's EXP and by
+# quests completed. Loaded from SQLite once, then kept current by the
+# completion path (Database.progress_listeners) and reloaded after
+# rebuild_aggregates or when another connection has committed, checked
+# before each query.
+#
+# Every board is a RankedList of integer keys that sort best-first: the score
+# negated in the high bits and the player id in the low 32 bits, so equal
+# scores are ordered by player id. Top-N, rank and neighbour queries cost
+# O(log n) plus the entries returned.
+
+PLAYER_BOARD = 'player'
+QUESTS_BOARD = 'quests_completed'
+
+# Keys and player ids are split at this bit
+_ID_BITS = 32
+_ID_MASK = (1 << _ID_BITS) - 1
+
+
+def life_skill_board(life_skill_id):
+    return f'life_skill:{life_skill_id}'
+
+
+def board_key(score, player_id):
+    return (-score << _ID_BITS) | player_id
+
+
+def split_key(key):
+    # (score, player_id)
+    return -(key >> _ID_BITS), key & _ID_MASK
+
+
+class RankedList:
+    # Sorted list of ints with positional access. Keys live in sorted buckets
+    # of about LOAD keys; a Fenwick tree over the bucket sizes turns a
+    # position into a bucket and back in O(log buckets).
+    LOAD = 1000
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._buckets = [keys[i:i + self.LOAD] for i in range(0, len(keys), self.LOAD)]
+        self._len = len(keys)
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        tree = [0] + [len(bucket) for bucket in self._buckets]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, bucket_index, delta):
+        i = bucket_index + 1
+        tree = self._tree
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _tree_prefix(self, bucket_index):
+        # Keys in buckets before bucket_index
+        total = 0
+        i = bucket_index
+        tree = self._tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _tree_locate(self, position):
+        # (bucket_index, offset) of the key at position
+        bucket_index = 0
+        step = 1 << (len(self._tree).bit_length() - 1)
+        tree = self._tree
+        while step:
+            next_index = bucket_index + step
+            if next_index < len(tree) and tree[next_index] <= position:
+                bucket_index = next_index
+                position -= tree[next_index]
+            step >>= 1
+        return bucket_index, position
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._len = 1
+            self._rebuild_index()
+            return
+        bucket_index = min(bisect.bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[bucket_index]
+        bisect.insort(bucket, key)
+        self._len += 1
+        if len(bucket) > 2 * self.LOAD:
+            self._buckets[bucket_index:bucket_index + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self._rebuild_index()
+        else:
+            self._maxes[bucket_index] = bucket[-1]
+            self._tree_add(bucket_index, 1)
+
+    def remove(self, key):
+        bucket_index = bisect.bisect_left(self._maxes, key)
+        if bucket_index < len(self._buckets):
+            bucket = self._buckets[bucket_index]
+            offset = bisect.bisect_left(bucket, key)
+            if offset < len(bucket) and bucket[offset] == key:
+                del bucket[offset]
+                self._len -= 1
+                if not bucket:
+                    del self._buckets[bucket_index]
+                    self._rebuild_index()
+                else:
+                    self._maxes[bucket_index] = bucket[-1]
+                    self._tree_add(bucket_index, -1)
+                return
+        raise KeyError(key)
+
+    def bisect_left(self, key):
+        # Number of keys smaller than key
+        bucket_index = bisect.bisect_left(self._maxes, key)
+        if bucket_index == len(self._buckets):
+            return self._len
+        return self._tree_prefix(bucket_index) + bisect.bisect_left(self._buckets[bucket_index], key)
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += self._len
+        if not 0 <= position < self._len:
+            raise IndexError(position)
+        bucket_index, offset = self._tree_locate(position)
+        return self._buckets[bucket_index][offset]
+
+    def slice(self, start, stop):
+        start = max(start, 0)
+        stop = min(stop, self._len)
+        keys = []
+        if start >= stop:
+            return keys
+        bucket_index, offset = self._tree_locate(start)
+        while len(keys) < stop - start:
+            bucket = self._buckets[bucket_index]
+            keys.extend(bucket[offset:offset + stop - start - len(keys)])
+            bucket_index += 1
+            offset = 0
+        return keys
+
+
+class Leaderboard:
+    # Entries are (rank, player_id, player_name, score). Players with equal
+    # scores share a rank and are listed by player id.
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.RLock()
+        self.reload()
+        db.progress_listeners.append(self.apply_progress)
+        db.rebuild_listeners.append(self.reload)
+
+    def close(self):
+        self.db.progress_listeners.remove(self.apply_progress)
+        self.db.rebuild_listeners.remove(self.reload)
+
+    def reload(self):
+        with self._lock:
+            self.data_version = self.db.get_data_version()
+            with self.db.pool.read() as conn:
+                life_skill_ids = [row[0] for row in conn.execute('SELECT id FROM life_skills ORDER BY id')]
+                self.boards = {}
+                # Scores per board indexed by player id, to find a player's
+                # current key when the score changes
+                self.scores = {}
+                self._load(conn, PLAYER_BOARD, 'SELECT id, exp FROM players')
+                self._load(conn, QUESTS_BOARD, 'SELECT id, quests_completed FROM players')
+                for life_skill_id in life_skill_ids:
+                    self._load(conn, life_skill_board(life_skill_id),
+                               'SELECT player_id, exp FROM player_life_skills WHERE life_skill_id = ?', (life_skill_id,))
+
+    def _load(self, conn, board, query, params=()):
+        rows = conn.execute(query, params).fetchall()
+        scores = array('q', [-1]) * (max((row[0] for row in rows), default=0) + 1)
+        for player_id, score in rows:
+            scores[player_id] = score or 0
+        self.scores[board] = scores
+        self.boards[board] = RankedList([board_key(score or 0, player_id) for player_id, score in rows])
+
+    def refresh(self):
+        # Reload when another connection has committed since the last load
+        if self.db.get_data_version() != self.data_version:
+            self.reload()
+
+    def set_score(self, board, player_id, score):
+        with self._lock:
+            scores = self.scores[board]
+            ranked = self.boards[board]
+            if player_id < len(scores) and scores[player_id] >= 0:
+                if scores[player_id] == score:
+                    return
+                ranked.remove(board_key(scores[player_id], player_id))
+            elif player_id >= len(scores):
+                scores.extend([-1] * (player_id + 1 - len(scores)))
+            scores[player_id] = score
+            ranked.add(board_key(score, player_id))
+
+    def apply_progress(self, player_id, child_skills, life_skills, player_row, quests_completed):
+        # Database.progress_listeners callback, run after each committed
+        # completion or EXP gain
+        with self._lock:
+            self.set_score(PLAYER_BOARD, player_id, player_row[0])
+            for life_skill_id, (exp, _) in life_skills.items():
+                board = life_skill_board(life_skill_id)
+                if board in self.boards:
+                    self.set_score(board, player_id, exp)
+            if quests_completed:
+                scores = self.scores[QUESTS_BOARD]
+                current = scores[player_id] if player_id < len(scores) and scores[player_id] >= 0 else 0
+                self.set_score(QUESTS_BOARD, player_id, current + quests_completed)
+
+    def _score(self, board, player_id):
+        scores = self.scores[board]
+        if player_id >= len(scores) or scores[player_id] < 0:
+            self._load_player(player_id)
+        return scores[player_id]
+
+    def _load_player(self, player_id):
+        # A player created since the last load, with no progress yet
+        with self.db.pool.read() as conn:
+            row = conn.execute('SELECT exp, quests_completed FROM players WHERE id = ?', (player_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"Unknown player: {player_id}")
+            life_skills = conn.execute('SELECT life_skill_id, exp FROM player_life_skills WHERE player_id = ?',
+                                       (player_id,)).fetchall()
+        self.set_score(PLAYER_BOARD, player_id, row[0] or 0)
+        self.set_score(QUESTS_BOARD, player_id, row[1] or 0)
+        for life_skill_id, exp in life_skills:
+            if life_skill_board(life_skill_id) in self.boards:
+                self.set_score(life_skill_board(life_skill_id), player_id, exp or 0)
+        for board, scores in self.scores.items():
+            if player_id >= len(scores) or scores[player_id] < 0:
+                self.set_score(board, player_id, 0)
+
+    def _entries(self, board, keys):
+        # Called with the lock held; names are read after it is released
+        ranked = self.boards[board]
+        entries = []
+        for key in keys:
+            score, player_id = split_key(key)
+            entries.append((ranked.bisect_left(board_key(score, 0)) + 1, player_id, score))
+        return entries
+
+    def _named(self, entries):
+        names = self._names([entry[1] for entry in entries])
+        return [(rank, player_id, names.get(player_id), score) for rank, player_id, score in entries]
+
+    def _names(self, player_ids):
+        if not player_ids:
+            return {}
+        with self.db.pool.read() as conn:
+            return dict(conn.execute(f'SELECT id, name FROM players WHERE id IN ({", ".join("?" * len(player_ids))})',
+                                     player_ids).fetchall())
+
+    def top(self, board, n=10):
+        self.refresh()
+        with self._lock:
+            entries = self._entries(board, self.boards[board].slice(0, n))
+        return self._named(entries)
+
+    def rank(self, board, player):
+        # (rank, score) of one player
+        player_id = self.db.get_player_id(player)
+        self.refresh()
+        with self._lock:
+            score = self._score(board, player_id)
+            return self.boards[board].bisect_left(board_key(score, 0)) + 1, score
+
+    def around(self, board, player, n=5):
+        # The player's entry with up to n entries on either side
+        player_id = self.db.get_player_id(player)
+        self.refresh()
+        with self._lock:
+            ranked = self.boards[board]
+            position = ranked.bisect_left(board_key(self._score(board, player_id), player_id))
+            entries = self._entries(board, ranked.slice(position - n, position + n + 1))
+        return self._named(entries)
@@ -0,0 +1,98 @@
+import bisect
+import math
+from fractions import Fraction
+
+
+class LevelCurve:
+    # Level curve where reaching the next level costs `base` EXP and every
+    # following level costs `base + previous_cost * factor`. Cumulative EXP
+    # thresholds are precomputed (and extended on demand) so a level lookup
+    # is a single bisect instead of a walk over every level.
+    def __init__(self, base, factor):
+        self.base = base
+        self.factor = factor
+        # thresholds[i] is the smallest whole EXP total that reaches level i + 2
+        self.thresholds = []
+        self._exp_needed = base
+        self._exact_total = Fraction(0)
+        self._array = None
+        self._extend(base)
+
+    def level(self, total_exp):
+        if type(total_exp) is not int and not float(total_exp).is_integer():
+            return self.loop_level(total_exp)
+        if total_exp >= self.thresholds[-1]:
+            self._extend(total_exp)
+        return bisect.bisect_right(self.thresholds, total_exp) + 1
+
+    def levels(self, exp_values):
+        # Vectorized lookup for a NumPy array (or any array-like) of EXP totals
+        import numpy as np
+
+        exp_values = np.asarray(exp_values)
+        if exp_values.size == 0:
+            return np.ones(exp_values.shape, dtype=np.int64)
+        if exp_values.dtype.kind == 'f' and not np.array_equal(exp_values, np.floor(exp_values)):
+            return np.frompyfunc(self.level, 1, 1)(exp_values).astype(np.int64)
+        highest = exp_values.max()
+        if highest >= self.thresholds[-1]:
+            self._extend(int(highest))
+        if self._array is None:
+            self._array = np.array(self.thresholds, dtype=np.int64)
+        return np.searchsorted(self._array, exp_values, side='right').astype(np.int64) + 1
+
+    def threshold(self, level):
+        # Smallest total EXP at which `level` is reached
+        if level <= 1:
+            return 0
+        while len(self.thresholds) < level - 1:
+            self._extend(self.thresholds[-1])
+        return self.thresholds[level - 2]
+
+    def loop_level(self, total_exp):
+        # Reference implementation: the original per-level loop
+        if total_exp < self.base:
+            return 1
+        level = 1
+        exp_needed = self.base
+        current_exp = total_exp
+        while current_exp >= exp_needed:
+            level += 1
+            current_exp -= exp_needed
+            next_needed = self.base + (exp_needed * self.factor)
+            if next_needed == exp_needed and float(exp_needed).is_integer() and abs(current_exp) < 2 ** 53:
+                # The cost has settled on a whole number, so every further
+                # subtraction is exact and the remaining levels can be counted
+                # in one step without changing the result.
+                return level + int(Fraction(current_exp) // int(exp_needed))
+            exp_needed = next_needed
+        return level
+
+    def _extend(self, total_exp):
+        # Append thresholds until one lies above total_exp. The float loop
+        # only drifts from the exact cumulative sum by rounding, so the
+        # candidate threshold is checked against loop_level whenever the
+        # exact sum is close enough to a whole number for that to matter.
+        while not self.thresholds or self.thresholds[-1] <= total_exp:
+            target_level = len(self.thresholds) + 2
+            self._exact_total += Fraction(self._exp_needed)
+            candidate = math.ceil(self._exact_total)
+            distance = min(self._exact_total - math.floor(self._exact_total), candidate - self._exact_total)
+            if distance <= 2 * target_level * math.ulp(float(candidate)):
+                while candidate > 0 and self.loop_level(candidate - 1) >= target_level:
+                    candidate -= 1
+                while self.loop_level(candidate) < target_level:
+                    candidate += 1
+            self.thresholds.append(candidate)
+            self._exp_needed = self.base + (self._exp_needed * self.factor)
+        self._array = None
+
+
+PLAYER_CURVE = LevelCurve(500, 0.5)
+LIFE_SKILL_CURVE = LevelCurve(350, 0.25)
+CHILD_SKILL_CURVE = LevelCurve(100, 0.5)
+
+# Coins awarded per level gained
+CHILD_LEVEL_COINS = 20
+LIFE_LEVEL_COINS = 50
+PLAYER_LEVEL_COINS = 100
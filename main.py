@@ -1,16 +1,26 @@
 import sqlite3
 import os
+import sys
+import json
+import argparse
 from functions.database import Database
 from functions.player import Player
 from functions.stats import Stats
+from functions.player_state import PlayerState
+from functions.instrumentation import Instrumentation
+from functions.archive import QuestArchiver, RetentionPolicy, DEFAULT_RETENTION
+from functions.streaks import streak_goal
+from functions.batch import DEFAULT_BATCH_SIZE, open_commands, run_batches
 
-def initialize_game():
+def initialize_game(instrumentation=None):
     # Create functions directory if it doesn't exist
     if not os.path.exists('functions'):
         os.makedirs('functions')
     
     # Initialize database
     db = Database('liferpg.db')
+    if instrumentation is not None:
+        instrumentation.instrument(db)
     
     # Check if player exists
     player_data = db.get_player()
@@ -37,28 +47,56 @@ def initialize_game():
     
     return player, db
 
-def main():
-    player, db = initialize_game()
-    stats = Stats(player.name, db)
+def main(profile=False, profile_out=None, batch=None, batch_size=DEFAULT_BATCH_SIZE, player=None):
+    instrumentation = Instrumentation() if profile or profile_out else None
+    try:
+        if batch is not None:
+            run_batch_mode(batch, batch_size, player, instrumentation)
+        else:
+            play(instrumentation)
+    finally:
+        if instrumentation is not None:
+            if profile:
+                # Batch mode keeps stdout for its JSON results
+                print(f"\n{instrumentation.summary()}", file=sys.stderr if batch is not None else sys.stdout)
+            if profile_out:
+                instrumentation.write(profile_out)
+
+def play(instrumentation=None):
+    player, db = initialize_game(instrumentation)
+    
+    def announce_achievements(player_id, awarded):
+        # Special quests completed by their conditions
+        catalog = db.get_catalog()
+        for item in awarded:
+            print(f"\nAchievement unlocked: {catalog.get('special', item[0])[1]} ({item[3]} EXP, {item[4]} Coins)!")
+    
+    db.achievement_listeners.append(announce_achievements)
+    state = PlayerState(db, player.name)
+    stats = Stats(player.name, db, state)
+    if instrumentation is not None:
+        instrumentation.instrument(stats)
     print(f"Player Status: {player.status}")
     stats.display_stats()
     
     # Quest loop
     while True:
-        quests = db.get_available_quests(player.name)
+        state.refresh()
+        quests = state.get_available_quests()
         if not quests:
             print("\nNo quests available!")
             break
         
+        streaks = db.get_streaks(player.name) if any(quest.quest_type == 'challenge' for quest in quests) else {}
         print("\nAvailable Quests:")
         for i, quest in enumerate(quests, 1):
-            quest_type = quest[6]
             extra_info = ''
-            if quest_type == 'routine':
-                extra_info = f" ({quest[7]})"
-            elif quest_type == 'challenge':
-                extra_info = f" (Time Limit: {quest[7]}, Streak: {quest[8]})"
-            print(f"{i}. {quest[1]} ({quest[4]} EXP, {quest[5]} Coins){extra_info}")
+            if quest.quest_type == 'routine':
+                extra_info = f" ({quest.reset_period})"
+            elif quest.quest_type == 'challenge':
+                streak = streaks.get(quest.id)
+                extra_info = f" (Time Limit: {quest.time_limit}, Streak: {streak.current_streak if streak else 0}/{streak_goal(quest)})"
+            print(f"{i}. {quest.name} ({quest.exp_reward} EXP, {quest.coin_reward} Coins){extra_info}")
         
         choice = input(f"Choose a quest (1-{len(quests)} or {len(quests)+1} to Exit): ").strip()
         try:
@@ -67,15 +105,77 @@ def main():
                 break
             if 1 <= choice <= len(quests):
                 quest = quests[choice - 1]
-                quest_id, name, description, child_skill_id, exp_reward, coin_reward, quest_type = quest[:7]
-                stats.complete_quest(quest_id, quest_type, child_skill_id, exp_reward, coin_reward)
-                print(f"\nCompleted quest: {name}")
+                stats.complete_quest(quest.id, quest.quest_type, quest.child_skill_id, quest.exp_reward, quest.coin_reward)
+                streak = db.get_streaks(player.name).get(quest.id) if quest.quest_type == 'challenge' else None
+                if streak is not None and streak.completed_at is None:
+                    print(f"\nChecked in for {quest.name}: streak {streak.current_streak}/{streak_goal(quest)}")
+                else:
+                    print(f"\nCompleted quest: {quest.name}")
             else:
                 print("Invalid choice. Try again.")
         except ValueError:
             print("Invalid input. Enter a number.")
         
         stats.display_stats()
+    
+    db.close()
+
+def run_batch_mode(path, batch_size, player=None, instrumentation=None):
+    # Commands from path ('-' for stdin), JSON results on stdout and a
+    # summary on stderr
+    with Database('liferpg.db') as db:
+        if instrumentation is not None:
+            instrumentation.instrument(db)
+        commands = open_commands(path)
+        try:
+            summary = run_batches(db, commands, sys.stdout, batch_size, player)
+        finally:
+            if commands is not sys.stdin:
+                commands.close()
+    print(json.dumps(summary), file=sys.stderr)
+
+def check_aggregates(rebuild):
+    with Database('liferpg.db') as db:
+        drift = db.rebuild_aggregates() if rebuild else db.verify_aggregates()
+    for row in drift:
+        skill = f" skill {row.skill_id}" if row.skill_id is not None else ''
+        print(f"{row.table} player {row.player_id}{skill}: EXP {row.stored_exp} (expected {row.expected_exp}), "
+              f"Level {row.stored_level} (expected {row.expected_level})")
+    print(f"{len(drift)} drifted aggregate(s) {'rebuilt' if rebuild else 'found'}.")
+
+def archive_history(keep_months):
+    with Database('liferpg.db') as db:
+        summary = QuestArchiver(db, RetentionPolicy(keep_months, DEFAULT_RETENTION.quest_types)).run()
+    for month, count in sorted(summary['months'].items()):
+        print(f"{month}: {count} row(s) archived")
+    print(f"{summary['archived']} quest history row(s) before {summary['cutoff']} archived.")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='LifeRPG')
+    parser.add_argument('--verify-aggregates', action='store_true',
+                        help='recompute skill and player totals and report drift')
+    parser.add_argument('--rebuild-aggregates', action='store_true',
+                        help='recompute skill and player totals and repair drift')
+    parser.add_argument('--archive-history', action='store_true',
+                        help='move completed quest history past the retention window into monthly archives')
+    parser.add_argument('--keep-months', type=int, default=DEFAULT_RETENTION.keep_months,
+                        help='months of quest history kept live by --archive-history')
+    parser.add_argument('--batch', metavar='PATH',
+                        help="run JSON commands from PATH ('-' for stdin) without prompting and print JSON results")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='commands per transaction in --batch mode')
+    parser.add_argument('--player', help='player for --batch commands that do not name one')
+    parser.add_argument('--profile', action='store_true',
+                        help='time database calls and SQL statements and print a summary on exit')
+    parser.add_argument('--profile-out', metavar='PATH',
+                        help='write the profile to PATH on exit (Prometheus text for .prom, otherwise JSON)')
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.verify_aggregates or args.rebuild_aggregates:
+        check_aggregates(args.rebuild_aggregates)
+    elif args.archive_history:
+        archive_history(args.keep_months)
+    else:
+        main(args.profile, args.profile_out, args.batch, args.batch_size, args.player)
\ No newline at end of file
@@ -0,0 +1,534 @@
+# Schema migrations keyed on PRAGMA user_version. Each migration runs once, in
+# order, and bumps user_version in the same transaction, so a database that is
+# already current costs one pragma read to open. Append new migrations to
+# MIGRATIONS; never renumber or edit one that has shipped.
+#
+# Databases created before versioning report user_version 0. Their tables
+# already exist, which is why the early migrations are written to be safe on
+# top of an existing schema.
+
+import datetime
+from functions.streaks import backfill_streaks
+from functions.conditions import CONDITION_KINDS, backfill_completions
+
+# Life skills, child skills and sample quests seeded into the catalog
+LIFE_SKILLS = [
+    (1, 'Agility'),
+    (2, 'Intellect'),
+    (3, 'Soul'),
+    (4, 'Strength')
+]
+
+CHILD_SKILLS = [
+    (1, 'Stamina', 1),
+    (2, 'Mobility', 1),
+    (3, 'Balance', 1),
+    (4, 'Reading', 2),
+    (5, 'Focus', 2),
+    (6, 'Language Learning', 2),
+    (7, 'Critical Thinking', 2),
+    (8, 'Discipline', 3),
+    (9, 'Practice', 3),
+    (10, 'Reflection', 3),
+    (11, 'Weight Training', 4),
+    (12, 'Core', 4),
+    (13, 'Endurance', 4)
+]
+
+# Sample Daily Quests
+DAILY_QUESTS = [
+    (1, 'Train Stamina', 'Complete a 20-minute run.', 1, 50, 0),
+    (2, 'Read a Chapter', 'Read one chapter of a book.', 4, 75, 0),
+    (3, 'Practice Discipline', 'Meditate for 10 minutes.', 8, 100, 0)
+]
+
+# Sample Routine Quests (Weekly/Monthly)
+ROUTINE_QUESTS = [
+    (1, 'Weekly Workout', 'Complete 3 workouts this week.', 11, 150, 10, 'weekly'),
+    (2, 'Monthly Study', 'Finish a course module.', 4, 200, 20, 'monthly')
+]
+
+# Sample Special Quests
+SPECIAL_QUESTS = [
+    (1, 'First Milestone', 'Reach Level 2 in any child skill.', 1, 100, 50),
+    (2, 'Master Focus', 'Complete 5 Focus-related tasks.', 5, 200, 100)
+]
+
+# (quest_id, kind, skill_id, threshold) for the sample special quests
+SPECIAL_QUEST_CONDITIONS = [
+    (1, 'child_skill_level', None, 2),
+    (2, 'child_skill_completions', 5, 5)
+]
+
+# Sample Progression Quests
+PROGRESSION_QUESTS = [
+    (1, 'Grind Stamina', 'Run for 15 minutes.', 1, 40, 0),
+    (2, 'Study Session', 'Study for 30 minutes.', 4, 60, 0)
+]
+
+# Sample Challenge Quests
+CHALLENGE_QUESTS = [
+    (1, 'Stamina Streak', 'Run daily for 3 days.', 1, 100, 30, '2025-12-31T23:59:59', 3),
+    (2, 'Focus Challenge', 'Study without distractions for 1 hour.', 5, 120, 40, '2025-12-31T23:59:59', 0)
+]
+
+# Sample RNG Quests
+RNG_QUESTS = [
+    (1, 'Random Skill Boost', 'Practice a random skill.', 8, 80, 20),
+    (2, 'Mystery Task', 'Complete a surprise task.', 10, 90, 25)
+]
+
+# Draw weight of the sample RNG quests; the rest keep the default of 1
+RNG_QUEST_WEIGHTS = [
+    (2, 0.25)
+]
+
+
+def create_base_schema(cursor):
+    # Players table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS players (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            status TEXT DEFAULT 'live',
+            level INTEGER DEFAULT 1,
+            exp INTEGER DEFAULT 0,
+            coins INTEGER DEFAULT 0,
+            quests_completed INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Check if columns exist in players table
+    cursor.execute("PRAGMA table_info(players)")
+    columns = [col[1] for col in cursor.fetchall()]
+    if 'level' not in columns:
+        cursor.execute('ALTER TABLE players ADD COLUMN level INTEGER DEFAULT 1')
+    if 'exp' not in columns:
+        cursor.execute('ALTER TABLE players ADD COLUMN exp INTEGER DEFAULT 0')
+    if 'coins' not in columns:
+        cursor.execute('ALTER TABLE players ADD COLUMN coins INTEGER DEFAULT 0')
+    if 'quests_completed' not in columns:
+        cursor.execute('ALTER TABLE players ADD COLUMN quests_completed INTEGER DEFAULT 0')
+
+    # Life Skills table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS life_skills (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            level INTEGER DEFAULT 1,
+            exp INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Child Skills table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS child_skills (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            life_skill_id INTEGER,
+            level INTEGER DEFAULT 1,
+            exp INTEGER DEFAULT 0,
+            FOREIGN KEY (life_skill_id) REFERENCES life_skills(id)
+        )
+    ''')
+
+    # Player Stats table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS player_stats (
+            player_name TEXT,
+            life_skill_id INTEGER,
+            child_skill_id INTEGER,
+            FOREIGN KEY (life_skill_id) REFERENCES life_skills(id),
+            FOREIGN KEY (child_skill_id) REFERENCES child_skills(id),
+            FOREIGN KEY (player_name) REFERENCES players(name),
+            UNIQUE(player_name, child_skill_id)
+        )
+    ''')
+
+    # Daily Quests table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_quests (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            child_skill_id INTEGER,
+            exp_reward INTEGER,
+            coin_reward INTEGER,
+            FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
+        )
+    ''')
+
+    # Routine Quests table (Weekly/Monthly)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS routine_quests (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            child_skill_id INTEGER,
+            exp_reward INTEGER,
+            coin_reward INTEGER,
+            reset_period TEXT CHECK (reset_period IN ('weekly', 'monthly')),
+            FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
+        )
+    ''')
+
+    # Special Quests table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS special_quests (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            child_skill_id INTEGER,
+            exp_reward INTEGER,
+            coin_reward INTEGER,
+            FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
+        )
+    ''')
+
+    # Progression Quests table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS progression_quests (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            child_skill_id INTEGER,
+            exp_reward INTEGER,
+            coin_reward INTEGER,
+            FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
+        )
+    ''')
+
+    # Challenge Quests table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS challenge_quests (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            child_skill_id INTEGER,
+            exp_reward INTEGER,
+            coin_reward INTEGER,
+            time_limit TEXT,
+            streak_required INTEGER DEFAULT 0,
+            FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
+        )
+    ''')
+
+    # RNG Quests table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rng_quests (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            child_skill_id INTEGER,
+            exp_reward INTEGER,
+            coin_reward INTEGER,
+            FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
+        )
+    ''')
+
+    # Player Quests table to track completion
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS player_quests (
+            player_name TEXT,
+            quest_id INTEGER,
+            quest_type TEXT CHECK (quest_type IN ('daily', 'routine', 'special', 'progression', 'challenge', 'rng')),
+            completed BOOLEAN DEFAULT 0,
+            completion_date TEXT,
+            streak_count INTEGER DEFAULT 0,
+            FOREIGN KEY (player_name) REFERENCES players(name)
+        )
+    ''')
+
+
+def add_player_quests_key(cursor):
+    # Give player_quests a real key so INSERT OR REPLACE replaces the
+    # existing row, plus a covering index for the availability checks
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_player_quests_key'")
+    if cursor.fetchone():
+        return
+
+    # Daily and rng rows are keyed by day from here on. Older code added a
+    # timestamped row per completion next to the day's midnight assignment,
+    # which would leave the assignment open; move completions to midnight
+    # so they land on the assignment's key.
+    cursor.execute('''
+        UPDATE player_quests SET completion_date = substr(completion_date, 1, 10) || 'T00:00:00'
+        WHERE quest_type IN ('daily', 'rng') AND completion_date IS NOT NULL
+    ''')
+    # Keep one row per new key: a completed one if any, else the newest
+    cursor.execute('''
+        DELETE FROM player_quests
+        WHERE rowid NOT IN (
+            SELECT rowid FROM (
+                SELECT rowid, ROW_NUMBER() OVER (
+                    PARTITION BY player_name, quest_type, quest_id, completion_date
+                    ORDER BY completed DESC, rowid DESC
+                ) AS copy
+                FROM player_quests
+            )
+            WHERE copy = 1
+        )
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX idx_player_quests_key
+        ON player_quests (player_name, quest_type, quest_id, completion_date)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_player_quests_completed
+        ON player_quests (player_name, quest_type, quest_id, completed, completion_date)
+    ''')
+
+
+def add_player_skills(cursor):
+    # Per-player skill progression. life_skills and child_skills become a
+    # shared catalog; their level/exp columns are only read once here to
+    # carry existing progress over to every player linked in player_stats.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'player_child_skills'")
+    if cursor.fetchone():
+        return
+
+    cursor.execute('''
+        CREATE TABLE player_child_skills (
+            player_id INTEGER NOT NULL,
+            child_skill_id INTEGER NOT NULL,
+            level INTEGER DEFAULT 1,
+            exp INTEGER DEFAULT 0,
+            PRIMARY KEY (player_id, child_skill_id),
+            FOREIGN KEY (player_id) REFERENCES players(id),
+            FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE player_life_skills (
+            player_id INTEGER NOT NULL,
+            life_skill_id INTEGER NOT NULL,
+            level INTEGER DEFAULT 1,
+            exp INTEGER DEFAULT 0,
+            PRIMARY KEY (player_id, life_skill_id),
+            FOREIGN KEY (player_id) REFERENCES players(id),
+            FOREIGN KEY (life_skill_id) REFERENCES life_skills(id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_players_name ON players (name)')
+
+    cursor.execute('''
+        INSERT OR IGNORE INTO player_child_skills (player_id, child_skill_id, level, exp)
+        SELECT p.id, cs.id, cs.level, cs.exp
+        FROM player_stats ps
+        JOIN players p ON p.name = ps.player_name
+        JOIN child_skills cs ON cs.id = ps.child_skill_id
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO player_life_skills (player_id, life_skill_id, level, exp)
+        SELECT DISTINCT p.id, ls.id, ls.level, ls.exp
+        FROM player_stats ps
+        JOIN players p ON p.name = ps.player_name
+        JOIN life_skills ls ON ls.id = ps.life_skill_id
+    ''')
+
+
+def seed_quests(cursor):
+    cursor.executemany('INSERT OR IGNORE INTO daily_quests (id, name, description, child_skill_id, exp_reward, coin_reward) VALUES (?, ?, ?, ?, ?, ?)', DAILY_QUESTS)
+    cursor.executemany('INSERT OR IGNORE INTO routine_quests (id, name, description, child_skill_id, exp_reward, coin_reward, reset_period) VALUES (?, ?, ?, ?, ?, ?, ?)', ROUTINE_QUESTS)
+    cursor.executemany('INSERT OR IGNORE INTO special_quests (id, name, description, child_skill_id, exp_reward, coin_reward) VALUES (?, ?, ?, ?, ?, ?)', SPECIAL_QUESTS)
+    cursor.executemany('INSERT OR IGNORE INTO progression_quests (id, name, description, child_skill_id, exp_reward, coin_reward) VALUES (?, ?, ?, ?, ?, ?)', PROGRESSION_QUESTS)
+    cursor.executemany('INSERT OR IGNORE INTO challenge_quests (id, name, description, child_skill_id, exp_reward, coin_reward, time_limit, streak_required) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', CHALLENGE_QUESTS)
+    cursor.executemany('INSERT OR IGNORE INTO rng_quests (id, name, description, child_skill_id, exp_reward, coin_reward) VALUES (?, ?, ?, ?, ?, ?)', RNG_QUESTS)
+
+
+def seed_catalog(cursor):
+    # Seeded once here instead of on every initialize_player_stats call
+    cursor.executemany('INSERT OR IGNORE INTO life_skills (id, name, level, exp) VALUES (?, ?, 1, 0)', LIFE_SKILLS)
+    cursor.executemany('INSERT OR IGNORE INTO child_skills (id, name, life_skill_id, level, exp) VALUES (?, ?, ?, 1, 0)', CHILD_SKILLS)
+    seed_quests(cursor)
+
+
+CATALOG_TABLES = ('daily_quests', 'routine_quests', 'special_quests', 'progression_quests', 'challenge_quests', 'rng_quests')
+
+
+def add_catalog_version(cursor):
+    # Counter bumped by any write to a quest catalog table, so cached
+    # catalogs (quest_catalog.QuestCatalog) know when to reload
+    cursor.execute('''
+        CREATE TABLE catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT INTO catalog_version (id, version) VALUES (1, 1)')
+    for table in CATALOG_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER {table}_{event.lower()}_version AFTER {event} ON {table}
+                BEGIN
+                    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+
+
+def add_quest_archive(cursor):
+    # Tables behind archive.QuestArchiver. Archived player_quests rows live
+    # in one player_quests_YYYY_MM table per month, listed in
+    # player_quest_archives; player_quest_daily_summary keeps completions and
+    # EXP per player, child skill and day for everything archived.
+    cursor.execute('''
+        CREATE TABLE player_quest_archives (
+            month TEXT PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            row_count INTEGER DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE player_quest_daily_summary (
+            player_id INTEGER NOT NULL,
+            child_skill_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            completions INTEGER DEFAULT 0,
+            exp INTEGER DEFAULT 0,
+            PRIMARY KEY (player_id, day, child_skill_id),
+            FOREIGN KEY (player_id) REFERENCES players(id),
+            FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
+        ) WITHOUT ROWID
+    ''')
+    # Every catalog quest with the columns history queries need
+    cursor.execute('''
+        CREATE VIEW quest_rewards AS
+        SELECT 'daily' AS quest_type, id AS quest_id, child_skill_id, exp_reward, coin_reward FROM daily_quests
+        UNION ALL SELECT 'routine', id, child_skill_id, exp_reward, coin_reward FROM routine_quests
+        UNION ALL SELECT 'special', id, child_skill_id, exp_reward, coin_reward FROM special_quests
+        UNION ALL SELECT 'progression', id, child_skill_id, exp_reward, coin_reward FROM progression_quests
+        UNION ALL SELECT 'challenge', id, child_skill_id, exp_reward, coin_reward FROM challenge_quests
+        UNION ALL SELECT 'rng', id, child_skill_id, exp_reward, coin_reward FROM rng_quests
+    ''')
+
+
+def add_challenge_streaks(cursor):
+    # Current and best streak per player and challenge quest (see
+    # streaks.py), rebuilt once here from the challenge history so far
+    cursor.execute('''
+        CREATE TABLE player_challenge_streaks (
+            player_id INTEGER NOT NULL,
+            quest_id INTEGER NOT NULL,
+            current_streak INTEGER DEFAULT 0,
+            best_streak INTEGER DEFAULT 0,
+            last_day TEXT,
+            completed_at TEXT,
+            PRIMARY KEY (player_id, quest_id),
+            FOREIGN KEY (player_id) REFERENCES players(id),
+            FOREIGN KEY (quest_id) REFERENCES challenge_quests(id)
+        ) WITHOUT ROWID
+    ''')
+    backfill_streaks(cursor, datetime.date.today().isoformat())
+
+
+def add_special_quest_conditions(cursor):
+    # Declarative conditions for special quests (see conditions.py), part of
+    # the versioned catalog, and the per-skill completion counts they read
+    cursor.execute(f'''
+        CREATE TABLE special_quest_conditions (
+            quest_id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL CHECK (kind IN ({', '.join(f"'{kind}'" for kind in CONDITION_KINDS)})),
+            skill_id INTEGER,
+            threshold INTEGER NOT NULL,
+            FOREIGN KEY (quest_id) REFERENCES special_quests(id)
+        )
+    ''')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER special_quest_conditions_{event.lower()}_version AFTER {event} ON special_quest_conditions
+            BEGIN
+                UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+    # Only where the sample quests they describe are still in place
+    cursor.executemany('''
+        INSERT INTO special_quest_conditions (quest_id, kind, skill_id, threshold)
+        SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM special_quests WHERE id = ? AND name = ?)
+    ''', [(*condition, quest[0], quest[1]) for condition, quest in zip(SPECIAL_QUEST_CONDITIONS, SPECIAL_QUESTS)])
+    cursor.execute('''
+        CREATE TABLE player_skill_completions (
+            player_id INTEGER NOT NULL,
+            child_skill_id INTEGER NOT NULL,
+            completions INTEGER DEFAULT 0,
+            PRIMARY KEY (player_id, child_skill_id),
+            FOREIGN KEY (player_id) REFERENCES players(id),
+            FOREIGN KEY (child_skill_id) REFERENCES child_skills(id)
+        ) WITHOUT ROWID
+    ''')
+    backfill_completions(cursor)
+
+
+def add_rng_quest_weights(cursor):
+    # Draw weight per rng quest (see quest_draws.py); rarer quests weigh
+    # less and weight 0 takes a quest out of the draw
+    cursor.execute('ALTER TABLE rng_quests ADD COLUMN weight REAL NOT NULL DEFAULT 1 CHECK (weight >= 0)')
+    cursor.executemany('''
+        UPDATE rng_quests SET weight = ? WHERE id = ? AND name = ?
+    ''', [(weight, quest[0], quest[1]) for quest_id, weight in RNG_QUEST_WEIGHTS
+          for quest in RNG_QUESTS if quest[0] == quest_id])
+
+
+def add_catalog_listing_indexes(cursor):
+    # Keyset pages of Database.iter_quests: one index per
+    # ordering, by itself and behind a child skill filter, so each page is
+    # a range seek however large the catalog grows
+    for table in CATALOG_TABLES:
+        for name, key in (('exp', 'COALESCE(exp_reward, 0), id'), ('coins', 'COALESCE(coin_reward, 0), id')):
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{name} ON {table} ({key})')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_child_skill_{name} ON {table} (child_skill_id, {key})')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_child_skill ON {table} (child_skill_id, id)')
+
+
+def add_unique_player_names(cursor):
+    # player_quests is keyed by name, so players sharing a name shared their
+    # quest state. Later duplicates become "name#id"; the shared quest rows
+    # stay with the first player of the name.
+    cursor.execute('''
+        UPDATE players SET name = name || '#' || id
+        WHERE id NOT IN (SELECT MIN(id) FROM players GROUP BY name)
+    ''')
+    cursor.execute('DROP INDEX IF EXISTS idx_players_name')
+    cursor.execute('CREATE UNIQUE INDEX idx_players_name ON players (name)')
+
+
+# (version, migration) in the order they are applied
+MIGRATIONS = [
+    (1, create_base_schema),
+    (2, add_player_quests_key),
+    (3, add_player_skills),
+    (4, seed_catalog),
+    (5, add_catalog_version),
+    (6, add_quest_archive),
+    (7, add_challenge_streaks),
+    (8, add_special_quest_conditions),
+    (9, add_rng_quest_weights),
+    (10, add_catalog_listing_indexes),
+    (11, add_unique_player_names),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(pool):
+    # Brings the database up to SCHEMA_VERSION and returns the version. The
+    # common case is a single PRAGMA read; otherwise all pending migrations
+    # run in one write transaction.
+    version = schema_version(pool.writer_connection)
+    if version >= SCHEMA_VERSION:
+        return version
+
+    with pool.write() as conn:
+        # write() holds the file's write lock from the start, so two
+        # processes opening the same new file do not both run the migrations
+        version = schema_version(conn)
+        cursor = conn.cursor()
+        for number, migration in MIGRATIONS:
+            if number > version:
+                migration(cursor)
+                cursor.execute(f'PRAGMA user_version = {number}')
+                version = number
+        return version
@@ -0,0 +1,113 @@
+import datetime
+from array import array
+from functions.database import period_starts
+
+
+class PlayerState:
+    # In-memory copy of one player's progression and available quests for the
+    # interactive loop. It is loaded once, updated in place by the completion
+    # path after each commit (which writes through to SQLite), and reloaded
+    # only when another connection has committed to the database.
+    __slots__ = (
+        'db', 'player_id', 'player_name', 'level', 'exp', 'coins', 'quests_completed',
+        'life_skill_ids', 'life_skill_names', 'life_skill_levels', 'life_skill_exp',
+        'child_skill_ids', 'child_skill_names', 'child_skill_life_index', 'child_skill_levels', 'child_skill_exp',
+        'available_quests', 'quests_date', 'data_version', '_life_skill_index', '_child_skill_index'
+    )
+
+    def __init__(self, db, player):
+        self.db = db
+        self.player_id = db.get_player_id(player)
+        self.reload()
+
+    def reload(self):
+        self.data_version = self.db.get_data_version()
+        player_row = self.db.get_player(self.player_id)
+        self.player_name = player_row[1]
+        self.level, self.exp, self.coins, self.quests_completed = self.db.get_player_level(self.player_id)
+
+        life_skills = self.db.get_life_skill_states(self.player_id)
+        self.life_skill_ids = tuple(row[0] for row in life_skills)
+        self.life_skill_names = tuple(row[1] for row in life_skills)
+        self.life_skill_levels = array('q', (row[2] for row in life_skills))
+        self.life_skill_exp = array('q', (row[3] for row in life_skills))
+        self._life_skill_index = {skill_id: i for i, skill_id in enumerate(self.life_skill_ids)}
+
+        child_skills = self.db.get_child_skill_states(self.player_id)
+        self.child_skill_ids = tuple(row[0] for row in child_skills)
+        self.child_skill_names = tuple(row[1] for row in child_skills)
+        self.child_skill_life_index = array('q', (self._life_skill_index[row[2]] for row in child_skills))
+        self.child_skill_levels = array('q', (row[3] for row in child_skills))
+        self.child_skill_exp = array('q', (row[4] for row in child_skills))
+        self._child_skill_index = {skill_id: i for i, skill_id in enumerate(self.child_skill_ids)}
+
+        self.reload_quests()
+
+    def reload_quests(self):
+        self.quests_date = period_starts(datetime.datetime.now())[0]
+        self.available_quests = self.db.get_available_quests(self.player_name)
+
+    def is_stale(self):
+        # PRAGMA data_version only changes when another connection commits
+        return self.db.get_data_version() != self.data_version
+
+    def refresh(self):
+        new_day = period_starts(datetime.datetime.now())[0] != self.quests_date
+        if new_day:
+            # Nothing else assigns the new day's daily quests and rng draws
+            # while the loop runs; weekly and monthly quests come back by
+            # themselves
+            self.db.reset_daily_quests(self.player_id)
+        if self.is_stale():
+            self.reload()
+        elif new_day:
+            self.reload_quests()
+
+    def get_available_quests(self):
+        now = datetime.datetime.now().isoformat()
+        return [quest for quest in self.available_quests
+                if quest.quest_type != 'challenge' or quest.time_limit > now]
+
+    def get_player_level(self):
+        return self.level, self.exp, self.coins, self.quests_completed
+
+    def get_player_stats(self):
+        # Same rows as Database.get_player_stats
+        stats = []
+        for i in range(len(self.child_skill_ids)):
+            life = self.child_skill_life_index[i]
+            stats.append((self.life_skill_names[life], self.life_skill_levels[life], self.life_skill_exp[life],
+                          self.child_skill_names[i], self.child_skill_levels[i], self.child_skill_exp[i]))
+        return stats
+
+    def skill_exp_rows(self, child_skill_ids):
+        # State in the shape Database._apply_skill_exp reads from SQLite
+        child_skills = {}
+        life_skills = {}
+        for child_skill_id in child_skill_ids:
+            if child_skill_id not in self._child_skill_index:
+                raise ValueError(f"Unknown child skill id: {child_skill_id}")
+            i = self._child_skill_index[child_skill_id]
+            life = self.child_skill_life_index[i]
+            child_skills[child_skill_id] = [self.life_skill_ids[life], self.child_skill_exp[i], self.child_skill_levels[i]]
+            life_skills[self.life_skill_ids[life]] = [self.life_skill_exp[life], self.life_skill_levels[life]]
+        return child_skills, life_skills, (self.exp, self.level, self.coins)
+
+    def apply(self, child_skills, life_skills, player_row, items=()):
+        # Called by the completion path once its transaction has committed
+        for child_skill_id, (_, exp, level) in child_skills.items():
+            i = self._child_skill_index[child_skill_id]
+            self.child_skill_exp[i] = exp
+            self.child_skill_levels[i] = level
+        for life_skill_id, (exp, level) in life_skills.items():
+            life = self._life_skill_index[life_skill_id]
+            self.life_skill_exp[life] = exp
+            self.life_skill_levels[life] = level
+        self.exp, self.level, self.coins = player_row
+        self.quests_completed += len(items)
+
+        # Everything but progression quests leaves the list once completed
+        completed = {(item[1], item[0]) for item in items if item[1] != 'progression'}
+        if completed:
+            self.available_quests = [quest for quest in self.available_quests
+                                     if (quest.quest_type, quest.id) not in completed]
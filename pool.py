@@ -0,0 +1,182 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class ConnectionPool:
+    # One writer connection plus up to `readers` reader connections to the
+    # same SQLite file. Writes are serialized on the writer; in WAL mode the
+    # readers keep answering from the last committed snapshot while a write
+    # is open. Readers are opened on first use, so a short-lived process that
+    # never reads concurrently pays for the writer alone.
+    def __init__(self, db_name, readers=4, journal_mode='WAL', synchronous='NORMAL',
+                 cache_size=-16000, mmap_size=256 * 1024 * 1024, busy_timeout=5000, setup=None):
+        self.db_name = db_name
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self._setup = setup
+        self._write_lock = threading.RLock()
+        self._writer_thread = None
+        self._write_depth = 0
+        self._after_commit = []
+
+        self._hooks = []
+        self._open_lock = threading.Lock()
+
+        self.writer_connection = self._connect()
+        self.in_memory = db_name in (':memory:', '') or 'mode=memory' in db_name
+        if not self.in_memory:
+            self.writer_connection.execute(f'PRAGMA journal_mode = {journal_mode}')
+        # Every connection to :memory: is its own database, so an in-memory
+        # pool reads through the writer
+        self.max_readers = 0 if self.in_memory else readers
+        self._readers = queue.LifoQueue()
+        self._reader_connections = []
+
+    def _connect(self, query_only=False):
+        conn = sqlite3.connect(self.db_name, timeout=self.busy_timeout / 1000, check_same_thread=False,
+                               uri=self.db_name.startswith('file:'))
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA cache_size = {int(self.cache_size)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        if query_only:
+            conn.execute('PRAGMA query_only = ON')
+        if self._setup is not None:
+            self._setup(conn)
+        return conn
+
+    @contextmanager
+    def write(self, transaction=True):
+        # Holds the writer for the block and commits when the outermost block
+        # exits (rolls back if it raises). Nested blocks join the transaction.
+        # The transaction starts with BEGIN IMMEDIATE, so what the block
+        # reads cannot change under it before its first write; sqlite3 would
+        # otherwise only begin at the first INSERT or UPDATE. transaction=False
+        # holds the writer without starting one, for reads through the writer
+        # and PRAGMAs that refuse to run inside a transaction.
+        callbacks = ()
+        with self._write_lock:
+            self._writer_thread = threading.get_ident()
+            self._write_depth += 1
+            try:
+                if transaction and not self.writer_connection.in_transaction:
+                    self.writer_connection.execute('BEGIN IMMEDIATE')
+                yield self.writer_connection
+                if self._write_depth == 1:
+                    self.writer_connection.commit()
+                    callbacks, self._after_commit = self._after_commit, []
+            except BaseException:
+                if self._write_depth == 1:
+                    self.writer_connection.rollback()
+                    self._after_commit = []
+                raise
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    self._writer_thread = None
+        for callback in callbacks:
+            callback()
+
+    def write_depth(self):
+        # How many write() blocks the calling thread is inside
+        return self._write_depth if self._writer_thread == threading.get_ident() else 0
+
+    def after_commit(self, callback):
+        # Runs callback once the calling thread's transaction commits, right
+        # away outside one; dropped if the transaction, or the savepoint it
+        # was registered in, rolls back
+        if self.write_depth():
+            self._after_commit.append(callback)
+        else:
+            callback()
+
+    @contextmanager
+    def savepoint(self):
+        # A unit of work that can fail on its own inside a longer write: if
+        # the block raises, only its changes are rolled back and the
+        # enclosing transaction carries on
+        with self.write() as conn:
+            conn.execute('SAVEPOINT unit')
+            pending = len(self._after_commit)
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK TO unit')
+                conn.execute('RELEASE unit')
+                del self._after_commit[pending:]
+                raise
+            conn.execute('RELEASE unit')
+
+    @contextmanager
+    def read(self):
+        # A thread inside write() reads through the writer so it sees its own
+        # uncommitted changes
+        if self._writer_thread == threading.get_ident() or not self.max_readers:
+            with self.write(transaction=False) as conn:
+                yield conn
+            return
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def snapshot(self):
+        # A reader holding one read transaction for the block, so every query
+        # in it sees the same committed state (WAL readers are never blocked
+        # by the writer)
+        with self.read() as conn:
+            began = not conn.in_transaction
+            if began:
+                conn.execute('BEGIN')
+            try:
+                yield conn
+            finally:
+                if began:
+                    conn.rollback()
+
+    def _acquire_reader(self):
+        # An idle reader, a new one while fewer than max_readers are open,
+        # else the next one released
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._open_lock:
+            if len(self._reader_connections) < self.max_readers:
+                conn = self._connect(query_only=True)
+                for hook in self._hooks:
+                    hook(conn)
+                self._reader_connections.append(conn)
+                return conn
+        return self._readers.get()
+
+    def connections(self):
+        # The connections open so far
+        with self._open_lock:
+            return [self.writer_connection] + self._reader_connections
+
+    def add_hook(self, hook):
+        # Calls hook(conn) on every connection, those open now and those
+        # opened later
+        with self._open_lock:
+            self._hooks.append(hook)
+            connections = [self.writer_connection] + self._reader_connections
+        for conn in connections:
+            hook(conn)
+
+    def remove_hook(self, hook):
+        with self._open_lock:
+            self._hooks.remove(hook)
+    
+    def close(self):
+        for conn in self._reader_connections:
+            conn.close()
+        self._reader_connections = []
+        self.writer_connection.close()
@@ -0,0 +1,230 @@
+from collections import namedtuple
+from functions.conditions import ConditionIndex, load_conditions
+
+# Quest types in menu order
+QUEST_TYPES = ('daily', 'routine', 'special', 'progression', 'challenge', 'rng')
+
+# A catalog quest. Every type has the same shape; the fields after
+# quest_type belong to some types only (QUEST_EXTRA_FIELDS) and are None for
+# the rest. The first seven fields are the tuple get_available_quests used
+# to return, so positional unpacking of those still works.
+Quest = namedtuple('Quest', [
+    'id', 'name', 'description', 'child_skill_id', 'exp_reward', 'coin_reward', 'quest_type',
+    'reset_period', 'time_limit', 'streak_required', 'weight'
+])
+QUEST_EXTRA_FIELDS = {
+    'routine': ('reset_period',),
+    'challenge': ('time_limit', 'streak_required'),
+    'rng': ('weight',),
+}
+
+
+def quest_columns(quest_type):
+    # SELECT list of one catalog table in Quest field order
+    extra = QUEST_EXTRA_FIELDS.get(quest_type, ())
+    return ', '.join(['id', 'name', 'description', 'child_skill_id', 'exp_reward', 'coin_reward', f"'{quest_type}'"]
+                     + [field if field in extra else 'NULL' for field in Quest._fields[7:]])
+
+
+# The query loading each catalog table
+CATALOG_QUERIES = {quest_type: f'SELECT {quest_columns(quest_type)} FROM {quest_type}_quests ORDER BY id'
+                   for quest_type in QUEST_TYPES}
+
+# Listing orders of Database.iter_quests and the SQL expression each sorts
+# on; 'type' is catalog order, by type and then id
+QUEST_ORDERS = {
+    'type': None,
+    'exp_reward': 'COALESCE(exp_reward, 0)',
+    'coin_reward': 'COALESCE(coin_reward, 0)',
+}
+
+
+def quest_key(quest, order='type'):
+    # Position of a quest in a listing order, (value, type rank, id). The key
+    # of the last quest on a page is where the next page starts.
+    value = 0 if QUEST_ORDERS[order] is None else getattr(quest, order) or 0
+    return value, QUEST_TYPES.index(quest.quest_type), quest.id
+
+
+# A page of Database.list_quests; next_after is None on the last page
+QuestPage = namedtuple('QuestPage', ['quests', 'next_after'])
+
+
+def quest_page_query(quest_type, order='type', descending=False, after=None, child_skill_id=None,
+                     exp_range=None, coin_range=None):
+    # (sql, params) for the next page of one catalog table past the key
+    # after, LIMIT bound last; None when the whole table sorts before it.
+    # Ranges are inclusive (low, high) pairs, either end None for open.
+    # Every page is a range seek on a migration 10 index rather than an
+    # OFFSET scan, so deep pages cost the same as the first.
+    if order not in QUEST_ORDERS:
+        raise ValueError(f"Unknown quest order: {order}")
+    expression = QUEST_ORDERS[order]
+    where, params = [], []
+    if child_skill_id is not None:
+        where.append('child_skill_id = ?')
+        params.append(child_skill_id)
+    for column, bounds in (('exp_reward', exp_range), ('coin_reward', coin_range)):
+        low, high = bounds or (None, None)
+        if low is not None:
+            where.append(f'COALESCE({column}, 0) >= ?')
+            params.append(low)
+        if high is not None:
+            where.append(f'COALESCE({column}, 0) <= ?')
+            params.append(high)
+    if after is not None:
+        value, rank, quest_id = after
+        own_rank = QUEST_TYPES.index(quest_type)
+        op = '<' if descending else '>'
+        # Ties on value go to the type rank: types listed after the key's
+        # type may repeat its value, types listed before may not
+        if own_rank == rank:
+            if expression is None:
+                where.append(f'id {op} ?')
+                params.append(quest_id)
+            else:
+                # Split so the value bound stays an index seek; SQLite does
+                # not seek row values on expressions
+                where.append(f'{expression} {op}= ? AND ({expression} {op} ? OR id {op} ?)')
+                params.extend((value, value, quest_id))
+        elif (own_rank > rank) != descending:
+            if expression is not None:
+                where.append(f'{expression} {op}= ?')
+                params.append(value)
+        elif expression is None:
+            return None
+        else:
+            where.append(f'{expression} {op} ?')
+            params.append(value)
+    direction = 'DESC' if descending else 'ASC'
+    order_by = f'id {direction}' if expression is None else f'{expression} {direction}, id {direction}'
+    return f'''
+        SELECT {quest_columns(quest_type)} FROM {quest_type}_quests
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY {order_by} LIMIT ?
+    ''', params
+
+
+# One player's quest rows that affect availability: today's open daily and
+# rng assignments, routine completions in the current week or month, and
+# completed one-off quests. Index seeks on idx_player_quests_key and
+# idx_player_quests_completed; progression history is never read.
+PLAYER_QUEST_STATE_QUERY = '''
+    SELECT quest_type, quest_id, completion_date FROM player_quests
+    WHERE player_name = :player_name AND quest_type IN ('daily', 'rng') AND completed = 0 AND completion_date >= :today
+    UNION ALL
+    SELECT quest_type, quest_id, completion_date FROM player_quests
+    WHERE player_name = :player_name AND quest_type = 'routine' AND completion_date >= :routine_start
+    UNION ALL
+    SELECT quest_type, quest_id, completion_date FROM player_quests
+    WHERE player_name = :player_name AND quest_type IN ('special', 'challenge') AND completed = 1
+'''
+
+# What a player has done in the current periods, as read by
+# PLAYER_QUEST_STATE_QUERY: open daily and rng quest ids, the latest
+# completion date per routine quest id and the (quest_type, quest_id) pairs
+# completed for good
+QuestProgress = namedtuple('QuestProgress', ['open_daily', 'routine_last', 'completed', 'open_rng'])
+
+
+def catalog_version(conn):
+    # Bumped by triggers on every write to a catalog table (migration 5)
+    return conn.execute('SELECT version FROM catalog_version').fetchone()[0]
+
+
+def load_catalog(conn):
+    # The version is read first: a catalog change landing between the two
+    # reads only makes the next version check reload again
+    version = catalog_version(conn)
+    return QuestCatalog(version, {quest_type: [Quest._make(row) for row in conn.execute(CATALOG_QUERIES[quest_type])]
+                                  for quest_type in QUEST_TYPES}, load_conditions(conn))
+
+
+def read_quest_progress(conn, player_name, today, week_start, month_start):
+    open_daily = set()
+    open_rng = set()
+    routine_last = {}
+    completed = set()
+    rows = conn.execute(PLAYER_QUEST_STATE_QUERY, {
+        'player_name': player_name,
+        'today': today,
+        'routine_start': min(week_start, month_start),
+    })
+    for quest_type, quest_id, completion_date in rows:
+        if quest_type == 'daily':
+            open_daily.add(quest_id)
+        elif quest_type == 'rng':
+            open_rng.add(quest_id)
+        elif quest_type == 'routine':
+            if completion_date > routine_last.get(quest_id, ''):
+                routine_last[quest_id] = completion_date
+        else:
+            completed.add((quest_type, quest_id))
+    return QuestProgress(open_daily, routine_last, completed, open_rng)
+
+
+class QuestCatalog:
+    # Immutable snapshot of the six quest catalog tables, indexed by type,
+    # (type, id) and child skill, and of the special quest conditions. A
+    # changed catalog is picked up by loading a new snapshot, so a snapshot
+    # can be shared between threads.
+    __slots__ = ('version', 'by_type', 'by_id', 'by_child_skill', 'conditions')
+
+    def __init__(self, version, quests_by_type, conditions=None):
+        self.version = version
+        self.conditions = conditions if conditions is not None else ConditionIndex()
+        self.by_type = {quest_type: tuple(quests_by_type.get(quest_type, ())) for quest_type in QUEST_TYPES}
+        self.by_id = {}
+        by_child_skill = {}
+        for quest_type in QUEST_TYPES:
+            for quest in self.by_type[quest_type]:
+                self.by_id[(quest_type, quest.id)] = quest
+                by_child_skill.setdefault(quest.child_skill_id, []).append(quest)
+        self.by_child_skill = {child_skill_id: tuple(quests) for child_skill_id, quests in by_child_skill.items()}
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def get(self, quest_type, quest_id):
+        return self.by_id.get((quest_type, quest_id))
+
+    def for_child_skill(self, child_skill_id):
+        return self.by_child_skill.get(child_skill_id, ())
+
+    def available_quests(self, progress, now, week_start, month_start):
+        # Same quests and order as the SQL it replaced, less the
+        # special quests completed by their conditions; now is an ISO
+        # timestamp compared against challenge time limits
+        quests = []
+        for quest_id in sorted(progress.open_daily):
+            quest = self.by_id.get(('daily', quest_id))
+            if quest is not None:
+                quests.append(quest)
+
+        if progress.routine_last:
+            for quest in self.by_type['routine']:
+                period_start = (week_start if quest.reset_period == 'weekly'
+                                else month_start if quest.reset_period == 'monthly' else None)
+                if period_start is None or progress.routine_last.get(quest.id, '') < period_start:
+                    quests.append(quest)
+        else:
+            quests.extend(self.by_type['routine'])
+
+        completed = progress.completed
+        for quest_type in ('special', 'progression', 'challenge', 'rng'):
+            if quest_type == 'rng':
+                # Today's draws (quest_draws.py) not completed yet
+                quests.extend(self.by_id[('rng', quest_id)] for quest_id in sorted(progress.open_rng)
+                              if ('rng', quest_id) in self.by_id)
+            elif quest_type == 'challenge':
+                quests.extend(quest for quest in self.by_type['challenge']
+                              if quest.time_limit is not None and quest.time_limit > now
+                              and ('challenge', quest.id) not in completed)
+            elif quest_type == 'special' and self.conditions:
+                quests.extend(quest for quest in self.by_type['special']
+                              if quest.id not in self.conditions.quest_ids and ('special', quest.id) not in completed)
+            elif quest_type == 'progression' or not completed:
+                quests.extend(self.by_type[quest_type])
+            else:
+                quests.extend(quest for quest in self.by_type[quest_type] if (quest_type, quest.id) not in completed)
+        return quests
@@ -0,0 +1,171 @@
+import datetime
+
+# Daily random (rng) quests. Every day each player draws DRAWS_PER_DAY
+# distinct quests from rng_quests, each quest as likely as its weight (rare
+# quests have small weights), with a bias toward the player's weakest child
+# skill: a draw comes from that skill's quests alone with probability
+# WEAK_SKILL_BIAS. The weakest skill is the player's child skill with the
+# least EXP among those with rng quests, ties going to the lowest id.
+#
+# A draw is a pure function of (seed, player id, day, weakest skill), and
+# is stored when assigned since the weakest skill can change later in the
+# day. Its random numbers come from a counter-based hash (splitmix64) rather
+# than a generator object, which keeps drawing for one player and for every
+# player in a batch the same.
+# Each draw is O(1) on Walker alias tables, one over all rng quests and one
+# per child skill, built once per rng_quests catalog.
+
+DRAWS_PER_DAY = 2
+WEAK_SKILL_BIAS = 0.5
+DRAW_SEED = 1
+# Draws tried per slot before giving up on filling it, for catalogs with
+# fewer than DRAWS_PER_DAY quests or a few quests holding most of the weight
+MAX_ATTEMPTS_PER_DRAW = 8
+
+_MASK64 = (1 << 64) - 1
+# Child skill ids fit below this bit in read_weakest_child_skills
+_CHILD_SKILL_BITS = 24
+_CHILD_SKILL_MASK = (1 << _CHILD_SKILL_BITS) - 1
+
+
+def _mix(value):
+    # splitmix64 finalizer
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def day_key(seed, day):
+    # Hash of the seed and a day (YYYY-MM-DD), shared by every player's draw
+    return _mix(_mix(seed) ^ datetime.date.fromisoformat(day[:10]).toordinal())
+
+
+def draw_key(day_key, player_id):
+    # Start of one player's hash stream for the day
+    return _mix(day_key ^ player_id)
+
+
+class AliasTable:
+    # Walker's alias method (Vose's construction): column i holds item i
+    # with probability prob[i] and item alias[i] otherwise, so a draw is one
+    # column pick and one comparison
+    __slots__ = ('items', 'prob', 'alias')
+
+    def __init__(self, items, weights):
+        n = len(items)
+        total = float(sum(weights))
+        scaled = [weight * n / total for weight in weights]
+        self.items = tuple(items)
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Left over from rounding; these columns keep their own item
+
+    def __len__(self):
+        return len(self.items)
+
+    def sample(self, bits):
+        # Item for 48 random bits: the high 24 pick the column, the low 24
+        # are compared against its probability
+        column = (((bits >> 24) & 0xFFFFFF) * len(self.items)) >> 24
+        if (bits & 0xFFFFFF) < self.prob[column] * 16777216.0:
+            return self.items[column]
+        return self.items[self.alias[column]]
+
+
+class DrawTables:
+    # Alias tables for one rng_quests catalog (QuestCatalog.by_type['rng']
+    # Quest records). Quests with weight 0 are never drawn.
+    __slots__ = ('quests', 'all', 'by_child_skill')
+
+    def __init__(self, quests):
+        self.quests = quests
+        drawable = [quest for quest in quests if quest.weight > 0]
+        self.all = AliasTable(drawable, [quest.weight for quest in drawable]) if drawable else None
+        by_child_skill = {}
+        for quest in drawable:
+            by_child_skill.setdefault(quest.child_skill_id, []).append(quest)
+        self.by_child_skill = {child_skill_id: AliasTable(group, [quest.weight for quest in group])
+                               for child_skill_id, group in by_child_skill.items()}
+
+    def draw(self, key, weakest_child_skill_id=None, count=DRAWS_PER_DAY):
+        # Up to count distinct quests in draw order for a draw_key
+        if self.all is None:
+            return []
+        weak = self.by_child_skill.get(weakest_child_skill_id)
+        count = min(count, len(self.all))
+        drawn = []
+        for attempt in range(count * MAX_ATTEMPTS_PER_DRAW):
+            # One hash per attempt: the top 16 bits choose the table, the
+            # low 48 the quest in it
+            bits = _mix(key + attempt)
+            table = weak if weak is not None and (bits >> 48) < WEAK_SKILL_BIAS * 65536.0 else self.all
+            quest = table.sample(bits)
+            if quest not in drawn:
+                drawn.append(quest)
+                if len(drawn) == count:
+                    break
+        return drawn
+
+
+def read_weakest_child_skills(conn, tables, first_id, last_id):
+    # [(player_id, player_name, weakest child skill id or None)] for a
+    # player id range. The minimum of exp and child skill id packed into one
+    # integer picks the least EXP and, among equals, the lowest id.
+    child_skill_ids = sorted(tables.by_child_skill)
+    return conn.execute(f'''
+        SELECT p.id, p.name, w.weakest & {_CHILD_SKILL_MASK}
+        FROM players p
+        LEFT JOIN (
+            SELECT player_id, MIN((exp << {_CHILD_SKILL_BITS}) | child_skill_id) AS weakest
+            FROM player_child_skills
+            WHERE player_id BETWEEN ? AND ? AND child_skill_id IN ({', '.join('?' * len(child_skill_ids))})
+            GROUP BY player_id
+        ) w ON w.player_id = p.id
+        WHERE p.id BETWEEN ? AND ?
+    ''', (first_id, last_id, *child_skill_ids, first_id, last_id)).fetchall()
+
+
+def read_drawn_players(conn, today, first_id, last_id):
+    # Names of the players first_id..last_id that already hold rng rows for
+    # today, open or completed
+    return {name for name, in conn.execute('''
+        SELECT p.name
+        FROM players p
+        WHERE p.id BETWEEN ? AND ? AND EXISTS (
+            SELECT 1 FROM player_quests pq
+            WHERE pq.player_name = p.name AND pq.quest_type = 'rng' AND pq.completion_date = ?
+        )
+    ''', (first_id, last_id, today))}
+
+
+def assign_draws(cursor, tables, seed, today, first_id, last_id):
+    # Writes today's draws as open rng assignments for players
+    # first_id..last_id who have none yet; a player is drawn once a day, so
+    # EXP gained since then doesn't add draws for a new weakest skill.
+    # Returns the number of rows added
+    if tables.all is None:
+        return 0
+    key = day_key(seed, today)
+    drawn = read_drawn_players(cursor, today, first_id, last_id)
+    rows = []
+    for player_id, player_name, weakest in read_weakest_child_skills(cursor, tables, first_id, last_id):
+        if player_name in drawn:
+            continue
+        for quest in tables.draw(draw_key(key, player_id), weakest):
+            rows.append((player_name, quest.id, today))
+    if not rows:
+        return 0
+    cursor.executemany('''
+        INSERT OR IGNORE INTO player_quests (player_name, quest_id, quest_type, completed, completion_date, streak_count)
+        VALUES (?, ?, 'rng', 0, ?, 0)
+    ''', rows)
+    return cursor.rowcount
@@ -0,0 +1,56 @@
+import datetime
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a failed rollover (say SQLITE_BUSY past the busy timeout)
+# is tried again
+RETRY_DELAY = 60
+
+
+def next_local_midnight(now):
+    return (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class RolloverScheduler:
+    # Background thread that runs Database.rollover_daily_quests once at
+    # start (to catch up on a missed midnight) and then at every local
+    # midnight until stop() is called.
+    def __init__(self, db, chunk_size=10000, on_rollover=None):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.on_rollover = on_rollover
+        self.last_summary = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='daily-rollover', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def run_once(self, now=None):
+        self.last_summary = self.db.rollover_daily_quests(now, self.chunk_size)
+        if self.on_rollover is not None:
+            self.on_rollover(self.last_summary)
+        return self.last_summary
+
+    def _run(self):
+        # Each rollover runs for the midnight it was scheduled for, so a
+        # wakeup just before midnight still rolls over into the new day
+        target = None
+        while True:
+            try:
+                self.run_once(target)
+            except Exception:
+                logger.exception("Daily rollover failed, retrying in %s seconds", RETRY_DELAY)
+                if self._stop.wait(RETRY_DELAY):
+                    return
+                continue
+            target = next_local_midnight(target or datetime.datetime.now())
+            if self._stop.wait(max((target - datetime.datetime.now()).total_seconds(), 0)):
+                return
@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functions.database import Database
+from functions.leaderboard import Leaderboard, PLAYER_BOARD
+from functions.quest_catalog import Quest, QUEST_EXTRA_FIELDS
+from functions.scheduler import RolloverScheduler
+
+# Multi-client quest server speaking line-delimited JSON. Each request is one
+# JSON object per line, for example
+#   {"id": 1, "op": "list_quests", "player": "alice"}
+#   {"id": 2, "op": "complete_quest", "player": "alice", "quest_type": "daily", "quest_id": 1}
+#   {"id": 3, "op": "get_stats", "player": "alice"}
+#   {"id": 4, "op": "leaderboard_around", "board": "life_skill:1", "player": "alice", "n": 5}
+#   {"id": 5, "op": "browse_quests", "order": "exp_reward", "exp_range": [50, null], "page_size": 20}
+# and is answered with {"id": ..., "ok": true, "result": ...} or
+# {"id": ..., "ok": false, "error": "..."}.
+#
+# Run from the project root: python -m functions.server --port 8765
+
+QUEST_FIELDS = Quest._fields[:7]
+
+LEADERBOARD_FIELDS = ('rank', 'player_id', 'player', 'score')
+
+# Request keys passed through to Database.list_quests
+BROWSE_FILTERS = ('quest_types', 'child_skill_id', 'exp_range', 'coin_range', 'order', 'descending')
+MAX_PAGE_SIZE = 500
+
+
+def quest_to_dict(quest):
+    # The common fields and the quest type's own
+    return {field: getattr(quest, field) for field in QUEST_FIELDS + QUEST_EXTRA_FIELDS.get(quest.quest_type, ())}
+
+
+# Request handlers shared with the batch mode (batch.py)
+
+def list_quests(db, request):
+    return [quest_to_dict(quest) for quest in db.get_available_quests(request['player'])]
+
+
+def browse_quests(db, request):
+    # A page of the whole catalog; pass next_after back as after for the next
+    filters = {key: request[key] for key in BROWSE_FILTERS if request.get(key) is not None}
+    page = db.list_quests(min(request.get('page_size', 50), MAX_PAGE_SIZE), request.get('after'), **filters)
+    return {'quests': [quest_to_dict(quest) for quest in page.quests], 'next_after': page.next_after}
+
+
+def complete_quest(db, request):
+    # Rewards come from the catalog, and only quests that are currently
+    # available to the player can be completed
+    quest_type, quest_id = request['quest_type'], request['quest_id']
+    for quest in db.get_available_quests(request['player']):
+        if quest.quest_type == quest_type and quest.id == quest_id:
+            gain = db.complete_quest(request['player'], quest_id, quest_type, quest.child_skill_id, quest.exp_reward,
+                                     quest.coin_reward)
+            return gain._asdict()
+    raise ValueError(f"Quest not available: {quest_type} {quest_id}")
+
+
+def get_stats(db, request):
+    level, exp, coins, quests_completed = db.get_player_level(request['player'])
+    skills = [
+        dict(zip(('life_skill', 'life_skill_level', 'life_skill_exp', 'child_skill', 'child_skill_level', 'child_skill_exp'), row))
+        for row in db.get_player_stats(request['player'])
+    ]
+    return {'level': level, 'exp': exp, 'coins': coins, 'quests_completed': quests_completed, 'skills': skills}
+
+
+class QuestServer:
+    # SQLite work runs off the event loop: reads on a bounded thread pool,
+    # writes on a single thread so completions are applied one at a time
+    def __init__(self, db, read_workers=4):
+        self.db = db
+        self.read_executor = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix='quest-read')
+        self.write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='quest-write')
+        self.handlers = {
+            'list_quests': (self.read_executor, self.list_quests),
+            'browse_quests': (self.read_executor, self.browse_quests),
+            'complete_quest': (self.write_executor, self.complete_quest),
+            'get_stats': (self.read_executor, self.get_stats),
+            'leaderboard_top': (self.read_executor, self.leaderboard_top),
+            'leaderboard_rank': (self.read_executor, self.leaderboard_rank),
+            'leaderboard_around': (self.read_executor, self.leaderboard_around),
+        }
+        self.leaderboard = Leaderboard(db)
+
+    def list_quests(self, request):
+        return list_quests(self.db, request)
+
+    def browse_quests(self, request):
+        return browse_quests(self.db, request)
+
+    def complete_quest(self, request):
+        return complete_quest(self.db, request)
+
+    def get_stats(self, request):
+        return get_stats(self.db, request)
+
+    def _board(self, request):
+        board = request.get('board', PLAYER_BOARD)
+        if board not in self.leaderboard.boards:
+            raise ValueError(f"Unknown board: {board}")
+        return board
+
+    def leaderboard_top(self, request):
+        return [dict(zip(LEADERBOARD_FIELDS, entry)) for entry in self.leaderboard.top(self._board(request), request.get('n', 10))]
+
+    def leaderboard_rank(self, request):
+        rank, score = self.leaderboard.rank(self._board(request), request['player'])
+        return {'rank': rank, 'score': score}
+
+    def leaderboard_around(self, request):
+        entries = self.leaderboard.around(self._board(request), request['player'], request.get('n', 5))
+        return [dict(zip(LEADERBOARD_FIELDS, entry)) for entry in entries]
+
+    async def dispatch(self, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            if request.get('op') not in self.handlers:
+                raise ValueError(f"Unknown op: {request.get('op')}")
+            executor, handler = self.handlers[request['op']]
+            result = await asyncio.get_running_loop().run_in_executor(executor, handler, request)
+            return {'id': request_id, 'ok': True, 'result': result}
+        except Exception as e:
+            return {'id': request_id, 'ok': False, 'error': f"{type(e).__name__}: {e}"}
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response = await self.dispatch(line)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, unix_path=None):
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.leaderboard.close()
+        self.read_executor.shutdown()
+        self.write_executor.shutdown()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='LifeRPG quest server')
+    parser.add_argument('--db', default='liferpg.db')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='serve on this Unix socket path instead of TCP')
+    parser.add_argument('--readers', type=int, default=4, help='reader threads and reader connections')
+    parser.add_argument('--no-rollover', action='store_true', help='do not run the daily rollover at midnight')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db = Database(args.db, readers=args.readers)
+    server = QuestServer(db, read_workers=args.readers)
+    scheduler = None if args.no_rollover else RolloverScheduler(db).start()
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if scheduler is not None:
+            scheduler.stop()
+        server.close()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,502 @@
+import argparse
+import datetime
+import hashlib
+import heapq
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functions.database import Database
+from functions.leaderboard import PLAYER_BOARD, QUESTS_BOARD
+from functions.migrations import CATALOG_TABLES
+from functions.transfer import backup, export_records, import_records
+
+# Player data split across several SQLite files (shards) so completions for
+# different players commit in parallel, one writer per file. A shard
+# directory holds shard-000.db, shard-001.db, ... and shards.json with the
+# shard count. Every shard carries the whole catalog and the players whose
+# names hash to it.
+#
+# ShardedDatabase routes the Database API. Writes for a player run in that
+# shard's worker process, one per shard, so shards write on separate cores;
+# reads run on reader connections in the calling process. Catalog changes,
+# migrations, the daily rollover, aggregate checks and leaderboards fan out
+# to every shard and merge.
+#
+# Player ids carry their shard in the low SHARD_BITS bits. A player keeps
+# its shard until the shard count changes; rebalance() then moves the
+# players whose shard changed, which gives them new ids. Shards are chosen
+# by jump consistent hashing, so going from n to n + 1 shards moves about
+# 1 / (n + 1) of the players, all of them to the new shard.
+#
+# Run from the project root:
+#   python -m functions.sharding create --dir shards --shards 4 --from liferpg.db
+#   python -m functions.sharding rebalance --dir shards --shards 8
+
+DEFAULT_SHARDS = 4
+SHARD_BITS = 10
+MAX_SHARDS = 1 << SHARD_BITS
+MANIFEST = 'shards.json'
+
+_SHARD_MASK = MAX_SHARDS - 1
+
+# Tables every shard holds a full copy of
+CATALOG_COPY_TABLES = ('life_skills', 'child_skills') + CATALOG_TABLES + ('special_quest_conditions',)
+
+# Per-player tables keyed by player id; player_stats and player_quests (and
+# its monthly archives) are keyed by name
+PLAYER_ID_TABLES = ('player_life_skills', 'player_child_skills', 'player_challenge_streaks',
+                    'player_skill_completions', 'player_quest_daily_summary')
+
+
+def shard_for(name, shards):
+    # Jump consistent hash (Lamping and Veach) of the player name over a
+    # stable 64-bit digest, so the shard does not depend on the process
+    key = int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'little')
+    bucket, jump = -1, 0
+    while jump < shards:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def global_player_id(shard, player_id):
+    return (player_id << SHARD_BITS) | shard
+
+
+def split_player_id(player_id):
+    # (shard, id within the shard)
+    return player_id & _SHARD_MASK, player_id >> SHARD_BITS
+
+
+def shard_path(directory, shard):
+    return os.path.join(directory, f'shard-{shard:03d}.db')
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(directory, manifest):
+    # Replaced in one rename, so a crash leaves the old or the new manifest
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+# The shard Database of a worker process, opened by _open_shard
+_shard_db = None
+
+
+def _open_shard(path, synchronous):
+    global _shard_db
+    _shard_db = Database(path, readers=0, synchronous=synchronous)
+
+
+def _schema_version():
+    return _shard_db.schema_version
+
+
+def _call(method, args):
+    return getattr(_shard_db, method)(*args)
+
+
+def _update_catalog(statements):
+    with _shard_db.pool.write() as conn:
+        for sql, params in statements:
+            conn.execute(sql, params)
+    return _shard_db.get_catalog().version
+
+
+def _board_source(board):
+    # (FROM clause with the player as p, score expression, params) of a
+    # Leaderboard board within one shard
+    if board == PLAYER_BOARD:
+        return 'players p', 'COALESCE(p.exp, 0)', ()
+    if board == QUESTS_BOARD:
+        return 'players p', 'COALESCE(p.quests_completed, 0)', ()
+    if board.startswith('life_skill:'):
+        return ('players p JOIN player_life_skills s ON s.player_id = p.id AND s.life_skill_id = ?',
+                'COALESCE(s.exp, 0)', (int(board[len('life_skill:'):]),))
+    raise ValueError(f"Unknown board: {board}")
+
+
+def _merge_summaries(summaries):
+    # Rollover summaries added up; the date and reset flags are the same on
+    # every shard
+    merged = dict(summaries[0])
+    for summary in summaries[1:]:
+        for key, value in summary.items():
+            if isinstance(value, int) and not isinstance(value, bool):
+                merged[key] += value
+    return merged
+
+
+class ShardedDatabase:
+    # The Database API over a shard directory, created with `shards` shards
+    # if it has no manifest yet. Player ids are global (see above). The
+    # state argument of the completion methods is not taken: PlayerState
+    # caches live in the process that applies the writes.
+    def __init__(self, directory, shards=None, readers=2, synchronous='NORMAL'):
+        manifest = read_manifest(directory)
+        if manifest is None:
+            os.makedirs(directory, exist_ok=True)
+            manifest = {'shards': shards or DEFAULT_SHARDS}
+            if not 1 <= manifest['shards'] <= MAX_SHARDS:
+                raise ValueError(f"Shard count must be between 1 and {MAX_SHARDS}")
+            write_manifest(directory, manifest)
+        if 'rebalancing_to' in manifest:
+            raise RuntimeError(f"{directory} is part way through a rebalance to {manifest['rebalancing_to']} shards")
+        if shards is not None and shards != manifest['shards']:
+            raise ValueError(f"{directory} has {manifest['shards']} shards, not {shards}; rebalance to change the count")
+        self.directory = directory
+        self.shard_count = manifest['shards']
+        paths = [shard_path(directory, shard) for shard in range(self.shard_count)]
+        # Spawned, not forked: the calling process may already hold SQLite
+        # connections and threads
+        context = multiprocessing.get_context('spawn')
+        self._writers = [ProcessPoolExecutor(1, mp_context=context, initializer=_open_shard, initargs=(path, synchronous))
+                         for path in paths]
+        self._fan_out_pool = ThreadPoolExecutor(self.shard_count, thread_name_prefix='shard-read')
+        # Each worker migrates its shard as it starts, so the shards migrate
+        # in parallel; the readers below then find them current
+        self.schema_versions = self._fan_out_writes(_schema_version)
+        self.shards = [Database(path, readers=readers, synchronous=synchronous) for path in paths]
+
+    def close(self):
+        for writer in self._writers:
+            writer.shutdown()
+        self._fan_out_pool.shutdown()
+        for db in self.shards:
+            db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Routing. Methods taking `player` accept a global player id or a name.
+
+    def shard_of(self, player):
+        if isinstance(player, str):
+            return shard_for(player, self.shard_count)
+        shard = player & _SHARD_MASK
+        if shard >= self.shard_count:
+            raise ValueError(f"Unknown player: {player}")
+        return shard
+
+    def _local(self, player):
+        return player if isinstance(player, str) else player >> SHARD_BITS
+
+    def submit(self, player, method, *args):
+        # Future of Database.<method>(player, *args) run by the player's
+        # shard worker; callers keeping many in flight keep every shard busy
+        return self._writers[self.shard_of(player)].submit(_call, method, (self._local(player), *args))
+
+    def _write(self, player, method, *args):
+        return self.submit(player, method, *args).result()
+
+    def _read(self, player, method, *args):
+        return getattr(self.shards[self.shard_of(player)], method)(self._local(player), *args)
+
+    def _fan_out_writes(self, function, *args):
+        # function(*args) in every shard worker at once, results by shard
+        futures = [writer.submit(function, *args) for writer in self._writers]
+        return [future.result() for future in futures]
+
+    def _fan_out_reads(self, function):
+        # function(shard, db) for every shard at once on reader threads;
+        # SQLite releases the GIL while a query runs
+        return list(self._fan_out_pool.map(function, range(self.shard_count), self.shards))
+
+    # Players
+
+    def create_player(self, name):
+        shard = shard_for(name, self.shard_count)
+        return global_player_id(shard, self._writers[shard].submit(_call, 'create_player', (name,)).result())
+
+    def get_player(self, player=None):
+        if player is None:
+            for shard, db in enumerate(self.shards):
+                row = db.get_player()
+                if row is not None:
+                    return (global_player_id(shard, row[0]), *row[1:])
+            return None
+        if not isinstance(player, str) and player & _SHARD_MASK >= self.shard_count:
+            return None
+        row = self._read(player, 'get_player')
+        return None if row is None else (global_player_id(self.shard_of(player), row[0]), *row[1:])
+
+    def get_player_id(self, player):
+        return global_player_id(self.shard_of(player), self._read(player, 'get_player_id'))
+
+    def initialize_player_stats(self, player):
+        return self._write(player, 'initialize_player_stats')
+
+    def assign_daily_quests(self, player):
+        return self._write(player, 'assign_daily_quests')
+
+    def reset_daily_quests(self, player):
+        return self._write(player, 'reset_daily_quests')
+
+    def complete_quest(self, player, quest_id, quest_type, child_skill_id, exp_reward, coin_reward):
+        return self._write(player, 'complete_quest', quest_id, quest_type, child_skill_id, exp_reward, coin_reward)
+
+    def complete_quests(self, player, items):
+        return self._write(player, 'complete_quests', items)
+
+    def update_skill_exp(self, player, child_skill_id, exp_gained, quest_coins):
+        return self._write(player, 'update_skill_exp', child_skill_id, exp_gained, quest_coins)
+
+    def get_player_stats(self, player):
+        return self._read(player, 'get_player_stats')
+
+    def get_life_skill_states(self, player):
+        return self._read(player, 'get_life_skill_states')
+
+    def get_child_skill_states(self, player):
+        return self._read(player, 'get_child_skill_states')
+
+    def get_player_level(self, player):
+        return self._read(player, 'get_player_level')
+
+    def get_available_quests(self, player):
+        return self._read(player, 'get_available_quests')
+
+    def draw_rng_quests(self, player, day=None):
+        # Draws hash the id within the shard, so a rebalanced player draws
+        # differently from the day after the move
+        return self._read(player, 'draw_rng_quests', day)
+
+    def get_streaks(self, player):
+        return self._read(player, 'get_streaks')
+
+    def get_quest_history(self, player, start=None, end=None):
+        return self._read(player, 'get_quest_history', start, end)
+
+    def get_completion_summary(self, player, first_day, last_day):
+        return self._read(player, 'get_completion_summary', first_day, last_day)
+
+    # Every shard
+
+    def get_data_version(self):
+        return tuple(db.get_data_version() for db in self.shards)
+
+    def get_catalog(self):
+        return self.shards[0].get_catalog()
+
+    def iter_quests(self, **filters):
+        # The catalog is the same on every shard
+        return self.shards[0].iter_quests(**filters)
+
+    def list_quests(self, page_size=50, after=None, **filters):
+        return self.shards[0].list_quests(page_size, after, **filters)
+
+    def initialize_quests(self):
+        self._fan_out_writes(_call, 'initialize_quests', ())
+
+    def update_catalog(self, statements):
+        # Runs [(sql, params), ...] against the catalog tables of every
+        # shard, in one transaction per shard. Shards commit independently:
+        # if one fails the others keep the change, and catalog_mismatches()
+        # shows which shards to repair.
+        return self._fan_out_writes(_update_catalog, list(statements))
+
+    def catalog_mismatches(self):
+        # Shards whose catalog tables differ from shard 0's
+        def rows(shard, db):
+            with db.pool.read() as conn:
+                return [conn.execute(f'SELECT * FROM {table} ORDER BY 1').fetchall() for table in CATALOG_COPY_TABLES]
+        catalogs = self._fan_out_reads(rows)
+        return [shard for shard, catalog in enumerate(catalogs) if catalog != catalogs[0]]
+
+    def rollover_daily_quests(self, now=None, chunk_size=10000):
+        # One date for every shard, whenever each of them gets to it
+        now = now or datetime.datetime.now()
+        return _merge_summaries(self._fan_out_writes(_call, 'rollover_daily_quests', (now, chunk_size)))
+
+    def backfill_streaks(self, now=None):
+        now = now or datetime.datetime.now()
+        return sum(self._fan_out_writes(_call, 'backfill_streaks', (now,)))
+
+    def backfill_completion_counts(self):
+        return sum(self._fan_out_writes(_call, 'backfill_completion_counts', ()))
+
+    def verify_aggregates(self, chunk_size=10000):
+        results = self._fan_out_reads(lambda shard, db: db.verify_aggregates(chunk_size))
+        return [drift._replace(player_id=global_player_id(shard, drift.player_id))
+                for shard, drifts in enumerate(results) for drift in drifts]
+
+    def rebuild_aggregates(self, chunk_size=10000):
+        results = self._fan_out_writes(_call, 'rebuild_aggregates', (chunk_size,))
+        return [drift._replace(player_id=global_player_id(shard, drift.player_id))
+                for shard, drifts in enumerate(results) for drift in drifts]
+
+    def leaderboard_top(self, board=PLAYER_BOARD, n=10):
+        # Leaderboard.top across shards: each shard's top n merged. Entries
+        # are (rank, player_id, player_name, score); equal scores share a
+        # rank and are listed by player id.
+        source, score, params = _board_source(board)
+
+        def top(shard, db):
+            with db.pool.read() as conn:
+                rows = conn.execute(f'''
+                    SELECT p.id, p.name, {score} AS score FROM {source}
+                    ORDER BY score DESC, p.id LIMIT ?
+                ''', (*params, n)).fetchall()
+            return [(-score, global_player_id(shard, player_id), name) for player_id, name, score in rows]
+
+        entries = []
+        for negated, player_id, name in heapq.merge(*self._fan_out_reads(top)):
+            if len(entries) == n:
+                break
+            rank = entries[-1][0] if entries and entries[-1][3] == -negated else len(entries) + 1
+            entries.append((rank, player_id, name, -negated))
+        return entries
+
+    def leaderboard_rank(self, board, player):
+        # (rank, score) of one player across shards
+        source, score, params = _board_source(board)
+        player_id = self._read(player, 'get_player_id')
+        with self.shards[self.shard_of(player)].pool.read() as conn:
+            row = conn.execute(f'SELECT {score} FROM {source} WHERE p.id = ?', (*params, player_id)).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown player: {player}")
+
+        def ahead(shard, db):
+            with db.pool.read() as conn:
+                return conn.execute(f'SELECT COUNT(*) FROM {source} WHERE {score} > ?', (*params, row[0])).fetchone()[0]
+
+        return sum(self._fan_out_reads(ahead)) + 1, row[0]
+
+
+def delete_player(conn, player_id, player_name):
+    # Every row of one player, archived history included
+    conn.execute('DELETE FROM players WHERE id = ?', (player_id,))
+    for table in PLAYER_ID_TABLES:
+        conn.execute(f'DELETE FROM {table} WHERE player_id = ?', (player_id,))
+    conn.execute('DELETE FROM player_stats WHERE player_name = ?', (player_name,))
+    conn.execute('DELETE FROM player_quests WHERE player_name = ?', (player_name,))
+    for month, table in conn.execute('SELECT month, table_name FROM player_quest_archives').fetchall():
+        deleted = conn.execute(f'DELETE FROM {table} WHERE player_name = ?', (player_name,)).rowcount
+        if deleted:
+            conn.execute('UPDATE player_quest_archives SET row_count = row_count - ? WHERE month = ?', (deleted, month))
+
+
+def move_player(source, target, player_id, player_name):
+    # Copies a player from one shard Database to another, then deletes it
+    # from the source. Archived history arrives as live player_quests rows.
+    # A copy left in target by an interrupted move is replaced.
+    with target.pool.write() as conn:
+        for (stale_id,) in conn.execute('SELECT id FROM players WHERE name = ?', (player_name,)).fetchall():
+            delete_player(conn, stale_id, player_name)
+    import_records(target, export_records(source, [player_id]))
+    new_id = target.get_player(player_name)[0]
+    with source.pool.write() as conn:
+        delete_player(conn, player_id, player_name)
+    return new_id
+
+
+def copy_catalog(source_path, db):
+    # Replaces db's catalog tables with those of the database at source_path
+    db.conn.execute('ATTACH DATABASE ? AS source', (source_path,))
+    try:
+        with db.pool.write() as conn:
+            for table in CATALOG_COPY_TABLES:
+                conn.execute(f'DELETE FROM {table}')
+                conn.execute(f'INSERT INTO {table} SELECT * FROM source.{table}')
+    finally:
+        db.conn.execute('DETACH DATABASE source')
+
+
+def rebalance(directory, shards, progress=None):
+    # Changes the shard count, moving every player whose shard changes; the
+    # directory must not be open meanwhile. New shards get shard 0's
+    # catalog, and shards past the new count are deleted once empty. The
+    # manifest records the rebalance while it runs, so an interrupted one is
+    # finished by running it again with the same count. Moved players get
+    # new ids. progress(moved) is called after each move.
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise ValueError(f"No shards in {directory}")
+    if not 1 <= shards <= MAX_SHARDS:
+        raise ValueError(f"Shard count must be between 1 and {MAX_SHARDS}")
+    if manifest.get('rebalancing_to', shards) != shards:
+        raise ValueError(f"{directory} is part way through a rebalance to {manifest['rebalancing_to']} shards")
+    old = manifest['shards']
+    write_manifest(directory, {'shards': old, 'rebalancing_to': shards})
+    dbs = [Database(shard_path(directory, shard), readers=0) for shard in range(max(old, shards))]
+    moved = 0
+    try:
+        for shard in range(old, shards):
+            copy_catalog(shard_path(directory, 0), dbs[shard])
+        for shard in range(old):
+            for player_id, player_name in dbs[shard].conn.execute('SELECT id, name FROM players ORDER BY id').fetchall():
+                target = shard_for(player_name, shards)
+                if target != shard:
+                    move_player(dbs[shard], dbs[target], player_id, player_name)
+                    moved += 1
+                    if progress is not None:
+                        progress(moved)
+        players = [dbs[shard].conn.execute('SELECT COUNT(*) FROM players').fetchone()[0] for shard in range(shards)]
+    finally:
+        for db in dbs:
+            db.close()
+    for shard in range(shards, old):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(shard_path(directory, shard) + suffix):
+                os.remove(shard_path(directory, shard) + suffix)
+    write_manifest(directory, {'shards': shards})
+    return {'shards': shards, 'moved': moved, 'players': players}
+
+
+def create(directory, shards, source=None):
+    # A new shard directory, optionally split from an existing database:
+    # the database is copied in as the only shard and rebalanced from there
+    if read_manifest(directory) is not None:
+        raise ValueError(f"{directory} already holds shards")
+    os.makedirs(directory, exist_ok=True)
+    if source is None:
+        with ShardedDatabase(directory, shards) as db:
+            return {'shards': db.shard_count, 'moved': 0, 'players': [0] * db.shard_count}
+    with Database(source) as db:
+        backup(db, shard_path(directory, 0))
+    write_manifest(directory, {'shards': 1})
+    return rebalance(directory, shards)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Create and rebalance LifeRPG shard directories')
+    commands = parser.add_subparsers(dest='command', required=True)
+    new = commands.add_parser('create', help='create a shard directory')
+    new.add_argument('--dir', required=True)
+    new.add_argument('--shards', type=int, default=DEFAULT_SHARDS)
+    new.add_argument('--from', dest='source', help='database to split across the shards')
+    resize = commands.add_parser('rebalance', help='change the shard count of a directory')
+    resize.add_argument('--dir', required=True)
+    resize.add_argument('--shards', type=int, required=True)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'create':
+        summary = create(args.dir, args.shards, args.source)
+    else:
+        summary = rebalance(args.dir, args.shards,
+                            lambda moved: print(f"\r{moved} player(s) moved", end='', file=sys.stderr))
+        print(file=sys.stderr)
+    print(f"{summary['shards']} shard(s), {summary['moved']} player(s) moved, players per shard: {summary['players']}",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
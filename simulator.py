@@ -0,0 +1,457 @@
+import argparse
+import datetime
+import json
+import sys
+import time
+from collections import namedtuple
+from functions.database import Database
+from functions.levels import PLAYER_CURVE, LIFE_SKILL_CURVE, CHILD_SKILL_CURVE
+from functions.levels import CHILD_LEVEL_COINS, LIFE_LEVEL_COINS, PLAYER_LEVEL_COINS
+
+# Offline progression simulator for tuning quest rewards and level curves.
+# N players with behavior profiles complete daily, routine and progression
+# quests from a quest catalog day by day, and the same EXP, level and coin
+# rules as Database._apply_skill_exp are applied to NumPy arrays of players x
+# skills. Special quests with conditions (conditions.py) are awarded as the
+# completion path awards them; challenge and unconditioned special quests are
+# not simulated.
+#
+# Coins need no running total: every level-up coin bonus telescopes, so a
+# player's coins are the bonus for the levels gained so far plus the quest
+# coin rewards collected. verify() replays a small simulation through
+# Database.complete_quests and compares every level, EXP and coin value.
+#
+# Run from the project root:
+#   python -m functions.simulator --players 1000000 --days 365 --checkpoints 30,90,365
+#   python -m functions.simulator --verify
+
+# share: fraction of players with this profile
+# daily_rate: chance of completing each daily quest on a day
+# routine_rate: chance of completing each routine quest once per week/month
+# progression_per_day: mean progression completions per day (Poisson)
+# focus_life_skill: progression quests of this life skill are focus_weight
+#   times as likely to be picked (None for no preference)
+Profile = namedtuple('Profile', ['name', 'share', 'daily_rate', 'routine_rate', 'progression_per_day',
+                                 'focus_life_skill', 'focus_weight'])
+DEFAULT_PROFILES = (
+    Profile('casual', 0.5, 0.4, 0.2, 0.5, None, 1.0),
+    Profile('regular', 0.35, 0.8, 0.6, 2.0, None, 1.0),
+    Profile('grinder', 0.15, 1.0, 1.0, 6.0, 4, 3.0),
+)
+PERCENTILES = (10, 50, 90, 99)
+
+# Completions of one child skill a player can make in a simulated day
+COUNT_BITS = 20
+
+
+def read_skills(conn):
+    # [(child_skill_id, life_skill_id)] and [life_skill_id]
+    return (conn.execute('SELECT id, life_skill_id FROM child_skills ORDER BY id').fetchall(),
+            [row[0] for row in conn.execute('SELECT id FROM life_skills ORDER BY id')])
+
+
+def load_profiles(path):
+    # A JSON list of objects with the Profile fields
+    with open(path) as f:
+        return tuple(Profile(**profile) for profile in json.load(f))
+
+
+class _Curve:
+    # A LevelCurve with its thresholds as an array, extended on demand
+    def __init__(self, np, curve):
+        self.np = np
+        self.curve = curve
+        self.thresholds = np.array(curve.thresholds, dtype=np.int64)
+
+    def levels(self, exp):
+        levels = self.curve.levels(exp)
+        if len(self.curve.thresholds) != len(self.thresholds):
+            self.thresholds = self.np.array(self.curve.thresholds, dtype=self.np.int64)
+        return levels
+
+    def next_threshold(self, levels):
+        # EXP total reaching levels + 1, for levels the curve has covered
+        return self.thresholds[levels - 1]
+
+
+class Simulation:
+    # State arrays have one row per player and one column per child or life
+    # skill, child skills ordered by life skill.
+    def __init__(self, catalog, child_skills, life_skill_ids, players, profiles=DEFAULT_PROFILES, seed=1,
+                 start=None, record=False):
+        import numpy as np
+
+        self.np = np
+        self.players = players
+        self.profiles = profiles
+        self.rng = np.random.default_rng(seed)
+        self.start = start or datetime.date.today()
+        self.day = 0
+        # Completions of each simulated day as (day, player index array,
+        # quest index array), for replaying through the Database
+        self.recorded = [] if record else None
+
+        child_skills = sorted(child_skills, key=lambda skill: (life_skill_ids.index(skill[1]), skill[0]))
+        self.child_skill_ids = [skill[0] for skill in child_skills]
+        self.life_skill_ids = list(life_skill_ids)
+        self.column = {skill_id: i for i, skill_id in enumerate(self.child_skill_ids)}
+        self.life_of_column = np.array([self.life_skill_ids.index(skill[1]) for skill in child_skills], dtype=np.int64)
+        skills = len(self.child_skill_ids)
+
+        # Quests the players choose from; each quest's EXP goes to a column
+        self.quests = [quest for quest_type in ('daily', 'routine', 'progression')
+                       for quest in catalog.by_type[quest_type] if quest.child_skill_id in self.column]
+        self.quest_column = np.array([self.column[quest.child_skill_id] for quest in self.quests], dtype=np.int64)
+        self.quest_exp = np.array([quest.exp_reward or 0 for quest in self.quests], dtype=np.int64)
+        self.quest_coins = np.array([quest.coin_reward or 0 for quest in self.quests], dtype=np.int64)
+        self.daily = [i for i, quest in enumerate(self.quests) if quest.quest_type == 'daily']
+        self.routine = [i for i, quest in enumerate(self.quests) if quest.quest_type == 'routine']
+        self.progression = np.array([i for i, quest in enumerate(self.quests) if quest.quest_type == 'progression'], dtype=np.int64)
+
+        # Conditioned special quests, in the order they are awarded
+        self.conditions = []
+        self.specials = []
+        for quest_id in sorted(catalog.conditions.quest_ids):
+            quest = catalog.get('special', quest_id)
+            if quest is not None and quest.child_skill_id in self.column:
+                self.specials.append(quest)
+        for conditions in (catalog.conditions.child_level, catalog.conditions.life_level, catalog.conditions.completions):
+            self.conditions.extend(condition for group in conditions.values() for condition in group)
+        self.conditions.extend(catalog.conditions.player_level)
+
+        # Players are assigned profiles at random in proportion to share
+        shares = np.array([profile.share for profile in profiles], dtype=np.float64)
+        self.profile_of = self.rng.choice(len(profiles), size=players, p=shares / shares.sum())
+        self.profile_members = [np.nonzero(self.profile_of == p)[0] for p in range(len(profiles))]
+        self.daily_rate = np.array([profile.daily_rate for profile in profiles])[self.profile_of]
+        self.routine_rate = np.array([profile.routine_rate for profile in profiles])[self.profile_of]
+        self.progression_weights = []
+        for profile in profiles:
+            weights = np.ones(len(self.progression))
+            if profile.focus_life_skill in self.life_skill_ids:
+                focus = self.life_skill_ids.index(profile.focus_life_skill)
+                weights[self.life_of_column[self.quest_column[self.progression]] == focus] = profile.focus_weight
+            self.progression_weights.append(weights / weights.sum() if len(weights) else weights)
+
+        self.child_curve = _Curve(np, CHILD_SKILL_CURVE)
+        self.life_curve = _Curve(np, LIFE_SKILL_CURVE)
+        self.player_curve = _Curve(np, PLAYER_CURVE)
+        self.child_exp = np.zeros((players, skills), dtype=np.int64)
+        self.child_level = np.ones((players, skills), dtype=np.int64)
+        self.child_next = np.full((players, skills), CHILD_SKILL_CURVE.threshold(2), dtype=np.int64)
+        self.life_exp = np.zeros((players, len(self.life_skill_ids)), dtype=np.int64)
+        self.life_level = np.ones((players, len(self.life_skill_ids)), dtype=np.int64)
+        self.life_next = np.full((players, len(self.life_skill_ids)), LIFE_SKILL_CURVE.threshold(2), dtype=np.int64)
+        self.player_exp = np.zeros(players, dtype=np.int64)
+        self.player_level = np.ones(players, dtype=np.int64)
+        self.player_next = np.full(players, PLAYER_CURVE.threshold(2), dtype=np.int64)
+        self.coins_collected = np.zeros(players, dtype=np.int64)
+        self.quests_completed = np.zeros(players, dtype=np.int64)
+        self.completions = np.zeros((players, skills), dtype=np.int32)
+        self.awarded = np.zeros((players, len(self.specials)), dtype=bool)
+        # Columns a completion condition looks at
+        watched = {condition.skill_id for condition in self.conditions
+                   if condition.kind == 'child_skill_completions'}
+        self.completion_columns = np.array(range(skills) if None in watched else
+                                           [self.column[skill_id] for skill_id in watched if skill_id in self.column],
+                                           dtype=np.int64)
+        # What changed today, for the conditions: lists of flat indices into
+        # the child, life and player arrays
+        self._leveled_child = self._leveled_life = self._leveled_player = self._completed_today = None
+
+    @property
+    def date(self):
+        return self.start + datetime.timedelta(days=self.day)
+
+    def coins(self):
+        skills = len(self.child_skill_ids)
+        return (CHILD_LEVEL_COINS * (self.child_level.sum(axis=1) - skills)
+                + LIFE_LEVEL_COINS * (self.life_level.sum(axis=1) - len(self.life_skill_ids))
+                + PLAYER_LEVEL_COINS * (self.player_level - 1) + self.coins_collected)
+
+    def step(self):
+        # Simulates one day
+        np = self.np
+        date = self.date
+        players, quests = self._choose(date)
+        if self.recorded is not None:
+            self.recorded.append((self.day, players, quests))
+        if self.specials:
+            self._leveled_child, self._leveled_life, self._leveled_player, self._completed_today = [], [], [], []
+        if len(players):
+            self._complete(players, quests)
+        if self.specials:
+            self._award_specials()
+        self.day += 1
+
+    def run(self, days, checkpoints=(), on_checkpoint=None):
+        # Simulates days; returns snapshot() at each checkpoint day
+        snapshots = []
+        for _ in range(days):
+            self.step()
+            if self.day in checkpoints:
+                snapshots.append(self.snapshot())
+                if on_checkpoint is not None:
+                    on_checkpoint(snapshots[-1])
+        return snapshots
+
+    def _choose(self, date):
+        # (player index, quest index) arrays of the day's completions
+        np = self.np
+        players = []
+        quests = []
+        for quest in self.daily:
+            chosen = np.nonzero(self.rng.random(self.players) < self.daily_rate)[0]
+            players.append(chosen)
+            quests.append(np.full(len(chosen), quest, dtype=np.int64))
+        for quest in self.routine:
+            # Once per period, on its first simulated day
+            period = self.quests[quest].reset_period
+            if self.day == 0 or (period == 'weekly' and date.weekday() == 0) or (period == 'monthly' and date.day == 1):
+                chosen = np.nonzero(self.rng.random(self.players) < self.routine_rate)[0]
+                players.append(chosen)
+                quests.append(np.full(len(chosen), quest, dtype=np.int64))
+        if len(self.progression):
+            for p, members in enumerate(self.profile_members):
+                counts = self.rng.poisson(self.profiles[p].progression_per_day, size=len(members))
+                total = int(counts.sum())
+                players.append(np.repeat(members, counts))
+                quests.append(self.progression[self.rng.choice(len(self.progression), size=total, p=self.progression_weights[p])])
+        if not players:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(players), np.concatenate(quests)
+
+    def _complete(self, players, quests):
+        np = self.np
+        skills = len(self.child_skill_ids)
+        columns = self.quest_column[quests]
+        exp = self.quest_exp[quests]
+        keys = players * skills + columns
+        # One pass sums both EXP and completions per player and child skill:
+        # EXP in the high bits, the count in the low COUNT_BITS. Float sums
+        # are exact while below 2**53.
+        packed = np.bincount(keys, weights=exp * float(1 << COUNT_BITS) + 1,
+                             minlength=self.players * skills).astype(np.int64)
+        gains = (packed >> COUNT_BITS).reshape(self.players, skills)
+        completed = packed & ((1 << COUNT_BITS) - 1)
+        self.child_exp += gains
+        life_skills = len(self.life_skill_ids)
+        self.life_exp += np.bincount(players * life_skills + self.life_of_column[columns], weights=exp,
+                                     minlength=self.players * life_skills).astype(np.int64).reshape(self.players, life_skills)
+        self.player_exp += np.bincount(players, weights=exp, minlength=self.players).astype(np.int64)
+        self.coins_collected += np.bincount(players, weights=self.quest_coins[quests], minlength=self.players).astype(np.int64)
+        self.quests_completed += np.bincount(players, minlength=self.players)
+        self.completions += completed.astype(np.int32).reshape(self.players, skills)
+        if len(self.completion_columns) and self._completed_today is not None:
+            self._completed_today.append(keys[np.isin(columns, self.completion_columns)])
+        self._level_up()
+
+    def _level_up(self):
+        # Recomputes levels only where EXP reached the next threshold
+        np = self.np
+        for exp, level, next_exp, curve, leveled in (
+                (self.child_exp, self.child_level, self.child_next, self.child_curve, self._leveled_child),
+                (self.life_exp, self.life_level, self.life_next, self.life_curve, self._leveled_life),
+                (self.player_exp, self.player_level, self.player_next, self.player_curve, self._leveled_player)):
+            exp, level, next_exp = exp.reshape(-1), level.reshape(-1), next_exp.reshape(-1)
+            up = np.flatnonzero(exp >= next_exp)
+            if not len(up):
+                continue
+            levels = curve.levels(exp[up])
+            level[up] = levels
+            next_exp[up] = curve.next_threshold(levels)
+            if leveled is not None:
+                leveled.append(up)
+
+    def _award_specials(self):
+        # Same end-of-day result as Database._award_special_quests: a level
+        # condition is met when the skill leveled up today and is at the
+        # threshold, a completion condition when the child skill was
+        # completed today and its count is at the threshold. Rewards can
+        # meet more conditions, so this repeats until nothing new is met.
+        np = self.np
+        index = {quest.id: k for k, quest in enumerate(self.specials)}
+        empty = np.zeros(0, dtype=np.int64)
+        while True:
+            # Indices may repeat; that only repeats a comparison
+            changed = {kind: np.concatenate(indices) if indices else empty for kind, indices in (
+                ('child_skill_level', self._leveled_child), ('life_skill_level', self._leveled_life),
+                ('player_level', self._leveled_player), ('child_skill_completions', self._completed_today))}
+            met = [[] for _ in self.specials]
+            for condition in self.conditions:
+                k = index.get(condition.quest_id)
+                if k is None:
+                    continue
+                indices = changed[condition.kind]
+                if condition.kind == 'player_level':
+                    met[k].append(indices[self.player_level[indices] >= condition.threshold])
+                    continue
+                if condition.kind == 'life_skill_level':
+                    skill_ids, value = self.life_skill_ids, self.life_level
+                else:
+                    skill_ids = self.child_skill_ids
+                    value = self.child_level if condition.kind == 'child_skill_level' else self.completions
+                if condition.skill_id is not None:
+                    if condition.skill_id not in skill_ids:
+                        continue
+                    indices = indices[indices % len(skill_ids) == skill_ids.index(condition.skill_id)]
+                met[k].append(indices[value.reshape(-1)[indices] >= condition.threshold] // len(skill_ids))
+            self._leveled_child, self._leveled_life, self._leveled_player, self._completed_today = [], [], [], []
+            awarded_any = False
+            for k, quest in enumerate(self.specials):
+                if not met[k]:
+                    continue
+                new = np.zeros(self.players, dtype=bool)
+                for players in met[k]:
+                    new[players] = True
+                players = np.flatnonzero(new & ~self.awarded[:, k])
+                if not len(players):
+                    continue
+                awarded_any = True
+                column = self.column[quest.child_skill_id]
+                self.awarded[players, k] = True
+                self.child_exp[players, column] += quest.exp_reward or 0
+                self.life_exp[players, self.life_of_column[column]] += quest.exp_reward or 0
+                self.player_exp[players] += quest.exp_reward or 0
+                self.coins_collected[players] += quest.coin_reward or 0
+                self.quests_completed[players] += 1
+                self.completions[players, column] += 1
+                self._completed_today.append(players * len(self.child_skill_ids) + column)
+            if not awarded_any:
+                return
+            self._level_up()
+
+    def _columns(self, skill_ids, skill_id):
+        if skill_id is None:
+            return list(range(len(skill_ids)))
+        return [skill_ids.index(skill_id)] if skill_id in skill_ids else []
+
+    def snapshot(self):
+        np = self.np
+        coins = self.coins()
+
+        def distribution(values):
+            return {f'p{q}': int(v) for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES, method='lower'))} | {
+                'mean': float(values.mean()), 'max': int(values.max())}
+
+        levels, counts = np.unique(self.player_level, return_counts=True)
+        return {
+            'day': self.day,
+            'date': self.date.isoformat(),
+            'player_level': distribution(self.player_level),
+            'player_level_histogram': {int(level): int(count) for level, count in zip(levels, counts)},
+            'coins': distribution(coins),
+            'quests_completed': distribution(self.quests_completed),
+            'life_skill_level_p50': {life_skill_id: int(np.percentile(self.life_level[:, i], 50, method='lower'))
+                                     for i, life_skill_id in enumerate(self.life_skill_ids)},
+            'special_quests_awarded': {quest.id: int(self.awarded[:, k].sum()) for k, quest in enumerate(self.specials)},
+            'by_profile': {
+                profile.name: {'players': len(members), 'player_level': distribution(self.player_level[members]),
+                               'coins': distribution(coins[members])}
+                for profile, members in zip(self.profiles, self.profile_members) if len(members)
+            },
+        }
+
+
+def simulation_from_db(db, players, profiles=DEFAULT_PROFILES, seed=1, start=None, record=False):
+    with db.pool.read() as conn:
+        child_skills, life_skill_ids = read_skills(conn)
+    return Simulation(db.get_catalog(), child_skills, life_skill_ids, players, profiles, seed, start, record)
+
+
+def verify(players=50, days=60, profiles=DEFAULT_PROFILES, seed=1, start=None):
+    # Runs a recorded simulation, replays every completion through
+    # Database.complete_quests on a fresh in-memory database and returns the
+    # values that differ as (player, field, simulated, database). Empty means
+    # an exact match.
+    with Database(':memory:', readers=0) as db:
+        sim = simulation_from_db(db, players, profiles, seed, start, record=True)
+        sim.run(days)
+        for index in range(players):
+            db.initialize_player_stats(db.create_player(f'sim-{index}'))
+        for day, day_players, day_quests in sim.recorded:
+            date = sim.start + datetime.timedelta(days=day)
+            items = {}
+            for player, quest in zip(day_players.tolist(), day_quests.tolist()):
+                quest = sim.quests[quest]
+                timestamp = datetime.datetime.combine(date, datetime.time(12)) + datetime.timedelta(microseconds=len(items.get(player, ())))
+                items.setdefault(player, []).append((quest.id, quest.quest_type, quest.child_skill_id, quest.exp_reward,
+                                                     quest.coin_reward, timestamp.isoformat()))
+            for player in sorted(items):
+                db.complete_quests(f'sim-{player}', items[player])
+
+        coins = sim.coins()
+        mismatches = []
+        for index in range(players):
+            name = f'sim-{index}'
+            level, exp, db_coins, quests_completed = db.get_player_level(name)
+            for field, simulated, stored in (('player_level', sim.player_level[index], level),
+                                             ('player_exp', sim.player_exp[index], exp),
+                                             ('coins', coins[index], db_coins),
+                                             ('quests_completed', sim.quests_completed[index], quests_completed)):
+                if int(simulated) != stored:
+                    mismatches.append((name, field, int(simulated), stored))
+            for child_skill_id, _, _, level, exp in db.get_child_skill_states(name):
+                column = sim.column[child_skill_id]
+                if (int(sim.child_level[index, column]), int(sim.child_exp[index, column])) != (level, exp):
+                    mismatches.append((name, f'child_skill {child_skill_id}',
+                                       (int(sim.child_level[index, column]), int(sim.child_exp[index, column])), (level, exp)))
+            for life_skill_id, _, level, exp in db.get_life_skill_states(name):
+                i = sim.life_skill_ids.index(life_skill_id)
+                if (int(sim.life_level[index, i]), int(sim.life_exp[index, i])) != (level, exp):
+                    mismatches.append((name, f'life_skill {life_skill_id}',
+                                       (int(sim.life_level[index, i]), int(sim.life_exp[index, i])), (level, exp)))
+        return mismatches
+
+
+def print_snapshot(snapshot, out=sys.stdout):
+    level = snapshot['player_level']
+    coins = snapshot['coins']
+    print(f"day {snapshot['day']:>4} ({snapshot['date']}): player level p10/p50/p90/p99/max "
+          f"{level['p10']}/{level['p50']}/{level['p90']}/{level['p99']}/{level['max']}, "
+          f"coins p10/p50/p90/p99 {coins['p10']}/{coins['p50']}/{coins['p90']}/{coins['p99']}", file=out)
+    for name, profile in snapshot['by_profile'].items():
+        print(f"    {name:<10} {profile['players']:>9} players  level p50 {profile['player_level']['p50']:>3}  "
+              f"coins p50 {profile['coins']['p50']:>8}", file=out)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate LifeRPG progression for reward tuning')
+    parser.add_argument('--db', help='take the quest catalog from this database (default: the sample catalog)')
+    parser.add_argument('--players', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--checkpoints', default='30,90,365', help='comma-separated days to report on')
+    parser.add_argument('--profiles', help='JSON file with a list of behavior profiles')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--start', help='first simulated day, YYYY-MM-DD (default today)')
+    parser.add_argument('--out', help='write the checkpoint snapshots as JSON here')
+    parser.add_argument('--verify', action='store_true',
+                        help='replay a small simulation through the Database and report any difference')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    profiles = load_profiles(args.profiles) if args.profiles else DEFAULT_PROFILES
+    start = datetime.date.fromisoformat(args.start) if args.start else None
+    if args.verify:
+        mismatches = verify(profiles=profiles, seed=args.seed, start=start)
+        for mismatch in mismatches[:20]:
+            print(*mismatch)
+        print(f"{len(mismatches)} mismatch(es) against the Database path")
+        sys.exit(1 if mismatches else 0)
+
+    checkpoints = {int(day) for day in args.checkpoints.split(',') if day and int(day) <= args.days} | {args.days}
+    with Database(args.db or ':memory:', readers=0) as db:
+        sim = simulation_from_db(db, args.players, profiles, args.seed, start)
+    started = time.perf_counter()
+    snapshots = sim.run(args.days, checkpoints, print_snapshot)
+    print(f"simulated {args.players} players for {sim.day} days in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'players': args.players, 'seed': args.seed, 'profiles': [profile._asdict() for profile in profiles],
+                       'snapshots': snapshots}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
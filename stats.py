@@ -1,7 +1,15 @@
+from functions.levels import CHILD_LEVEL_COINS, LIFE_LEVEL_COINS, PLAYER_LEVEL_COINS
+
+
 class Stats:
-    def __init__(self, player_name, db):
-        self.player_name = player_name
+    def __init__(self, player, db, state=None):
+        # player is a player id or a player name; an optional PlayerState is
+        # read for display and kept current by completions
+        self.player = player
+        self.player_name = player if isinstance(player, str) else db.get_player(player)[1]
         self.db = db
+        self.state = state
+        self.life_skills = {1: 'Agility', 2: 'Intellect', 3: 'Soul', 4: 'Strength'}
         self.child_skills = {
             1: 'Stamina', 2: 'Mobility', 3: 'Balance',
             4: 'Reading', 5: 'Focus', 6: 'Language Learning', 7: 'Critical Thinking',
@@ -10,38 +18,39 @@ class Stats:
         }
     
     def initialize_stats(self):
-        self.db.initialize_player_stats(self.player_name)
+        self.db.initialize_player_stats(self.player)
     
     def gain_exp(self, child_skill_id, exp_amount, quest_coins):
         if child_skill_id in self.child_skills:
-            child_level_diff, life_skill_level_diff, player_level_diff, total_coins = self.db.update_skill_exp(
-                self.player_name, child_skill_id, exp_amount, quest_coins)
+            gain = self.db.update_skill_exp(self.player, child_skill_id, exp_amount, quest_coins, self.state)
             
             print(f"Gained {exp_amount} EXP in {self.child_skills[child_skill_id]}!")
-            if child_level_diff > 0:
-                self.db.cursor.execute('SELECT level FROM child_skills WHERE id = ?', (child_skill_id,))
-                new_child_level = self.db.cursor.fetchone()[0]
-                print(f"{self.child_skills[child_skill_id]} leveled up to {new_child_level}! Earned {child_level_diff * 20} coins!")
-            if life_skill_level_diff > 0:
-                life_skill_name = self.db.get_player_stats(self.player_name)[child_skill_id-1][0]
-                new_life_skill_level = self.db.get_player_stats(self.player_name)[child_skill_id-1][1]
-                print(f"{life_skill_name} leveled up to {new_life_skill_level}! Earned {life_skill_level_diff * 50} coins!")
-            if player_level_diff > 0:
-                new_player_level = self.db.get_player_level(self.player_name)[0]
-                print(f"Player leveled up to {new_player_level}! Earned {player_level_diff * 100} coins!")
-            if quest_coins > 0:
-                print(f"Earned {quest_coins} coins from quest!")
+            self.announce_level_ups(gain, quest_coins)
         else:
             print("Invalid child skill ID.")
     
+    def announce_level_ups(self, gain, quest_coins):
+        if gain.child_level_diff > 0:
+            print(f"{self.child_skills[gain.child_skill_id]} leveled up to {gain.child_skill_level}! Earned {gain.child_level_diff * CHILD_LEVEL_COINS} coins!")
+        if gain.life_skill_level_diff > 0:
+            print(f"{self.life_skills[gain.life_skill_id]} leveled up to {gain.life_skill_level}! Earned {gain.life_skill_level_diff * LIFE_LEVEL_COINS} coins!")
+        if gain.player_level_diff > 0:
+            print(f"Player leveled up to {gain.player_level}! Earned {gain.player_level_diff * PLAYER_LEVEL_COINS} coins!")
+        if quest_coins > 0:
+            print(f"Earned {quest_coins} coins from quest!")
+    
     def complete_quest(self, quest_id, quest_type, child_skill_id, exp_amount, coin_reward):
-        self.db.complete_quest(self.player_name, quest_id, quest_type, child_skill_id, exp_amount, coin_reward)
+        return self.db.complete_quest(self.player, quest_id, quest_type, child_skill_id, exp_amount, coin_reward, self.state)
+    
+    def complete_quests(self, items):
+        return self.db.complete_quests(self.player, items, self.state)
     
     def display_stats(self):
-        player_level, player_exp, player_coins, quests_completed = self.db.get_player_level(self.player_name)
+        player_level, player_exp, player_coins, quests_completed = (
+            self.state.get_player_level() if self.state is not None else self.db.get_player_level(self.player))
         print(f"\nPlayer: {self.player_name} (Level {player_level}, EXP {player_exp}, Coins {player_coins}, Quests Completed {quests_completed})")
         
-        stats = self.db.get_player_stats(self.player_name)
+        stats = self.state.get_player_stats() if self.state is not None else self.db.get_player_stats(self.player)
         current_life_skill = None
         
         print("\nPlayer Stats:")
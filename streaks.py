@@ -0,0 +1,132 @@
+import datetime
+from collections import namedtuple
+
+# Streaks for challenge quests. Every completion of a challenge quest is a
+# check-in for its day: a check-in the day after the previous one extends the
+# current streak, a missed day starts it again at 1, and a second check-in on
+# the same day changes nothing. The challenge itself is completed, and its
+# reward granted, by the check-in that reaches streak_required before
+# time_limit. Earlier check-ins are kept in player_quests with completed = 0
+# and the streak reached in streak_count, and earn nothing.
+#
+# player_challenge_streaks (migration 7) holds one row per player and
+# challenge, so a check-in reads and writes one row however long the history
+# is. Streaks broken by a missed day are zeroed by the daily rollover.
+
+StreakState = namedtuple('StreakState', ['quest_id', 'current_streak', 'best_streak', 'last_day', 'completed_at'])
+
+# Rebuilds player_challenge_streaks from the challenge rows in player_quests.
+# Days are numbered per player and challenge; consecutive days share
+# julianday(day) - ROW_NUMBER(), which labels each run. The current streak
+# is the run ending on the latest day, unless that day is before :yesterday.
+BACKFILL_STREAKS_QUERY = '''
+    INSERT OR REPLACE INTO player_challenge_streaks (player_id, quest_id, current_streak, best_streak, last_day, completed_at)
+    WITH days AS (
+        SELECT p.id AS player_id, pq.quest_id, substr(pq.completion_date, 1, 10) AS day,
+               MIN(CASE WHEN pq.completed = 1 THEN pq.completion_date END) AS completed_at
+        FROM player_quests pq
+        JOIN (SELECT name, MIN(id) AS id FROM players GROUP BY name) p ON p.name = pq.player_name
+        WHERE pq.quest_type = 'challenge'
+        AND pq.completion_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+        GROUP BY p.id, pq.quest_id, day
+    ),
+    runs AS (
+        SELECT player_id, quest_id, COUNT(*) AS length, MAX(day) AS last_day, MIN(completed_at) AS completed_at
+        FROM (
+            SELECT player_id, quest_id, day, completed_at,
+                   julianday(day) - ROW_NUMBER() OVER (PARTITION BY player_id, quest_id ORDER BY day) AS run
+            FROM days
+        )
+        GROUP BY player_id, quest_id, run
+    ),
+    ranked AS (
+        SELECT player_id, quest_id, length, last_day, completed_at,
+               MAX(last_day) OVER (PARTITION BY player_id, quest_id) AS latest_day
+        FROM runs
+    )
+    SELECT player_id, quest_id,
+           MAX(CASE WHEN last_day = latest_day AND last_day >= :yesterday THEN length ELSE 0 END),
+           MAX(length), MAX(last_day), MIN(completed_at)
+    FROM ranked
+    GROUP BY player_id, quest_id
+'''
+
+
+def previous_day(day):
+    return (datetime.date.fromisoformat(day) - datetime.timedelta(days=1)).isoformat()
+
+
+def advance_streak(current, best, last_day, day):
+    # (current, best) after a check-in on day (YYYY-MM-DD), a later day than
+    # last_day
+    if last_day is not None and last_day == previous_day(day):
+        current += 1
+    else:
+        current = 1
+    return current, max(best, current)
+
+
+def streak_goal(quest):
+    # Check-ins a catalog challenge Quest needs; streak_required 0 or 1 is
+    # completed by its first check-in
+    return max(quest.streak_required or 0, 1)
+
+
+def read_streaks(conn, player_id, quest_ids=None):
+    # {quest_id: StreakState} for one player, limited to quest_ids if given
+    if quest_ids is None:
+        rows = conn.execute('''
+            SELECT quest_id, current_streak, best_streak, last_day, completed_at
+            FROM player_challenge_streaks WHERE player_id = ?
+        ''', (player_id,))
+    else:
+        quest_ids = sorted(quest_ids)
+        rows = conn.execute(f'''
+            SELECT quest_id, current_streak, best_streak, last_day, completed_at
+            FROM player_challenge_streaks WHERE player_id = ? AND quest_id IN ({', '.join('?' * len(quest_ids))})
+        ''', (player_id, *quest_ids))
+    return {row[0]: StreakState(*row) for row in rows}
+
+
+def record_check_ins(cursor, player_id, catalog, check_ins):
+    # Applies (quest_id, completion_date) check-ins in order without
+    # committing; returns (streak_count, completed) per check-in, or None for
+    # one that changes nothing (a repeat on the same day). completed is true
+    # for the check-in that completes its challenge.
+    streaks = read_streaks(cursor, player_id, {quest_id for quest_id, _ in check_ins})
+    results = []
+    for quest_id, completion_date in check_ins:
+        quest = catalog.get('challenge', quest_id)
+        if quest is None:
+            raise ValueError(f"Unknown challenge quest id: {quest_id}")
+        streak = streaks.get(quest_id) or StreakState(quest_id, 0, 0, None, None)
+        if streak.last_day is not None and completion_date[:10] <= streak.last_day:
+            results.append(None)
+            continue
+        current, best = advance_streak(streak.current_streak, streak.best_streak, streak.last_day, completion_date[:10])
+        completed = (streak.completed_at is None and current >= streak_goal(quest)
+                     and (quest.time_limit is None or completion_date < quest.time_limit))
+        streaks[quest_id] = streak._replace(current_streak=current, best_streak=best,
+                                            last_day=completion_date[:10],
+                                            completed_at=completion_date if completed else streak.completed_at)
+        results.append((current, completed))
+    cursor.executemany('''
+        INSERT OR REPLACE INTO player_challenge_streaks (player_id, quest_id, current_streak, best_streak, last_day, completed_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(player_id, *streak) for streak in streaks.values()])
+    return results
+
+
+def expire_streaks(cursor, today, first_id, last_id):
+    # Zeroes current streaks with no check-in yesterday or today for players
+    # first_id..last_id; returns how many were broken
+    return cursor.execute('''
+        UPDATE player_challenge_streaks SET current_streak = 0
+        WHERE player_id BETWEEN ? AND ? AND current_streak > 0 AND last_day < ?
+    ''', (first_id, last_id, previous_day(today[:10]))).rowcount
+
+
+def backfill_streaks(cursor, today):
+    # Rebuilds every streak from history with BACKFILL_STREAKS_QUERY
+    cursor.execute('DELETE FROM player_challenge_streaks')
+    return cursor.execute(BACKFILL_STREAKS_QUERY, {'yesterday': previous_day(today[:10])}).rowcount
@@ -0,0 +1,35 @@
+import sqlite3
+
+from functions.database import Database
+from functions.leaderboard import Leaderboard, PLAYER_BOARD
+
+
+def test_boards_reload_after_outside_commits_and_rebuilds(tmp_path):
+    path = str(tmp_path / 'leaderboard.db')
+    db = Database(path)
+    try:
+        for name in ('ana', 'ben'):
+            db.initialize_player_stats(db.create_player(name))
+        leaderboard = Leaderboard(db)
+        db.complete_quest('ana', 1, 'progression', 1, 40, 0)
+        assert leaderboard.rank(PLAYER_BOARD, 'ana') == (1, 40)
+
+        # A commit from another connection, missed by progress_listeners
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute("UPDATE player_child_skills SET exp = 500 WHERE child_skill_id = 1 "
+                         "AND player_id = (SELECT id FROM players WHERE name = 'ben')")
+            conn.execute("UPDATE players SET exp = 500 WHERE name = 'ben'")
+        conn.close()
+        assert [entry[2:] for entry in leaderboard.top(PLAYER_BOARD)] == [('ben', 500), ('ana', 40)]
+
+        # Child skill EXP changed through this Database's own connection, so
+        # data_version stays put; rebuild_aggregates carries it to players.exp
+        with db.pool.write() as conn:
+            conn.execute("UPDATE player_child_skills SET exp = 30 WHERE child_skill_id = 1 "
+                         "AND player_id = (SELECT id FROM players WHERE name = 'ben')")
+        db.rebuild_aggregates()
+        assert leaderboard.rank(PLAYER_BOARD, 'ben') == (2, 30)
+        leaderboard.close()
+    finally:
+        db.close()
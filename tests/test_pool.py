@@ -0,0 +1,38 @@
+import sqlite3
+import threading
+
+from functions.database import Database
+
+
+def test_write_blocks_commits_between_its_reads_and_writes(tmp_path):
+    # Another connection adds 1000 EXP while complete_quest has read the
+    # player but not yet written; the write lock taken at the start of the
+    # transaction makes it wait instead of being overwritten
+    path = str(tmp_path / 'pool.db')
+    db = Database(path)
+    db.initialize_player_stats(db.create_player('sam'))
+    read_skill_exp_rows = db._read_skill_exp_rows
+    other = threading.Thread(target=add_exp, args=(path, 1000))
+
+    def read_then_let_other_commit(*args):
+        rows = read_skill_exp_rows(*args)
+        other.start()
+        other.join(0.5)
+        return rows
+
+    db._read_skill_exp_rows = read_then_let_other_commit
+    try:
+        db.complete_quest('sam', 1, 'progression', 1, 40, 0)
+        other.join()
+        assert db.get_player_level('sam')[1] == 1040
+    finally:
+        db.close()
+
+
+def add_exp(path, exp):
+    conn = sqlite3.connect(path, timeout=10)
+    try:
+        with conn:
+            conn.execute('UPDATE players SET exp = exp + ? WHERE name = ?', (exp, 'sam'))
+    finally:
+        conn.close()
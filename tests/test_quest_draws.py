@@ -0,0 +1,34 @@
+from functions.database import Database
+from functions.quest_draws import DRAWS_PER_DAY
+
+
+def test_assigning_twice_in_a_day_keeps_the_first_draw(tmp_path):
+    # Progression EXP on Discipline (8) between the two assigns moves every
+    # player's weakest rng skill to Reflection (10); the second assign and a
+    # rerun rollover must not draw again for it
+    db = Database(str(tmp_path / 'draws.db'))
+    try:
+        names = [f'player{i}' for i in range(40)]
+        for name in names:
+            db.initialize_player_stats(db.create_player(name))
+            db.assign_daily_quests(name)
+        first = {name: open_rng_quests(db, name) for name in names}
+        for name in names:
+            db.complete_quest(name, 1, 'progression', 8, 500, 0)
+            db.assign_daily_quests(name)
+        assert db.rollover_daily_quests()['rng_assigned'] == 0
+        for name in names:
+            assert open_rng_quests(db, name) == first[name]
+            assert len(first[name]) <= DRAWS_PER_DAY
+            assert [quest.id for quest in db.draw_rng_quests(name)] == first[name]
+    finally:
+        db.close()
+
+
+def open_rng_quests(db, name):
+    with db.pool.read() as conn:
+        return [quest_id for quest_id, in conn.execute('''
+            SELECT quest_id FROM player_quests
+            WHERE player_name = ? AND quest_type = 'rng' AND completed = 0
+            ORDER BY rowid
+        ''', (name,))]
@@ -0,0 +1,15 @@
+import pytest
+
+from functions.simulator import DEFAULT_PROFILES, verify
+
+# The vectorized simulator must match Database.complete_quests exactly; a
+# few small seeded runs replay every completion through the Database path
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_verify_matches_database(seed):
+    assert verify(players=20, days=30, profiles=DEFAULT_PROFILES, seed=seed) == []
+
+
+def test_verify_matches_database_over_a_long_run():
+    assert verify(players=5, days=200, seed=7) == []
@@ -0,0 +1,308 @@
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+from functions.database import Database
+
+# Streaming export and import of player progress, and an online backup of the
+# whole database.
+#
+# An export is a stream of records, one per line, each naming its player:
+#   player       the players row
+#   life_skill   one player_life_skills row
+#   child_skill  one player_child_skills row
+#   streak       one player_challenge_streaks row
+#   completions  one player_skill_completions row (special quest conditions)
+#   quest        one player_quests row, live or archived
+# A player's record always comes before its skills and quests. As JSONL every
+# line is an object with a "kind" key; as CSV every row is the kind followed
+# by the RECORD_FIELDS values in order.
+#
+# Run from the project root:
+#   python -m functions.transfer export --db liferpg.db --player alice --out alice.jsonl
+#   python -m functions.transfer import --db other.db --in alice.jsonl
+#   python -m functions.transfer backup --db liferpg.db --out snapshot.db
+
+RECORD_FIELDS = {
+    'player': ('player', 'status', 'level', 'exp', 'coins', 'quests_completed'),
+    'life_skill': ('player', 'life_skill_id', 'level', 'exp'),
+    'child_skill': ('player', 'child_skill_id', 'level', 'exp'),
+    'streak': ('player', 'quest_id', 'current_streak', 'best_streak', 'last_day', 'completed_at'),
+    'completions': ('player', 'child_skill_id', 'completions'),
+    'quest': ('player', 'quest_id', 'quest_type', 'completed', 'completion_date', 'streak_count'),
+}
+FORMATS = ('jsonl', 'csv')
+
+
+def player_records(conn, player_id, player_name):
+    # Generator over one player's records. Cursors are iterated, not
+    # fetched, so memory stays flat however long the history is.
+    row = conn.execute('SELECT status, level, exp, coins, quests_completed FROM players WHERE id = ?', (player_id,)).fetchone()
+    yield 'player', (player_name, *row)
+    for row in conn.execute('SELECT life_skill_id, level, exp FROM player_life_skills WHERE player_id = ? ORDER BY life_skill_id', (player_id,)):
+        yield 'life_skill', (player_name, *row)
+    for row in conn.execute('SELECT child_skill_id, level, exp FROM player_child_skills WHERE player_id = ? ORDER BY child_skill_id', (player_id,)):
+        yield 'child_skill', (player_name, *row)
+    for row in conn.execute('''
+        SELECT quest_id, current_streak, best_streak, last_day, completed_at FROM player_challenge_streaks
+        WHERE player_id = ? ORDER BY quest_id
+    ''', (player_id,)):
+        yield 'streak', (player_name, *row)
+    for row in conn.execute('''
+        SELECT child_skill_id, completions FROM player_skill_completions WHERE player_id = ? ORDER BY child_skill_id
+    ''', (player_id,)):
+        yield 'completions', (player_name, *row)
+    tables = ['player_quests'] + [row[0] for row in conn.execute('SELECT table_name FROM player_quest_archives ORDER BY month')]
+    for table in tables:
+        for row in conn.execute(f'''
+            SELECT quest_id, quest_type, completed, completion_date, streak_count FROM {table}
+            WHERE player_name = ?
+        ''', (player_name,)):
+            yield 'quest', (player_name, *row)
+
+
+def export_records(db, players=None):
+    # Records for the given players (ids or names), or for every player
+    resolved = None if players is None else [db.resolve_player(player) for player in players]
+    with db.pool.snapshot() as conn:
+        if resolved is None:
+            resolved = conn.execute('SELECT id, name FROM players ORDER BY id')
+        for player_id, player_name in resolved:
+            yield from player_records(conn, player_id, player_name)
+
+
+def write_records(records, out, fmt='jsonl', batch_size=1000):
+    # Writes records to a text file object in batches of lines; returns how
+    # many were written
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        count = 0
+        batch = []
+        for kind, values in records:
+            batch.append((kind, *values))
+            if len(batch) >= batch_size:
+                writer.writerows(batch)
+                count += len(batch)
+                batch.clear()
+        writer.writerows(batch)
+        return count + len(batch)
+
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    keys = {kind: fields + ('kind',) for kind, fields in RECORD_FIELDS.items()}
+    count = 0
+    batch = []
+    for kind, values in records:
+        batch.append(encode(dict(zip(keys[kind], (*values, kind)))) + '\n')
+        if len(batch) >= batch_size:
+            out.writelines(batch)
+            count += len(batch)
+            batch.clear()
+    out.writelines(batch)
+    return count + len(batch)
+
+
+def read_records(lines, fmt='jsonl'):
+    # Generator over (kind, values) from an iterable of lines
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    if fmt == 'csv':
+        for row in csv.reader(lines):
+            if not row:
+                continue
+            kind = row[0]
+            if kind not in RECORD_FIELDS:
+                raise ValueError(f"Unknown record kind: {kind}")
+            yield kind, tuple(_csv_value(field, value) for field, value in zip(RECORD_FIELDS[kind], row[1:]))
+    else:
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.get('kind')
+            if kind not in RECORD_FIELDS:
+                raise ValueError(f"Unknown record kind: {kind}")
+            yield kind, tuple(record.get(field) for field in RECORD_FIELDS[kind])
+
+
+def _csv_value(field, value):
+    # CSV has no types: ids and counters back to int, empty to None
+    if value == '':
+        return None
+    if field in ('player', 'status', 'quest_type', 'completion_date', 'last_day', 'completed_at'):
+        return value
+    return int(value)
+
+
+def export_player(db, player, out, fmt='jsonl'):
+    return write_records(export_records(db, [player]), out, fmt)
+
+
+def export_players(db, out, fmt='jsonl'):
+    return write_records(export_records(db), out, fmt)
+
+
+def import_records(db, records, chunk_size=10000, limit=None):
+    # Creates each exported player in db and loads its skills and history.
+    # The player row and skills go in with the first chunk of quests; the
+    # rest of the history follows in transactions of chunk_size rows, so a
+    # long import never holds the writer for long. Returns the number of
+    # players imported. A player whose name already exists is rejected, as
+    # is a stream holding more than limit players.
+    imported = 0
+    player_id = None
+    player_name = None
+    pending = []
+
+    def flush():
+        with db.pool.write() as conn:
+            for kind, rows in _group(pending):
+                if kind == 'life_skill':
+                    conn.executemany('''
+                        INSERT OR REPLACE INTO player_life_skills (player_id, life_skill_id, level, exp) VALUES (?, ?, ?, ?)
+                    ''', [(player_id, *row[1:]) for row in rows])
+                elif kind == 'child_skill':
+                    conn.executemany('''
+                        INSERT OR REPLACE INTO player_child_skills (player_id, child_skill_id, level, exp) VALUES (?, ?, ?, ?)
+                    ''', [(player_id, *row[1:]) for row in rows])
+                elif kind == 'streak':
+                    conn.executemany('''
+                        INSERT OR REPLACE INTO player_challenge_streaks (player_id, quest_id, current_streak, best_streak, last_day, completed_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', [(player_id, *row[1:]) for row in rows])
+                elif kind == 'completions':
+                    conn.executemany('''
+                        INSERT OR REPLACE INTO player_skill_completions (player_id, child_skill_id, completions) VALUES (?, ?, ?)
+                    ''', [(player_id, *row[1:]) for row in rows])
+                else:
+                    conn.executemany('''
+                        INSERT OR REPLACE INTO player_quests (player_name, quest_id, quest_type, completed, completion_date, streak_count)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', rows)
+        pending.clear()
+
+    for kind, values in records:
+        if kind == 'player':
+            if pending:
+                flush()
+            if limit is not None and imported >= limit:
+                raise ValueError(f"Expected at most {limit} player(s), found another: {values[0]}")
+            player_name = values[0]
+            if db.get_player(player_name) is not None:
+                raise ValueError(f"Player already exists: {player_name}")
+            with db.pool.write() as conn:
+                player_id = conn.execute('''
+                    INSERT INTO players (name, status, level, exp, coins, quests_completed) VALUES (?, ?, ?, ?, ?, ?)
+                ''', values).lastrowid
+                db.initialize_player_stats(player_id)
+            imported += 1
+            continue
+        if player_name is None or values[0] != player_name:
+            raise ValueError(f"{kind} record for {values[0]} does not follow its player record")
+        pending.append((kind, values))
+        if len(pending) >= chunk_size:
+            flush()
+    if pending:
+        flush()
+    return imported
+
+
+def _group(pending):
+    # Consecutive runs of one record kind, as (kind, [values, ...])
+    run_kind = None
+    run = []
+    for kind, values in pending:
+        if kind != run_kind and run:
+            yield run_kind, run
+            run = []
+        run_kind = kind
+        run.append(values)
+    if run:
+        yield run_kind, run
+
+
+def import_player(db, lines, fmt='jsonl', chunk_size=10000):
+    return import_records(db, read_records(lines, fmt), chunk_size, limit=1)
+
+
+def import_players(db, lines, fmt='jsonl', chunk_size=10000):
+    return import_records(db, read_records(lines, fmt), chunk_size)
+
+
+def backup(db, target_path, pages=256, sleep=0.005, progress=None):
+    # Online copy of the whole database to target_path, pages at a time with
+    # a pause in between. The source connection holds one read transaction
+    # for the whole copy: the backup is the state at its start, writers keep
+    # committing meanwhile, and their commits do not restart it.
+    target = sqlite3.connect(target_path)
+    try:
+        if db.pool.in_memory:
+            # In-memory databases are only reachable through the writer
+            with db.pool.write(transaction=False) as conn:
+                conn.backup(target, pages=pages, progress=progress, sleep=sleep)
+            return
+        source = sqlite3.connect(db.pool.db_name, uri=db.pool.db_name.startswith('file:'))
+        try:
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+            source.rollback()
+        finally:
+            source.close()
+    finally:
+        target.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Export, import and back up LifeRPG data')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='stream player progress to JSONL or CSV')
+    export.add_argument('--db', default='liferpg.db')
+    export.add_argument('--player', action='append', help='player name or id (repeatable); all players if omitted')
+    export.add_argument('--format', choices=FORMATS, default='jsonl')
+    export.add_argument('--out', help='output file (default stdout)')
+    load = commands.add_parser('import', help='load players from an export')
+    load.add_argument('--db', default='liferpg.db')
+    load.add_argument('--format', choices=FORMATS, default='jsonl')
+    load.add_argument('--in', dest='path', help='input file (default stdin)')
+    load.add_argument('--chunk-size', type=int, default=10000, help='rows per import transaction')
+    copy = commands.add_parser('backup', help='online backup of the whole database')
+    copy.add_argument('--db', default='liferpg.db')
+    copy.add_argument('--out', required=True)
+    copy.add_argument('--pages', type=int, default=256, help='pages copied per step')
+    copy.add_argument('--sleep', type=float, default=0.005, help='seconds between steps')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with Database(args.db) as db:
+        if args.command == 'export':
+            players = [int(player) if player.isdigit() else player for player in args.player] if args.player else None
+            out = open(args.out, 'w', newline='') if args.out else sys.stdout
+            try:
+                count = write_records(export_records(db, players), out, args.format)
+            finally:
+                if args.out:
+                    out.close()
+            print(f"{count} record(s) exported", file=sys.stderr)
+        elif args.command == 'import':
+            lines = open(args.path, newline='') if args.path else sys.stdin
+            try:
+                count = import_players(db, lines, args.format, args.chunk_size)
+            finally:
+                if args.path:
+                    lines.close()
+            print(f"{count} player(s) imported", file=sys.stderr)
+        else:
+            started = time.perf_counter()
+            backup(db, args.out, args.pages, args.sleep,
+                   lambda status, remaining, total: print(f"\r{total - remaining}/{total} pages", end='', file=sys.stderr))
+            print(f"\nbacked up to {args.out} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
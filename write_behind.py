@@ -0,0 +1,163 @@
+import datetime
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Group commit for completions. Calls are queued and a background writer
+# applies them in one transaction per flush, flushing when max_batch calls
+# are queued or max_delay seconds after the first one, so one commit (and
+# one fsync) is shared by every call in the flush. Each call runs in its own
+# savepoint: a call that raises fails alone and the rest of the flush
+# commits.
+#
+# Durability is chosen per call. wait=True returns once the flush holding
+# the call has committed; wait=False returns a Future right away. The
+# writer connection runs with synchronous = FULL while the queue is open,
+# so a commit that has been waited for survives a crash or power loss and
+# recovery on restart is SQLite's own. Calls still queued when the process
+# dies are lost, which is what wait=False accepts; close() flushes them.
+#
+# The Database caches and listeners (PlayerState, Leaderboard) are updated
+# once the flush holding a call has committed, a few milliseconds after it
+# was queued.
+
+DEFAULT_MAX_BATCH = 500
+DEFAULT_MAX_DELAY = 0.005
+DEFAULT_MAX_PENDING = 10000
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    def __init__(self, db, max_batch=DEFAULT_MAX_BATCH, max_delay=DEFAULT_MAX_DELAY, max_pending=DEFAULT_MAX_PENDING,
+                 synchronous='FULL'):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.synchronous = synchronous
+        # Callers block once max_pending calls are waiting to be applied
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        # Held from the closed check until the call is queued, so nothing
+        # lands behind _STOP; the writer never takes it
+        self._submit_lock = threading.Lock()
+        self._last_stamp = None
+        self._closed = False
+        self._previous_synchronous = None
+        self.stats = {'submitted': 0, 'committed': 0, 'failed': 0, 'flushes': 0}
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+
+    def start(self):
+        with self.db.pool.write(transaction=False) as conn:
+            self._previous_synchronous = conn.execute('PRAGMA synchronous').fetchone()[0]
+            conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        self._thread.start()
+        return self
+
+    def close(self):
+        # Applies everything queued, then stops the writer
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+        with self.db.pool.write(transaction=False) as conn:
+            conn.execute(f'PRAGMA synchronous = {self._previous_synchronous}')
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, method, *args, wait=True):
+        # Queues method(*args), a mutating Database method; returns its result
+        # once committed, or a Future of it when wait is false
+        future = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("Write-behind queue is closed")
+            with self._lock:
+                self.stats['submitted'] += 1
+            self._queue.put((method, args, future))
+        return future.result() if wait else future
+
+    def flush(self):
+        # Returns once every call queued so far has been committed
+        self.submit(None)
+
+    def complete_quests(self, player, items, wait=True):
+        # Database.complete_quests through the queue. Items without a
+        # completion_date are stamped now, so they keep the time they were
+        # queued at.
+        items = [tuple(item) if len(item) > 5 else tuple(item) + (self._stamp(),) for item in items]
+        return self.submit(self.db.complete_quests, player, items, wait=wait)
+
+    def complete_quest(self, player, quest_id, quest_type, child_skill_id, exp_reward, coin_reward, wait=True):
+        # The SkillExpGain, or with wait false a Future of a one-item list
+        result = self.complete_quests(player, [(quest_id, quest_type, child_skill_id, exp_reward, coin_reward)], wait)
+        return result[0] if wait else result
+
+    def update_skill_exp(self, player, child_skill_id, exp_gained, quest_coins, wait=True):
+        return self.submit(self.db.update_skill_exp, player, child_skill_id, exp_gained, quest_coins, wait=wait)
+
+    def _stamp(self):
+        # Strictly increasing timestamps, so two completions queued in the
+        # same microsecond keep distinct player_quests keys
+        with self._lock:
+            now = datetime.datetime.now()
+            if self._last_stamp is not None and now <= self._last_stamp:
+                now = self._last_stamp + datetime.timedelta(microseconds=1)
+            self._last_stamp = now
+        return now.isoformat()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is _STOP:
+                return
+            batch = [entry]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    entry = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        results = []
+        try:
+            with self.db.pool.write():
+                for method, args, future in batch:
+                    if method is None:
+                        results.append((future, None, None))
+                        continue
+                    try:
+                        with self.db.pool.savepoint():
+                            results.append((future, method(*args), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            # The commit itself failed; nothing in the flush was applied
+            with self._lock:
+                self.stats['failed'] += len(batch)
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self.stats['flushes'] += 1
+            self.stats['committed'] += sum(error is None for _, _, error in results)
+            self.stats['failed'] += sum(error is not None for _, _, error in results)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)